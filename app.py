@@ -11,7 +11,7 @@ from utils import (
     QUERY_SUGGESTIONS,
     WARNING_MESSAGE,
     generate_response,
-    initialize_clients,
+    initialize_backend,
     load_config,
 )
 
@@ -24,9 +24,11 @@ st.set_page_config(page_title="LegaBot", page_icon=LOGO_URL)
 st.title("LegaBot")
 st.divider()
 
-# Initialize API clients for OpenAI and Qdrant and load configuration settings.
-qdrant_client = initialize_clients()
+# Load configuration settings and initialize the retrieval backend.
 config = load_config()
+retrieval_backend = initialize_backend(
+    backend=config.retrieval.backend, path=config.retrieval.path
+)
 
 # Determine the theme and set the appropriate logo
 theme_data = st_theme()
@@ -78,7 +80,7 @@ with tab_general:
             # Generate a response using the LLM and display it as a stream.
             stream = generate_response(
                 query=prompt,
-                qdrant_client=qdrant_client,
+                retrieval_backend=retrieval_backend,
                 config=config,
             )
             # Write the response stream to the chat.
@@ -0,0 +1,90 @@
+"""
+Compare search latency of the Qdrant backend with the in-process NumPy backend.
+
+Both backends are filled with the same random vectors. Queries go through
+`search_collections`, as in `determine_context`. By default Qdrant runs in local
+in-memory mode. Pass `--url` (and `--api_key`) to measure a Qdrant server, which
+includes the network round-trip the in-process index avoids.
+
+Usage:
+```
+python -m benchmarks.backend_benchmark --collections 2 --points 3000 --repeats 200
+```
+"""
+
+import argparse
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from database.backends import NumpyBackend, QdrantBackend, RetrievalBackend
+
+
+def measure(
+    backend: RetrievalBackend, collections: List[str], queries: np.ndarray
+) -> Dict[str, float]:
+    latencies = []
+    for query_vector in queries:
+        start_time = time.perf_counter()
+        backend.search_collections(
+            collections=collections, query_vector=query_vector.tolist(), limit=10
+        )
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    return {
+        "p50": float(np.percentile(latencies, 50)),
+        "p99": float(np.percentile(latencies, 99)),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(seed=0)
+    collections = [f"benchmark_collection_{i}" for i in range(args.collections)]
+    payload = {"title": "Član 1", "link": "https://www.paragraf.rs", "text": "x" * 2000}
+
+    with tempfile.TemporaryDirectory() as index_dir:
+        backends = {
+            "qdrant": (
+                QdrantBackend(client=QdrantClient(url=args.url, api_key=args.api_key))
+                if args.url
+                else QdrantBackend(client=QdrantClient(":memory:"), local=True)
+            ),
+            "numpy": NumpyBackend(path=index_dir),
+        }
+        for collection in collections:
+            vectors = rng.standard_normal((args.points, args.dimensions), np.float32)
+            points = [
+                PointStruct(id=i, vector=vector.tolist(), payload=payload)
+                for i, vector in enumerate(vectors)
+            ]
+            for backend in backends.values():
+                backend.create_collection(name=collection, vector_size=args.dimensions)
+                for i in range(0, len(points), 256):
+                    backend.upsert(collection=collection, points=points[i : i + 256])
+
+        queries = rng.standard_normal((args.repeats, args.dimensions), np.float32)
+        for name, backend in backends.items():
+            # Warm up caches and memory maps before measuring
+            measure(backend, collections, queries[:5])
+            stats = measure(backend, collections, queries)
+            logger.info(
+                f"{name:>6}: p50={stats['p50']:.2f} ms, p99={stats['p99']:.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark search latency of the retrieval backends."
+    )
+    parser.add_argument("--url", type=str, default=None, help="Qdrant server URL.")
+    parser.add_argument("--api_key", type=str, default=None, help="Qdrant API key.")
+    parser.add_argument("--collections", type=int, default=2)
+    parser.add_argument("--points", type=int, default=3000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--repeats", type=int, default=200)
+
+    main(args=parser.parse_args())
@@ -0,0 +1,115 @@
+"""
+Compare the size and load time of the JSON lines and the binary embedding formats.
+
+Random embeddings are written as request processor results and converted into the
+per-article JSON lines format (`split_embedding_results`) and into float32 and
+float16 `.npy` files with a JSON lines sidecar (`write_embedding_arrays`). For each
+format, the file size is measured, as well as the time to read only the vectors and
+the time of `load_and_process_embeddings`, which also builds the points for upsert.
+
+Usage:
+```
+python -m benchmarks.embedding_format_benchmark --articles 5000 --dimensions 1536
+```
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from loguru import logger
+
+from database.utils import (
+    load_and_process_embeddings,
+    metadata_path,
+    split_embedding_results,
+    write_embedding_arrays,
+)
+
+
+def write_results(path: Path, articles: int, dimensions: int, batch_size: int) -> None:
+    """Write random results in the format of multi-input embedding requests."""
+    rng = np.random.default_rng(seed=0)
+    with open(path, "w", encoding="utf-8") as file:
+        for start in range(0, articles, batch_size):
+            ids = range(start, min(start + batch_size, articles))
+            texts = [f"Član {id}: " + "tekst " * 300 for id in ids]
+            request = {"model": "m", "input": texts}
+            vectors = rng.standard_normal((len(ids), dimensions), np.float32)
+            response = {
+                "data": [
+                    {"index": index, "embedding": vector.tolist()}
+                    for index, vector in enumerate(vectors)
+                ]
+            }
+            metadata = {
+                "articles": [
+                    {"id": id, "title": f"Član {id}", "link": f"clan_{id}"}
+                    for id in ids
+                ]
+            }
+            file.write(json.dumps([request, response, metadata]) + "\n")
+
+
+def timed(function: Callable) -> float:
+    start_time = time.perf_counter()
+    function()
+    return time.perf_counter() - start_time
+
+
+def read_jsonl_vectors(path: Path) -> np.ndarray:
+    with open(path, "r", encoding="utf-8") as file:
+        return np.array(
+            [json.loads(line)[1]["data"][0]["embedding"] for line in file],
+            dtype=np.float32,
+        )
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = Path(temp_dir)
+        results_path = temp_dir / "results.jsonl"
+        write_results(results_path, args.articles, args.dimensions, args.batch_size)
+
+        jsonl_path = temp_dir / "embeddings.jsonl"
+        split_embedding_results(results_path=results_path, output_path=jsonl_path)
+        paths = {"jsonl": jsonl_path}
+        for dtype in ["float32", "float16"]:
+            paths[dtype] = temp_dir / f"embeddings_{dtype}.npy"
+            write_embedding_arrays(
+                results_path=results_path, output_path=paths[dtype], dtype=dtype
+            )
+
+        for name, path in paths.items():
+            size = path.stat().st_size
+            if path.suffix == ".npy":
+                size += metadata_path(path).stat().st_size
+                read_vectors = lambda: np.array(np.load(path, mmap_mode="r"))
+            else:
+                read_vectors = lambda: read_jsonl_vectors(path)
+            vectors_seconds = min(timed(read_vectors) for _ in range(args.repeats))
+            points_seconds = min(
+                timed(lambda: load_and_process_embeddings(path))
+                for _ in range(args.repeats)
+            )
+            logger.info(
+                f"{name:>7}: {size / 2**20:8.1f} MiB, "
+                f"vectors {vectors_seconds * 1000:8.1f} ms, "
+                f"points {points_seconds * 1000:8.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark size and load time of the embedding formats."
+    )
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=3)
+
+    main(args=parser.parse_args())
@@ -0,0 +1,114 @@
+"""
+Compare conversation prompt tokens before and after the history manager.
+
+A synthetic conversation is replayed turn by turn. For every user turn the benchmark
+counts the tokens of the conversation part of the chat prompt, once in the old format
+(the `repr` of the whole message list) and once rendered by `ConversationHistory`.
+
+By default the summaries are simulated offline by keeping the last `--summary_words`
+words of the folded text, which bounds the summary like a real one would. Pass
+`--summarizer openai` to fold the turns with the configured summary model instead.
+
+Usage:
+```
+python -m benchmarks.history_benchmark --turns 100
+```
+"""
+
+import argparse
+import random
+from typing import Dict, List
+
+from loguru import logger
+
+from database.tokenizer import get_encoding, num_tokens_from_string
+from llm.history import ConversationHistory
+from llm.prompts import CONVERSATION_PROMPT
+
+WORDS = (
+    "zaposleni poslodavac ugovor rad odmor godisnji bolovanje zarada otkaz porez "
+    "prihod dohodak potrosac reklamacija proizvod podaci licnost brak alimentacija "
+    "dete roditelj clan zakon pravo obaveza rok dana meseci"
+).split()
+
+
+def synthetic_conversation(num_turns: int, seed: int = 0) -> List[Dict]:
+    """User questions of ~25 words and assistant answers of ~250 words."""
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(num_turns):
+        messages.append(
+            {"role": "user", "content": " ".join(rng.choices(WORDS, k=25)) + "?"}
+        )
+        messages.append(
+            {"role": "assistant", "content": " ".join(rng.choices(WORDS, k=250))}
+        )
+    return messages
+
+
+def main(args: argparse.Namespace) -> None:
+    def count_tokens(text: str) -> int:
+        return num_tokens_from_string(text, model=args.model)
+
+    if args.summarizer == "openai":
+        from utils import load_config, summarize_conversation
+
+        config = load_config()
+
+        def summarize(summary: str, turns: str) -> str:
+            return summarize_conversation(
+                summary=summary, conversation=turns, config=config
+            )
+
+    else:
+
+        def summarize(summary: str, turns: str) -> str:
+            return " ".join(f"{summary} {turns}".split()[-args.summary_words :])
+
+    messages = synthetic_conversation(args.turns)
+    history = ConversationHistory()
+    num_summaries = 0
+    baseline_total, managed_total = 0, 0
+
+    def counting_summarize(summary: str, turns: str) -> str:
+        nonlocal num_summaries
+        num_summaries += 1
+        return summarize(summary, turns)
+
+    for end in range(1, len(messages), 2):
+        # Conversation before the current user question, as sent with the question
+        conversation = messages[:end]
+        baseline = count_tokens(CONVERSATION_PROMPT.format(conversation=conversation))
+        managed = count_tokens(
+            CONVERSATION_PROMPT.format(
+                conversation=history.render(
+                    messages=conversation,
+                    token_budget=args.max_tokens,
+                    count_tokens=count_tokens,
+                    summarize=counting_summarize,
+                )
+            )
+        )
+        baseline_total += baseline
+        managed_total += managed
+
+    logger.info(f"Tokenizer: {get_encoding(args.model).name}")
+    logger.info(f"Turns: {args.turns}, summarizer calls: {num_summaries}")
+    logger.info(f"Last turn tokens - baseline: {baseline}, managed: {managed}")
+    logger.info(
+        f"Total tokens - baseline: {baseline_total}, managed: {managed_total} "
+        f"({100 * (1 - managed_total / baseline_total):.1f}% reduction)"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark prompt tokens of the conversation history."
+    )
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--max_tokens", type=int, default=2000)
+    parser.add_argument("--model", type=str, default="gpt-4o")
+    parser.add_argument("--summary_words", type=int, default=200)
+    parser.add_argument("--summarizer", choices=["offline", "openai"], default="offline")
+
+    main(args=parser.parse_args())
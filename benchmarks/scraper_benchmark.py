@@ -0,0 +1,123 @@
+"""
+Compare the time and memory of the BeautifulSoup and the streaming lxml scraper.
+
+Every parser scrapes the pages in a fresh process, so the peak resident memory of
+one parser is not hidden by the other. The pages are saved HTML files given with
+`--html`, or by default the test fixture with its articles repeated until the page
+has `--articles` article headings. The peak memory is reported above the memory the
+process had before parsing, with the page already read.
+
+Usage:
+```
+python -m benchmarks.scraper_benchmark --articles 20000
+python -m benchmarks.scraper_benchmark --html laws/zakon_o_radu.html
+```
+"""
+
+import argparse
+import json
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from scraper.scraper import run_scraper, run_scraper_lxml
+
+FIXTURE_PATH = Path(__file__).parent.parent / "tests" / "fixtures" / "law_page.html"
+URL = "https://www.paragraf.rs/propisi/zakon.html"
+
+
+def write_page(path: Path, articles: int) -> None:
+    """Write the fixture page with its `Section1` repeated to `articles` headings."""
+    html = FIXTURE_PATH.read_text(encoding="utf-8")
+    start = html.index('<div class="Section1">')
+    end = html.index("</div>", start) + len("</div>")
+    section = html[start:end]
+    per_section = len(re.findall(r'<p class="clan', section))
+    copies = max(1, -(-articles // per_section))
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(html[:start] + section * copies + html[end:])
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def scrape(path: Path, parser: str) -> Dict:
+    """Scrape one page in this process, as the child process of `run` does."""
+    html = path.read_bytes()
+    baseline_mb = peak_rss_mb()
+    start_time = time.perf_counter()
+    if parser == "lxml":
+        articles = run_scraper_lxml(source=html, url=URL)
+    else:
+        articles = run_scraper(soup=BeautifulSoup(html, "lxml"), url=URL)
+    return {
+        "seconds": time.perf_counter() - start_time,
+        "peak_mb": peak_rss_mb() - baseline_mb,
+        "articles": len(articles),
+    }
+
+
+def run(path: Path, parser: str) -> Dict:
+    """Scrape one page in a fresh process and return its measurements."""
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.scraper_benchmark",
+            "--html",
+            str(path),
+            "--child",
+            parser,
+        ],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths: List[Path] = args.html
+        if not paths:
+            paths = [Path(temp_dir) / "law_page.html"]
+            write_page(paths[0], args.articles)
+
+        for path in paths:
+            size_mb = path.stat().st_size / 2**20
+            logger.info(f'"{path.name}": {size_mb:.1f} MiB')
+            for parser in ["bs4", "lxml"]:
+                runs = [run(path, parser) for _ in range(args.repeats)]
+                seconds = min(result["seconds"] for result in runs)
+                peak_mb = min(result["peak_mb"] for result in runs)
+                logger.info(
+                    f"{parser:>5}: {runs[0]['articles']} articles, "
+                    f"{seconds * 1000:8.1f} ms, peak memory +{peak_mb:6.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark time and memory of the scraper parsers."
+    )
+    parser.add_argument("--html", type=Path, nargs="*", default=[])
+    parser.add_argument("--articles", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", choices=["bs4", "lxml"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(scrape(args.html[0], args.child)))
+    else:
+        main(args=args)
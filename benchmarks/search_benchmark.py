@@ -0,0 +1,128 @@
+"""
+Benchmark the serial multi-collection search loop against the concurrent fan-out.
+
+By default the collections are created in a local in-memory Qdrant instance and
+filled with random vectors. Pass `--url` (and `--api_key`) to run the same benchmark
+against a Qdrant server, where the network round-trip dominates.
+
+Usage:
+```
+python -m benchmarks.search_benchmark --collections 3 --points 3000 --repeats 50
+```
+"""
+
+import argparse
+import statistics
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+from loguru import logger
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from database.utils import (
+    create_collection,
+    delete_collection,
+    search,
+    search_collections,
+    upsert,
+)
+
+
+def serial_search(
+    client: QdrantClient, collections: List[str], query_vector: List[float]
+) -> List:
+    """The search loop as it was in `determine_context`."""
+    search_results = []
+    for collection_name in collections:
+        search_results.extend(
+            search(
+                client=client,
+                collection=collection_name,
+                query_vector=query_vector,
+                limit=10,
+                with_vectors=True,
+            )
+        )
+    return search_results
+
+
+def fan_out_search(
+    client: QdrantClient, collections: List[str], query_vector: List[float]
+) -> List:
+    return search_collections(
+        client=client,
+        collections=collections,
+        query_vector=query_vector,
+        limit=10,
+        with_vectors=True,
+    )
+
+
+def measure(
+    func: Callable, client: QdrantClient, collections: List[str], queries: np.ndarray
+) -> Dict[str, float]:
+    latencies = []
+    for query_vector in queries:
+        start_time = time.perf_counter()
+        func(client, collections, query_vector.tolist())
+        latencies.append((time.perf_counter() - start_time) * 1000)
+    latencies.sort()
+    return {
+        "p50": statistics.median(latencies),
+        "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "mean": statistics.fmean(latencies),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    client = (
+        QdrantClient(url=args.url, api_key=args.api_key)
+        if args.url
+        else QdrantClient(":memory:")
+    )
+    rng = np.random.default_rng(seed=0)
+    collections = [f"benchmark_collection_{i}" for i in range(args.collections)]
+
+    for collection in collections:
+        create_collection(client=client, name=collection, vector_size=args.dimensions)
+        vectors = rng.standard_normal((args.points, args.dimensions), dtype=np.float32)
+        upsert(
+            client=client,
+            collection=collection,
+            points=[
+                PointStruct(id=i, vector=vector.tolist(), payload={"text": str(i)})
+                for i, vector in enumerate(vectors)
+            ],
+        )
+
+    queries = rng.standard_normal((args.repeats, args.dimensions), dtype=np.float32)
+    try:
+        # Warm up both paths before measuring
+        serial_search(client, collections, queries[0].tolist())
+        fan_out_search(client, collections, queries[0].tolist())
+
+        for name, func in [("serial", serial_search), ("fan-out", fan_out_search)]:
+            stats = measure(func, client, collections, queries)
+            logger.info(
+                f"{name:>8}: p50={stats['p50']:.2f} ms, p99={stats['p99']:.2f} ms, "
+                f"mean={stats['mean']:.2f} ms"
+            )
+    finally:
+        for collection in collections:
+            delete_collection(client=client, collection=collection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark serial vs concurrent multi-collection search."
+    )
+    parser.add_argument("--url", type=str, default=None, help="Qdrant server URL.")
+    parser.add_argument("--api_key", type=str, default=None, help="Qdrant API key.")
+    parser.add_argument("--collections", type=int, default=3)
+    parser.add_argument("--points", type=int, default=3000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--repeats", type=int, default=50)
+
+    main(args=parser.parse_args())
@@ -10,14 +10,36 @@ This script parallelizes requests to the OpenAI API while throttling to stay und
 
 Features:
 - Streams requests from file, to avoid running out of memory for giant jobs
+- Shares one rate limit budget across many request files, when used as a library
 - Makes requests concurrently, to maximize throughput
+- Bounds the requests in flight, so slow responses hold back reading instead of piling up memory and sockets
 - Throttles request and token usage, to stay under rate limits
-- Retries failed requests up to {max_attempts} times, to avoid missing data
+- Sleeps exactly until capacity is available, instead of polling
+- Optionally adapts the budget to the rate limit headers of the responses
+- Retries failed requests up to {max_attempts} times with exponential backoff and jitter, to avoid missing data
+- Writes results in batches from a background task, keeping disk I/O off the event loop
+- Checkpoints succeeded requests, so an interrupted run resumes where it stopped
+- Optionally writes live throughput, latency, retry and queue metrics to a JSON status file
 - Logs errors, to diagnose problems with requests
 
-Example command to call script:
+Example library call, embedding several files concurrently under one rate limit:
 ```
-python examples/api_request_parallel_processor.py \
+status_tracker = asyncio.run(
+    process_api_requests(
+        requests=read_request_files({"a.jsonl": "a_results.jsonl", "b.jsonl": "b_results.jsonl"}),
+        request_url="https://api.openai.com/v1/embeddings",
+        api_key=os.getenv("OPENAI_API_KEY"),
+        max_requests_per_minute=1500,
+        max_tokens_per_minute=6250000,
+        token_encoding_name="cl100k_base",
+        max_attempts=5,
+    )
+)
+```
+
+Example command to call script, run as a module from the repository root:
+```
+python -m database.api_request_parallel_processor \
   --requests_filepath examples/data/example_requests_to_parallel_process.jsonl \
   --save_filepath examples/data/example_requests_to_parallel_process_results.jsonl \
   --request_url https://api.openai.com/v1/embeddings \
@@ -33,6 +55,8 @@ Inputs:
     - path to the file containing the requests to be processed
     - file should be a jsonl file, where each line is a json object with API parameters and an optional metadata field
     - e.g., {"model": "text-embedding-3-small", "input": "embed me", "metadata": {"row_id": 1}}
+    - an optional token_consumption field holds the token count of the request, e.g. stored by `python -m database.tokenizer`
+    - requests without it are tokenized while they are read
     - as with all jsonl files, take care that newlines in the content are properly escaped (json.dumps does this automatically)
     - an example file is provided at examples/data/example_requests_to_parallel_process.jsonl
     - the code to generate the example file is appended to the bottom of this script
@@ -62,6 +86,27 @@ Inputs:
 - max_attempts : int, optional
     - number of times to retry a failed request before giving up
     - if omitted, will default to 5
+- max_in_flight : int, optional
+    - maximum number of requests read but not finished yet, including requests waiting to be retried
+    - new requests are only read from file when one finishes, and the HTTP connection pool is capped to match
+    - if omitted, will default to 100
+- adaptive_rate_limits : bool, optional
+    - if set, the request and token budgets follow the x-ratelimit-* response headers
+    - the limits are set to 90% of the reported limits, the remaining capacity is synced from every response
+    - and an exhausted budget is refilled at the reported reset time
+    - if omitted, the static limits above are used
+- no_resume : bool, optional
+    - by default, the hashes of succeeded requests are recorded in {save_filepath}.done
+    - a rerun after a crash skips those requests and removes duplicate lines from the save file
+    - if set, every request is sent again
+- status_filepath : str, optional
+    - path to a JSON file that is rewritten every {status_interval} seconds while the requests are processed
+    - holds the achieved requests/min and tokens/min next to the limits, a latency histogram,
+      the number of attempts the finished requests needed, the queue depths and the ETA
+    - if omitted, no status file is written
+- status_interval : float, optional
+    - seconds between updates of the status file
+    - if omitted, will default to 10
 - logging_level : int, optional
     - level of logging to use; higher numbers will log fewer messages
     - 40 = ERROR; will log only when requests fail after all retries
@@ -72,22 +117,29 @@ Inputs:
 
 The script is structured as follows:
     - Imports
-    - Define main()
+    - Define process_api_requests()
         - Initialize things
         - In main loop:
-            - Get next request if one is not already waiting for capacity
-            - Update available token & request capacity
-            - If enough capacity available, call API
-            - The loop pauses if a rate limit error is hit
+            - Read a new request if no waiting request is due and fewer than {max_in_flight} are in flight
+            - Wait for the next due request (retries are delayed by their backoff)
+            - Wait for enough token & request capacity, then call API
             - The loop breaks when no tasks remain
+    - Define process_api_requests_from_file() (the script entry point)
     - Define dataclasses
         - StatusTracker (stores script metadata counters; only one instance is created)
         - APIRequest (stores API inputs, outputs, metadata; one method to call API)
+    - Define classes
+        - TokenBucket (request & token capacity; sleeps until a request fits)
+        - RequestScheduler (priority queue of requests waiting to be sent)
+        - ResultWriter (background task appending results to the jsonl files)
+        - StatusReporter (background task writing the metrics to the status file)
     - Define functions
+        - retry_delay (exponential backoff with jitter)
         - api_endpoint_from_url (extracts API endpoint from request URL)
-        - append_to_jsonl (writes to results file)
-        - num_tokens_consumed_from_request (bigger function to infer token usage from request)
+        - hash_request, load_checkpoint, deduplicate_results (resuming interrupted runs)
+        - read_request_files (streams (request, save_filepath) pairs from many files)
         - task_id_generator_function (yields 0, 1, 2, ...)
+        - peak_rss_mb (peak memory of the process, for the final report)
     - Run main()
 """
 
@@ -95,16 +147,36 @@ The script is structured as follows:
 import aiohttp  # for making API calls concurrently
 import argparse  # for running script from command line
 import asyncio  # for running API calls concurrently
+import hashlib  # for checkpointing completed requests
+import heapq  # for the queue of requests waiting to be sent
 import json  # for saving results to a jsonl file
 import logging  # for logging rate limit warnings and other messages
 import os  # for reading API key
+import platform  # for describing the machine in the status file
+import random  # for jittering retry delays
 import re  # for matching endpoint from request URL
-import tiktoken  # for counting tokens
-import time  # for sleeping after rate limit is hit
+import sys  # for the unit of the peak memory
+import time  # for refilling the rate limit budget
 from dataclasses import (
     dataclass,
     field,
 )  # for storing API inputs, outputs, and metadata
+from datetime import datetime, timezone  # for timestamping the status file
+from typing import Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+from tqdm.auto import tqdm  # for the progress report
+
+from database.tokenizer import (
+    num_tokens_consumed_from_request,
+)  # for counting tokens of requests without a stored count
+
+# upper bounds in seconds of the buckets of the latency histogram
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+try:
+    import resource  # for reporting peak memory
+except ImportError:  # not available on Windows
+    resource = None
 
 
 async def process_api_requests_from_file(
@@ -117,18 +189,65 @@ async def process_api_requests_from_file(
     token_encoding_name: str,
     max_attempts: int,
     logging_level: int,
+    adaptive_rate_limits: bool = False,
+    resume: bool = True,
+    max_in_flight: int = 100,
+    status_filepath: Optional[str] = None,
+    status_interval: float = 10.0,
 ):
-    """Processes API requests in parallel, throttling to stay under rate limits."""
-    # constants
-    seconds_to_pause_after_rate_limit_error = 15
-    seconds_to_sleep_each_loop = (
-        0.001  # 1 ms limits max throughput to 1,000 requests per second
-    )
-
+    """Processes the API requests of one file, see `process_api_requests`."""
     # initialize logging
     logging.basicConfig(level=logging_level)
     logging.debug(f"Logging initialized at level {logging_level}")
 
+    return await process_api_requests(
+        requests=read_request_files({requests_filepath: save_filepath}),
+        request_url=request_url,
+        api_key=api_key,
+        max_requests_per_minute=max_requests_per_minute,
+        max_tokens_per_minute=max_tokens_per_minute,
+        token_encoding_name=token_encoding_name,
+        max_attempts=max_attempts,
+        adaptive_rate_limits=adaptive_rate_limits,
+        checkpoint=resume,
+        max_in_flight=max_in_flight,
+        status_filepath=status_filepath,
+        status_interval=status_interval,
+    )
+
+
+async def process_api_requests(
+    requests: Iterable[Tuple[dict, str]],
+    request_url: str,
+    api_key: str,
+    max_requests_per_minute: float,
+    max_tokens_per_minute: float,
+    token_encoding_name: str,
+    max_attempts: int,
+    total: Optional[int] = None,
+    adaptive_rate_limits: bool = False,
+    checkpoint: bool = False,
+    max_in_flight: int = 100,
+    status_filepath: Optional[str] = None,
+    status_interval: float = 10.0,
+) -> "StatusTracker":
+    """
+    Processes API requests in parallel, throttling to stay under rate limits.
+
+    `requests` yields (request_json, save_filepath) pairs and is consumed lazily, so
+    requests of many files share one request and token budget. `total` is the number
+    of requests, if known, for the progress bar. With `adaptive_rate_limits`, the
+    budget follows the rate limit headers of the responses, starting from the given
+    limits. With `checkpoint`, the hash of every succeeded request is recorded in a
+    sidecar next to its save file, requests recorded by an earlier run are skipped and
+    the save files are deduplicated at the end, so an interrupted run can be resumed.
+    At most `max_in_flight` requests are read and not finished at any time, including
+    those waiting for a retry, and the connection pool holds at most as many sockets.
+    Results go through the bounded queue of the `ResultWriter`, so a slow disk holds
+    back the API calls in turn. With `status_filepath`, a `StatusReporter` rewrites
+    the metrics of the run to that JSON file every `status_interval` seconds and once
+    at the end. Returns the final status.
+    """
     # infer API endpoint and construct request header
     api_endpoint = api_endpoint_from_url(request_url)
     request_header = {"Authorization": f"Bearer {api_key}"}
@@ -137,138 +256,188 @@ async def process_api_requests_from_file(
         request_header = {"api-key": f"{api_key}"}
 
     # initialize trackers
-    queue_of_requests_to_retry = asyncio.Queue()
+    scheduler = RequestScheduler()  # requests waiting to be sent, incl. retries
+    rate_limiter = TokenBucket(max_requests_per_minute, max_tokens_per_minute)
     task_id_generator = (
         task_id_generator_function()
     )  # generates integer IDs of 0, 1, 2, ...
     status_tracker = (
         StatusTracker()
     )  # single instance to track a collection of variables
-    next_request = None  # variable to hold the next request to call
-
-    # initialize available capacity counts
-    available_request_capacity = max_requests_per_minute
-    available_token_capacity = max_tokens_per_minute
-    last_update_time = time.time()
+    tasks = set()  # keeps references to running API calls
+    completed_requests = {}  # save_filepath -> hashes of requests done in earlier runs
 
     # initialize flags
-    file_not_finished = True  # after file is empty, we'll skip reading it
+    requests_not_finished = True  # after requests run out, we'll skip reading them
     logging.debug(f"Initialization complete.")
 
-    # initialize file reading
-    with open(requests_filepath) as file:
-        # `requests` will provide requests one at a time
-        requests = file.__iter__()
-        logging.debug(f"File opened. Entering main loop")
-        async with aiohttp.ClientSession() as session:  # Initialize ClientSession here
+    # `requests` will provide requests one at a time
+    requests = iter(requests)
+    progress = tqdm(total=total, desc="Processing requests")
+
+    def update_progress() -> None:
+        progress.update(
+            status_tracker.num_tasks_succeeded
+            + status_tracker.num_tasks_failed
+            + status_tracker.num_tasks_skipped
+            - progress.n
+        )
+
+    def on_done(task: asyncio.Task) -> None:
+        tasks.discard(task)
+        update_progress()
+        scheduler.notify()  # the main loop may be waiting for a free slot
+
+    async def on_connection_create_end(session, context, params) -> None:
+        status_tracker.num_connections_opened += 1
+
+    # one socket per request in flight, reused by the following requests
+    connector = aiohttp.TCPConnector(limit=max_in_flight, limit_per_host=max_in_flight)
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+
+    logging.debug(f"Entering main loop")
+    async with ResultWriter() as result_writer, aiohttp.ClientSession(
+        connector=connector, trace_configs=[trace_config]
+    ) as session, StatusReporter(
+        status_filepath=status_filepath,
+        interval=status_interval,
+        status_tracker=status_tracker,
+        rate_limiter=rate_limiter,
+        scheduler=scheduler,
+        result_writer=result_writer,
+        tasks=tasks,
+        total=total,
+        config={
+            "request_url": request_url,
+            "max_requests_per_minute": max_requests_per_minute,
+            "max_tokens_per_minute": max_tokens_per_minute,
+            "max_attempts": max_attempts,
+            "max_in_flight": max_in_flight,
+            "adaptive_rate_limits": adaptive_rate_limits,
+        },
+    ):
+        try:
             while True:
-                # get next request (if one is not already waiting for capacity)
-                if next_request is None:
-                    if not queue_of_requests_to_retry.empty():
-                        next_request = queue_of_requests_to_retry.get_nowait()
-                        logging.debug(
-                            f"Retrying request {next_request.task_id}: {next_request}"
-                        )
-                    elif file_not_finished:
-                        try:
-                            # get new request
-                            request_json = json.loads(next(requests))
-                            next_request = APIRequest(
-                                task_id=next(task_id_generator),
-                                request_json=request_json,
-                                token_consumption=num_tokens_consumed_from_request(
+                # read a new request only if no waiting request is ready to be sent
+                # and a slot is free, otherwise wait below for a request to finish
+                if (
+                    requests_not_finished
+                    and not scheduler.has_ready()
+                    and status_tracker.num_tasks_in_progress < max_in_flight
+                    and len(tasks) < max_in_flight  # a finished call may still exit
+                ):
+                    try:
+                        # get new request
+                        request_json, save_filepath = next(requests)
+                        # a stored count saves tokenizing in the loop, it is not sent
+                        token_consumption = request_json.pop("token_consumption", None)
+                        request_hash = None
+                        if checkpoint:
+                            if save_filepath not in completed_requests:
+                                completed_requests[save_filepath] = load_checkpoint(
+                                    save_filepath
+                                )
+                            request_hash = hash_request(request_json)
+                            if request_hash in completed_requests[save_filepath]:
+                                status_tracker.num_tasks_skipped += 1
+                                update_progress()
+                                continue
+                        request = APIRequest(
+                            task_id=next(task_id_generator),
+                            request_json=request_json,
+                            token_consumption=(
+                                token_consumption
+                                if token_consumption is not None
+                                else num_tokens_consumed_from_request(
                                     request_json, api_endpoint, token_encoding_name
-                                ),
-                                attempts_left=max_attempts,
-                                metadata=request_json.pop("metadata", None),
-                            )
-                            status_tracker.num_tasks_started += 1
-                            status_tracker.num_tasks_in_progress += 1
-                            logging.debug(
-                                f"Reading request {next_request.task_id}: {next_request}"
-                            )
-                        except StopIteration:
-                            # if file runs out, set flag to stop reading it
-                            logging.debug("Read file exhausted")
-                            file_not_finished = False
-
-                # update available capacity
-                current_time = time.time()
-                seconds_since_update = current_time - last_update_time
-                available_request_capacity = min(
-                    available_request_capacity
-                    + max_requests_per_minute * seconds_since_update / 60.0,
-                    max_requests_per_minute,
-                )
-                available_token_capacity = min(
-                    available_token_capacity
-                    + max_tokens_per_minute * seconds_since_update / 60.0,
-                    max_tokens_per_minute,
-                )
-                last_update_time = current_time
-
-                # if enough capacity available, call API
-                if next_request:
-                    next_request_tokens = next_request.token_consumption
-                    if (
-                        available_request_capacity >= 1
-                        and available_token_capacity >= next_request_tokens
-                    ):
-                        # update counters
-                        available_request_capacity -= 1
-                        available_token_capacity -= next_request_tokens
-                        next_request.attempts_left -= 1
-
-                        # call API
-                        asyncio.create_task(
-                            next_request.call_api(
-                                session=session,
-                                request_url=request_url,
-                                request_header=request_header,
-                                retry_queue=queue_of_requests_to_retry,
-                                save_filepath=save_filepath,
-                                status_tracker=status_tracker,
-                            )
+                                )
+                            ),
+                            attempts_left=max_attempts,
+                            metadata=request_json.pop("metadata", None),
+                            save_filepath=save_filepath,
+                            request_hash=request_hash,
                         )
-                        next_request = None  # reset next_request to empty
+                        status_tracker.num_tasks_started += 1
+                        status_tracker.num_tasks_in_progress += 1
+                        scheduler.put(request)
+                        logging.debug(
+                            f"Reading request {request.task_id}: {request}"
+                        )
+                    except StopIteration:
+                        # if requests run out, set flag to stop reading them
+                        logging.debug("Requests exhausted")
+                        requests_not_finished = False
 
                 # if all tasks are finished, break
-                if status_tracker.num_tasks_in_progress == 0:
+                if (
+                    status_tracker.num_tasks_in_progress == 0
+                    and not requests_not_finished
+                ):
                     break
 
-                # main loop sleeps briefly so concurrent tasks can run
-                await asyncio.sleep(seconds_to_sleep_each_loop)
+                # sleep until a request is ready, a retry is scheduled or a task finishes
+                request = await scheduler.get()
+                if request is None:
+                    continue
 
-                # if a rate limit error was hit recently, pause to cool down
-                seconds_since_rate_limit_error = (
-                    time.time() - status_tracker.time_of_last_rate_limit_error
-                )
-                if (
-                    seconds_since_rate_limit_error
-                    < seconds_to_pause_after_rate_limit_error
-                ):
-                    remaining_seconds_to_pause = (
-                        seconds_to_pause_after_rate_limit_error
-                        - seconds_since_rate_limit_error
-                    )
-                    await asyncio.sleep(remaining_seconds_to_pause)
-                    # ^e.g., if pause is 15 seconds and final limit was hit 5 seconds ago
-                    logging.warn(
-                        f"Pausing to cool down until {time.ctime(status_tracker.time_of_last_rate_limit_error + seconds_to_pause_after_rate_limit_error)}"
+                # sleep until enough capacity is available, then call API
+                await rate_limiter.acquire(request.token_consumption)
+                request.attempts_left -= 1
+                status_tracker.num_requests_sent += 1
+                status_tracker.num_tokens_sent += request.token_consumption
+                task = asyncio.create_task(
+                    request.call_api(
+                        session=session,
+                        request_url=request_url,
+                        request_header=request_header,
+                        scheduler=scheduler,
+                        status_tracker=status_tracker,
+                        result_writer=result_writer,
+                        rate_limiter=rate_limiter if adaptive_rate_limits else None,
                     )
+                )
+                tasks.add(task)
+                task.add_done_callback(on_done)
+                status_tracker.peak_requests_in_flight = max(
+                    status_tracker.peak_requests_in_flight, len(tasks)
+                )
+        finally:
+            # on cancellation, stop the API calls before the writer flushes and closes
+            for task in list(tasks):
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
 
-        # after finishing, log final status
+    # drop the duplicates an interrupted run may have left
+    for save_filepath in completed_requests:
+        deduplicate_results(save_filepath)
+
+    # after finishing, log final status
+    progress.close()
+    logging.info(
+        f"""Parallel processing complete. {status_tracker.num_tasks_succeeded} / {status_tracker.num_tasks_started} requests succeeded."""
+    )
+    if status_tracker.num_tasks_skipped > 0:
         logging.info(
-            f"""Parallel processing complete. Results saved to {save_filepath}"""
+            f"{status_tracker.num_tasks_skipped} requests were already completed by an earlier run."
         )
-        if status_tracker.num_tasks_failed > 0:
-            logging.warning(
-                f"{status_tracker.num_tasks_failed} / {status_tracker.num_tasks_started} requests failed. Errors logged to {save_filepath}."
-            )
-        if status_tracker.num_rate_limit_errors > 0:
-            logging.warning(
-                f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate."
-            )
+    if status_tracker.num_tasks_failed > 0:
+        logging.warning(
+            f"{status_tracker.num_tasks_failed} / {status_tracker.num_tasks_started} requests failed."
+        )
+        for save_filepath, num_failed in status_tracker.failed_by_file.items():
+            logging.warning(f"{num_failed} errors logged to {save_filepath}.")
+    if status_tracker.num_rate_limit_errors > 0:
+        logging.warning(
+            f"{status_tracker.num_rate_limit_errors} rate limit errors received. Consider running at a lower rate."
+        )
+    peak_rss = peak_rss_mb()
+    logging.info(
+        f"Peak {status_tracker.peak_requests_in_flight} / {max_in_flight} requests in flight, "
+        f"{status_tracker.num_connections_opened} connections opened"
+        + (f", peak RSS {peak_rss:.0f} MiB." if peak_rss is not None else ".")
+    )
+    return status_tracker
 
 
 # dataclasses
@@ -282,10 +451,33 @@ class StatusTracker:
     num_tasks_in_progress: int = 0  # script ends when this reaches 0
     num_tasks_succeeded: int = 0
     num_tasks_failed: int = 0
+    num_tasks_skipped: int = 0  # completed by an earlier run
     num_rate_limit_errors: int = 0
     num_api_errors: int = 0  # excluding rate limit errors, counted above
     num_other_errors: int = 0
-    time_of_last_rate_limit_error: int = 0  # used to cool off after hitting rate limits
+    time_of_last_rate_limit_error: int = 0  # time of the most recent rate limit error
+    peak_requests_in_flight: int = 0  # most API calls running at the same time
+    num_connections_opened: int = 0  # sockets opened by the connection pool
+    num_requests_sent: int = 0  # API calls, including retries
+    num_tokens_sent: int = 0  # estimated tokens of the API calls
+    failed_by_file: Dict[str, int] = field(
+        default_factory=dict
+    )  # failed requests per save file
+    latency_histogram: list = field(
+        default_factory=lambda: [0] * len(LATENCY_BUCKETS)
+    )  # responses per latency bucket
+    total_latency: float = 0.0  # seconds, to average the latency
+    attempts_histogram: Dict[int, int] = field(
+        default_factory=dict
+    )  # finished requests per number of attempts they took
+
+    def record_latency(self, seconds: float) -> None:
+        bucket = next(i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound)
+        self.latency_histogram[bucket] += 1
+        self.total_latency += seconds
+
+    def record_attempts(self, attempts: int) -> None:
+        self.attempts_histogram[attempts] = self.attempts_histogram.get(attempts, 0) + 1
 
 
 @dataclass
@@ -297,6 +489,8 @@ class APIRequest:
     token_consumption: int
     attempts_left: int
     metadata: dict
+    save_filepath: str
+    request_hash: Optional[str] = None  # recorded in the checkpoint once succeeded
     result: list = field(default_factory=list)
 
     async def call_api(
@@ -304,25 +498,33 @@ class APIRequest:
         session: aiohttp.ClientSession,
         request_url: str,
         request_header: dict,
-        retry_queue: asyncio.Queue,
-        save_filepath: str,
+        scheduler: "RequestScheduler",
         status_tracker: StatusTracker,
+        result_writer: "ResultWriter",
+        rate_limiter: Optional["TokenBucket"] = None,
     ):
-        """Calls the OpenAI API and saves results."""
+        """Calls the OpenAI API and saves results. Adapts `rate_limiter` to the rate limit headers, if given."""
         logging.info(f"Starting request #{self.task_id}")
         error = None
         try:
+            start_time = time.monotonic()
             async with session.post(
                 url=request_url, headers=request_header, json=self.request_json
             ) as response:
+                if rate_limiter is not None:
+                    rate_limiter.update_from_headers(response.headers)
+                status = response.status
                 response = await response.json()
+            status_tracker.record_latency(time.monotonic() - start_time)
             if "error" in response:
                 logging.warning(
                     f"Request {self.task_id} failed with error {response['error']}"
                 )
                 status_tracker.num_api_errors += 1
                 error = response
-                if "Rate limit" in response["error"].get("message", ""):
+                if status == 429 or "Rate limit" in response["error"].get(
+                    "message", ""
+                ):
                     status_tracker.time_of_last_rate_limit_error = time.time()
                     status_tracker.num_rate_limit_errors += 1
                     status_tracker.num_api_errors -= (
@@ -338,7 +540,8 @@ class APIRequest:
         if error:
             self.result.append(error)
             if self.attempts_left:
-                retry_queue.put_nowait(self)
+                # back off per request, other requests keep using the capacity
+                scheduler.put(self, delay=retry_delay(num_errors=len(self.result)))
             else:
                 logging.error(
                     f"Request {self.request_json} failed after all attempts. Saving errors: {self.result}"
@@ -348,27 +551,458 @@ class APIRequest:
                     if self.metadata
                     else [self.request_json, [str(e) for e in self.result]]
                 )
-                append_to_jsonl(data, save_filepath)
+                await result_writer.write(data, self.save_filepath)
                 status_tracker.num_tasks_in_progress -= 1
                 status_tracker.num_tasks_failed += 1
+                status_tracker.record_attempts(len(self.result))
+                status_tracker.failed_by_file[self.save_filepath] = (
+                    status_tracker.failed_by_file.get(self.save_filepath, 0) + 1
+                )
         else:
             data = (
                 [self.request_json, response, self.metadata]
                 if self.metadata
                 else [self.request_json, response]
             )
-            append_to_jsonl(data, save_filepath)
+            await result_writer.write(data, self.save_filepath)
+            if self.request_hash is not None:
+                # queued after the result, so a checkpointed request is never lost
+                await result_writer.write(
+                    self.request_hash, checkpoint_filepath(self.save_filepath)
+                )
             status_tracker.num_tasks_in_progress -= 1
             status_tracker.num_tasks_succeeded += 1
-            logging.debug(f"Request {self.task_id} saved to {save_filepath}")
+            status_tracker.record_attempts(len(self.result) + 1)
+            logging.debug(f"Request {self.task_id} saved to {self.save_filepath}")
+
+
+class TokenBucket:
+    """Request and token capacity, refilled continuously up to the per-minute limits."""
+
+    # rate limit header suffix -> (per-minute limit, available capacity) attributes
+    budgets = {
+        "requests": ("max_requests_per_minute", "available_request_capacity"),
+        "tokens": ("max_tokens_per_minute", "available_token_capacity"),
+    }
+
+    def __init__(
+        self,
+        max_requests_per_minute: float,
+        max_tokens_per_minute: float,
+        headroom: float = 0.9,
+    ) -> None:
+        self.max_requests_per_minute = max_requests_per_minute
+        self.max_tokens_per_minute = max_tokens_per_minute
+        self.available_request_capacity = max_requests_per_minute
+        self.available_token_capacity = max_tokens_per_minute
+        self.headroom = headroom  # share of the reported limits used when adapting
+        self.reset_times = {}  # budget -> time the API resets it to its limit
+        self.last_update_time = time.monotonic()
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Adapt the budget to the x-ratelimit-* headers of an API response.
+
+        The per-minute limits follow `headroom` times the reported limits. The available
+        capacity is lowered to the reported remaining capacity, never raised, because
+        requests still in flight are not counted in the response yet. If nothing is
+        remaining, the capacity is refilled to the limit at the reported reset time.
+        """
+        self.refill()
+        for kind, (max_attribute, available_attribute) in self.budgets.items():
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            if limit is not None:
+                setattr(self, max_attribute, float(limit) * self.headroom)
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            remaining = float(remaining)
+            setattr(
+                self,
+                available_attribute,
+                min(getattr(self, available_attribute), remaining),
+            )
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining < 1 and reset is not None:
+                self.reset_times[kind] = time.monotonic() + parse_duration(reset)
+
+    def refill(self) -> None:
+        current_time = time.monotonic()
+        seconds_since_update = current_time - self.last_update_time
+        self.available_request_capacity = min(
+            self.available_request_capacity
+            + self.max_requests_per_minute * seconds_since_update / 60.0,
+            self.max_requests_per_minute,
+        )
+        self.available_token_capacity = min(
+            self.available_token_capacity
+            + self.max_tokens_per_minute * seconds_since_update / 60.0,
+            self.max_tokens_per_minute,
+        )
+        for kind, reset_time in list(self.reset_times.items()):
+            if current_time >= reset_time:
+                max_attribute, available_attribute = self.budgets[kind]
+                setattr(self, available_attribute, getattr(self, max_attribute))
+                del self.reset_times[kind]
+        self.last_update_time = current_time
+
+    async def acquire(self, tokens: int) -> None:
+        """Sleep exactly until one request and `tokens` tokens are available, then take them."""
+        while True:
+            # a request larger than a minute of tokens would wait forever otherwise
+            tokens = min(tokens, self.max_tokens_per_minute)
+            self.refill()
+            missing_requests = 1 - self.available_request_capacity
+            missing_tokens = tokens - self.available_token_capacity
+            if missing_requests <= 0 and missing_tokens <= 0:
+                self.available_request_capacity -= 1
+                self.available_token_capacity -= tokens
+                return
+            seconds_to_wait = 60.0 * max(
+                missing_requests / self.max_requests_per_minute,
+                missing_tokens / self.max_tokens_per_minute,
+            )
+            if self.reset_times:
+                seconds_to_reset = min(self.reset_times.values()) - time.monotonic()
+                seconds_to_wait = min(seconds_to_wait, max(seconds_to_reset, 0))
+            await asyncio.sleep(seconds_to_wait)
+
+
+class RequestScheduler:
+    """Requests waiting to be sent, in a priority queue ordered by the time they are due."""
+
+    def __init__(self) -> None:
+        self._queue = []  # heap of (due time, task id, request)
+        self._changed = asyncio.Event()
+
+    def put(self, request: APIRequest, delay: float = 0.0) -> None:
+        heapq.heappush(
+            self._queue, (time.monotonic() + delay, request.task_id, request)
+        )
+        self._changed.set()
+
+    def notify(self) -> None:
+        """Wake up `get` without a new request, e.g. when a task finishes."""
+        self._changed.set()
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def has_ready(self) -> bool:
+        return bool(self._queue) and self._queue[0][0] <= time.monotonic()
+
+    async def get(self) -> Optional[APIRequest]:
+        """Wait for the next due request. Returns None if woken up by `put` or `notify` first."""
+        if not self.has_ready():
+            self._changed.clear()
+            timeout = self._queue[0][0] - time.monotonic() if self._queue else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            if not self.has_ready():
+                return None
+        return heapq.heappop(self._queue)[2]
+
+
+class ResultWriter:
+    """
+    Appends results to jsonl files from a single background task.
+
+    Results are handed over through a bounded queue, so slow disks hold back the
+    API calls instead of buffering without limit. Every batch of queued results is
+    written in a worker thread and flushed, and the files are fsynced at most every
+    `fsync_interval` seconds. On exit, also after cancellation, the queued results are
+    written and the files are fsynced and closed. If writing fails, for example on a
+    full disk, `write` and `close` raise the error instead of losing results silently.
+    """
+
+    def __init__(
+        self,
+        max_queue_size: int = 1000,
+        batch_size: int = 100,
+        fsync_interval: float = 5.0,
+    ) -> None:
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._files = {}  # filename -> file opened for appending
+        self._last_fsync_time = time.monotonic()
+        self._task = None
+        self._pending_write = None  # batch being written in a worker thread
+
+    async def __aenter__(self) -> "ResultWriter":
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def write(self, data, filename: str) -> None:
+        """Queue a json payload for the end of a jsonl file, waiting if the queue is full."""
+        await self._put((json.dumps(data) + "\n", filename))
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self) -> None:
+        if self._task is None:
+            return
+        try:
+            if not self._task.done():
+                await self._put(None)  # sentinel, written after all queued results
+                await asyncio.shield(self._task)
+            # raises the error of a writer that failed before it was closed
+            self._task.result()
+        finally:
+            self._task = None
+
+    async def _put(self, item) -> None:
+        """Queue an item, raising the error of a failed writer instead of hanging."""
+        self._check_writer()
+        if self._task is None:
+            await self._queue.put(item)
+            return
+        put = asyncio.ensure_future(self._queue.put(item))
+        try:
+            await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        self._check_writer()
+
+    def _check_writer(self) -> None:
+        if self._task is not None and self._task.done():
+            # before the sentinel is queued, the writer only stops if writing failed
+            self._task.result()
+            raise RuntimeError("The result writer stopped before it was closed.")
+
+    async def _run(self) -> None:
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                self._pending_write = asyncio.ensure_future(
+                    asyncio.to_thread(
+                        self._write_batch, [item for item in batch if item is not None]
+                    )
+                )
+                # a cancelled writer still lets the thread finish its batch
+                await asyncio.shield(self._pending_write)
+                self._pending_write = None
+                if None in batch:
+                    break
+        finally:
+            try:
+                if self._pending_write is not None:
+                    # re-raises the error of a failed batch, the rest is not written
+                    await self._pending_write
+                # write what is left without awaiting, we may have been cancelled
+                remaining = []
+                while not self._queue.empty():
+                    remaining.append(self._queue.get_nowait())
+                self._write_batch([item for item in remaining if item is not None])
+            finally:
+                self._close_files()
+
+    def _close_files(self) -> None:
+        """Fsync and close every file, even if one fails, then raise its error."""
+        error = None
+        for file in self._files.values():
+            try:
+                file.flush()
+                os.fsync(file.fileno())
+                file.close()
+            except OSError as e:
+                error = error or e
+                try:
+                    file.close()
+                except OSError:
+                    pass
+        self._files.clear()
+        if error is not None:
+            raise error
+
+    def _write_batch(self, batch: list) -> None:
+        for line, filename in batch:
+            if filename not in self._files:
+                self._files[filename] = open(filename, "a")
+            self._files[filename].write(line)
+        for file in self._files.values():
+            file.flush()
+        if time.monotonic() - self._last_fsync_time >= self.fsync_interval:
+            for file in self._files.values():
+                os.fsync(file.fileno())
+            self._last_fsync_time = time.monotonic()
+
+
+class StatusReporter:
+    """
+    Rewrites the metrics of a run to a JSON status file at a fixed interval.
+
+    Rates are reported over the last interval and over the whole run, next to the
+    configured and the current (possibly adapted) limits, so runs on different
+    machines can be compared. The file is replaced atomically, a reader never sees a
+    partial report. Without `status_filepath`, nothing is written.
+    """
+
+    def __init__(
+        self,
+        status_filepath: Optional[str],
+        interval: float,
+        status_tracker: StatusTracker,
+        rate_limiter: TokenBucket,
+        scheduler: RequestScheduler,
+        result_writer: ResultWriter,
+        tasks: set,
+        total: Optional[int],
+        config: dict,
+    ) -> None:
+        self.status_filepath = status_filepath
+        self.interval = interval
+        self.status_tracker = status_tracker
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.result_writer = result_writer
+        self.tasks = tasks
+        self.total = total
+        self.config = config
+        self._started_at = datetime.now(timezone.utc)
+        self._start_time = time.monotonic()
+        self._last_report = (self._start_time, 0, 0)  # time, requests, tokens sent
+        self._task = None
+
+    async def __aenter__(self) -> "StatusReporter":
+        if self.status_filepath is not None:
+            self._task = asyncio.create_task(self._run())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.write()  # the final state, also of an interrupted run
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write()
+
+    def write(self) -> None:
+        temp_filepath = f"{self.status_filepath}.tmp"
+        with open(temp_filepath, "w") as file:
+            json.dump(self.snapshot(), file, indent=2)
+        os.replace(temp_filepath, self.status_filepath)
+
+    def snapshot(self) -> dict:
+        """The current metrics, as written to the status file."""
+        tracker = self.status_tracker
+        current_time = time.monotonic()
+        elapsed_minutes = max(current_time - self._start_time, 1e-9) / 60.0
+        last_time, last_requests, last_tokens = self._last_report
+        interval_minutes = max(current_time - last_time, 1e-9) / 60.0
+        self._last_report = (
+            current_time,
+            tracker.num_requests_sent,
+            tracker.num_tokens_sent,
+        )
+
+        # requests finished by this run, skipped ones took no time
+        num_finished = tracker.num_tasks_succeeded + tracker.num_tasks_failed
+        eta_seconds = None
+        if self.total is not None and num_finished:
+            remaining = self.total - num_finished - tracker.num_tasks_skipped
+            eta_seconds = max(remaining, 0) * elapsed_minutes * 60.0 / num_finished
+
+        num_responses = sum(tracker.latency_histogram)
+        mean_latency = tracker.total_latency / num_responses if num_responses else None
+        return {
+            "started_at": self._started_at.isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+            "elapsed_seconds": round(elapsed_minutes * 60.0, 3),
+            "machine": {
+                "hostname": platform.node(),
+                "python": platform.python_version(),
+                "cpu_count": os.cpu_count(),
+            },
+            "config": self.config,
+            "requests": {
+                "total": self.total,
+                "started": tracker.num_tasks_started,
+                "succeeded": tracker.num_tasks_succeeded,
+                "failed": tracker.num_tasks_failed,
+                "skipped": tracker.num_tasks_skipped,
+                "in_progress": tracker.num_tasks_in_progress,
+            },
+            "throughput": {
+                "requests_per_minute": (tracker.num_requests_sent - last_requests)
+                / interval_minutes,
+                "tokens_per_minute": (tracker.num_tokens_sent - last_tokens)
+                / interval_minutes,
+                "average_requests_per_minute": tracker.num_requests_sent
+                / elapsed_minutes,
+                "average_tokens_per_minute": tracker.num_tokens_sent / elapsed_minutes,
+                "max_requests_per_minute": self.config["max_requests_per_minute"],
+                "max_tokens_per_minute": self.config["max_tokens_per_minute"],
+                # lower than the configured limits if adapted to the API headers
+                "current_max_requests_per_minute": (
+                    self.rate_limiter.max_requests_per_minute
+                ),
+                "current_max_tokens_per_minute": (
+                    self.rate_limiter.max_tokens_per_minute
+                ),
+            },
+            "latency_seconds": {
+                "histogram": {
+                    f"<={bound}": count
+                    for bound, count in zip(
+                        LATENCY_BUCKETS, tracker.latency_histogram
+                    )
+                },
+                "mean": mean_latency,
+            },
+            "attempts": {
+                str(attempts): count
+                for attempts, count in sorted(tracker.attempts_histogram.items())
+            },
+            "errors": {
+                "rate_limit": tracker.num_rate_limit_errors,
+                "api": tracker.num_api_errors,
+                "other": tracker.num_other_errors,
+            },
+            "queues": {
+                "in_flight": len(self.tasks),
+                "waiting_for_retry_or_capacity": len(self.scheduler),
+                "result_writer": self.result_writer.queue_size(),
+            },
+            "connections_opened": tracker.num_connections_opened,
+            "peak_rss_mb": peak_rss_mb(),
+            "eta_seconds": eta_seconds,
+        }
 
 
 # functions
 
 
+def retry_delay(num_errors: int, base: float = 1.0, max_delay: float = 60.0) -> float:
+    """Exponential backoff with full jitter, so failed requests do not retry in lockstep."""
+    return random.uniform(0, min(max_delay, base * 2**num_errors))
+
+
+def parse_duration(duration: str) -> float:
+    """Convert a rate limit reset duration, e.g. "1m30.5s" or "20ms", to seconds."""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(
+        float(value) * units[unit]
+        for value, unit in re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", duration)
+    )
+
+
 def api_endpoint_from_url(request_url):
     """Extract the API endpoint from the request URL."""
-    match = re.search("^https://[^/]+/v\\d+/(.+)$", request_url)
+    match = re.search("^https?://[^/]+/v\\d+/(.+)$", request_url)
     if match is None:
         # for Azure OpenAI deployment urls
         match = re.search(
@@ -377,70 +1011,98 @@ def api_endpoint_from_url(request_url):
     return match[1]
 
 
-def append_to_jsonl(data, filename: str) -> None:
-    """Append a json payload to the end of a jsonl file."""
-    json_string = json.dumps(data)
-    with open(filename, "a") as f:
-        f.write(json_string + "\n")
+def hash_request(request_json: dict) -> str:
+    """Hash a request including its metadata, independent of the key order."""
+    # empty metadata is not saved with the results, so it must not change the hash
+    request_json = {
+        key: value
+        for key, value in request_json.items()
+        if key != "metadata" or value
+    }
+    return hashlib.sha256(
+        json.dumps(request_json, sort_keys=True).encode("utf-8")
+    ).hexdigest()
 
 
-def num_tokens_consumed_from_request(
-    request_json: dict,
-    api_endpoint: str,
-    token_encoding_name: str,
-):
-    """Count the number of tokens in the request. Only supports completion and embedding requests."""
-    encoding = tiktoken.get_encoding(token_encoding_name)
-    # if completions request, tokens = prompt + n * max_tokens
-    if api_endpoint.endswith("completions"):
-        max_tokens = request_json.get("max_tokens", 15)
-        n = request_json.get("n", 1)
-        completion_tokens = n * max_tokens
-
-        # chat completions
-        if api_endpoint.startswith("chat/"):
-            num_tokens = 0
-            for message in request_json["messages"]:
-                num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
-                for key, value in message.items():
-                    num_tokens += len(encoding.encode(value))
-                    if key == "name":  # if there's a name, the role is omitted
-                        num_tokens -= 1  # role is always required and always 1 token
-            num_tokens += 2  # every reply is primed with <im_start>assistant
-            return num_tokens + completion_tokens
-        # normal completions
-        else:
-            prompt = request_json["prompt"]
-            if isinstance(prompt, str):  # single prompt
-                prompt_tokens = len(encoding.encode(prompt))
-                num_tokens = prompt_tokens + completion_tokens
-                return num_tokens
-            elif isinstance(prompt, list):  # multiple prompts
-                prompt_tokens = sum([len(encoding.encode(p)) for p in prompt])
-                num_tokens = prompt_tokens + completion_tokens * len(prompt)
-                return num_tokens
-            else:
-                raise TypeError(
-                    'Expecting either string or list of strings for "prompt" field in completion request'
-                )
-    # if embeddings request, tokens = input tokens
-    elif api_endpoint == "embeddings":
-        input = request_json["input"]
-        if isinstance(input, str):  # single input
-            num_tokens = len(encoding.encode(input))
-            return num_tokens
-        elif isinstance(input, list):  # multiple inputs
-            num_tokens = sum([len(encoding.encode(i)) for i in input])
-            return num_tokens
-        else:
-            raise TypeError(
-                'Expecting either string or list of strings for "inputs" field in embedding request'
+def checkpoint_filepath(save_filepath: str) -> str:
+    """Sidecar with the hashes of the succeeded requests of a save file."""
+    return f"{save_filepath}.done"
+
+
+def load_checkpoint(save_filepath: str) -> set:
+    """
+    Hashes of the requests an earlier run completed for a save file.
+
+    A crash may cut off the last line of the save file and of the checkpoint. Such a
+    line is terminated, so the results of this run start on a line of their own. A
+    checkpoint without its save file is stale and removed.
+    """
+    if not os.path.exists(save_filepath):
+        if os.path.exists(checkpoint_filepath(save_filepath)):
+            os.remove(checkpoint_filepath(save_filepath))
+        return set()
+    for filename in [save_filepath, checkpoint_filepath(save_filepath)]:
+        if os.path.exists(filename) and os.path.getsize(filename):
+            with open(filename, "rb+") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    file.write(b"\n")
+    if not os.path.exists(checkpoint_filepath(save_filepath)):
+        return set()
+    completed = set()
+    with open(checkpoint_filepath(save_filepath)) as file:
+        for line in file:
+            try:
+                completed.add(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a line cut off by a crash
+    return completed
+
+
+def deduplicate_results(save_filepath: str) -> None:
+    """
+    Keep one line per request in a save file, preferring the last successful result.
+
+    Two passes over the file keep only the hashes in memory, not the results.
+    """
+    if not os.path.exists(save_filepath):
+        return
+    kept = {}  # request hash -> (line number, succeeded)
+    num_lines = 0
+    with open(save_filepath) as file:
+        for line_number, line in enumerate(file):
+            num_lines += 1
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # a line cut off by a crash
+            request_json = (
+                dict(data[0], metadata=data[2]) if len(data) == 3 else data[0]
             )
-    # more logic needed to support other API calls (e.g., edits, inserts, DALL-E)
-    else:
-        raise NotImplementedError(
-            f'API endpoint "{api_endpoint}" not implemented in this script'
-        )
+            succeeded = isinstance(data[1], dict) and "error" not in data[1]
+            request_hash = hash_request(request_json)
+            if succeeded or not kept.get(request_hash, (0, False))[1]:
+                kept[request_hash] = (line_number, succeeded)
+    if len(kept) == num_lines:
+        return
+
+    keep_lines = {line_number for line_number, _ in kept.values()}
+    with open(save_filepath) as file, open(f"{save_filepath}.tmp", "w") as output:
+        for line_number, line in enumerate(file):
+            if line_number in keep_lines:
+                output.write(line)
+    os.replace(f"{save_filepath}.tmp", save_filepath)
+    logging.info(
+        f"Removed {num_lines - len(kept)} duplicate results from {save_filepath}."
+    )
+
+
+def read_request_files(request_files: Dict[str, str]) -> Iterator[Tuple[dict, str]]:
+    """Stream (request_json, save_filepath) pairs from request files, one file after another."""
+    for requests_filepath, save_filepath in request_files.items():
+        with open(requests_filepath) as file:
+            for line in file:
+                yield json.loads(line), save_filepath
 
 
 def task_id_generator_function():
@@ -451,6 +1113,15 @@ def task_id_generator_function():
         task_id += 1
 
 
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the process in MiB, None where it is not available."""
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return peak_rss / 2**20 if sys.platform == "darwin" else peak_rss / 2**10
+
+
 # run script
 
 
@@ -466,6 +1137,11 @@ if __name__ == "__main__":
     parser.add_argument("--token_encoding_name", default="cl100k_base")
     parser.add_argument("--max_attempts", type=int, default=5)
     parser.add_argument("--logging_level", default=logging.INFO)
+    parser.add_argument("--adaptive_rate_limits", action="store_true")
+    parser.add_argument("--no_resume", action="store_true")
+    parser.add_argument("--max_in_flight", type=int, default=100)
+    parser.add_argument("--status_filepath", default=None)
+    parser.add_argument("--status_interval", type=float, default=10.0)
     args = parser.parse_args()
 
     if args.save_filepath is None:
@@ -483,6 +1159,11 @@ if __name__ == "__main__":
             token_encoding_name=args.token_encoding_name,
             max_attempts=int(args.max_attempts),
             logging_level=int(args.logging_level),
+            adaptive_rate_limits=args.adaptive_rate_limits,
+            resume=not args.no_resume,
+            max_in_flight=args.max_in_flight,
+            status_filepath=args.status_filepath,
+            status_interval=args.status_interval,
         )
     )
 
@@ -0,0 +1,560 @@
+import itertools
+import json
+import os
+import re
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from loguru import logger
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, ScoredPoint
+
+from database.utils import (
+    create_collection,
+    delete_collection,
+    delete_points,
+    get_alias,
+    get_count,
+    list_collections,
+    search,
+    search_collections,
+    switch_alias,
+    upsert,
+)
+
+# Data files of a NumpyBackend collection, with their generation if it is not the first
+DATA_FILE_PATTERN = re.compile(
+    r"(?:vectors|payloads|offsets)(?:\.(\d+))?\.(?:f32|jsonl|npy)"
+)
+
+
+class RetrievalBackend(ABC):
+    """Storage and search of law article vectors used by the app and the indexer."""
+
+    # Whether `upsert` may be called from several threads at once
+    parallel_upserts: bool = True
+
+    @abstractmethod
+    def create_collection(
+        self, name: str, vector_size: int = 1536, distance: Distance = Distance.COSINE
+    ) -> bool:
+        """Create an empty collection, replacing an existing one with the same name."""
+
+    @abstractmethod
+    def delete_collection(self, name: str) -> bool:
+        """Delete a collection together with the aliases pointing to it."""
+
+    @abstractmethod
+    def list_collections(self) -> List[str]:
+        """Names of all collections, without aliases."""
+
+    @abstractmethod
+    def get_alias(self, alias: str) -> Optional[str]:
+        """Collection the alias points to, or None if the alias does not exist."""
+
+    @abstractmethod
+    def switch_alias(self, alias: str, collection: str) -> None:
+        """
+        Atomically point an alias to a collection.
+
+        All other methods accept an alias in place of a collection name.
+        """
+
+    @abstractmethod
+    def upsert(self, collection: str, points: List[PointStruct]) -> None:
+        """Insert points, replacing existing points with the same ids."""
+
+    @abstractmethod
+    def delete(self, collection: str, ids: List[Union[int, str]]) -> None:
+        """Delete the points with the given ids, ignoring ids that do not exist."""
+
+    @abstractmethod
+    def count(self, collection: str) -> int:
+        """Number of points in a collection."""
+
+    @abstractmethod
+    def search(
+        self,
+        collection: str,
+        query_vector: Union[list, tuple, np.ndarray],
+        limit: int = 10,
+        with_vectors: bool = False,
+    ) -> List[ScoredPoint]:
+        """Return the `limit` points closest to the query vector."""
+
+    def search_collections(
+        self,
+        collections: List[str],
+        query_vector: Union[list, tuple, np.ndarray],
+        limit: int = 10,
+        with_vectors: bool = False,
+    ) -> List[ScoredPoint]:
+        """Search several collections and merge the results by descending score."""
+        search_results = [
+            point
+            for collection in collections
+            for point in self.search(
+                collection=collection,
+                query_vector=query_vector,
+                limit=limit,
+                with_vectors=with_vectors,
+            )
+        ]
+        return sorted(search_results, key=lambda x: x.score, reverse=True)
+
+
+class QdrantBackend(RetrievalBackend):
+    """
+    Backend that stores the collections in Qdrant.
+
+    Args:
+        client (QdrantClient): Client of a Qdrant server or of the local mode.
+        local (bool): Whether the client runs Qdrant in local mode, in memory or on
+            disk, which is not safe for concurrent writes.
+    """
+
+    def __init__(self, client: QdrantClient, local: bool = False) -> None:
+        self.client = client
+        self.local = local
+        self.parallel_upserts = not local
+
+    def create_collection(
+        self, name: str, vector_size: int = 1536, distance: Distance = Distance.COSINE
+    ) -> bool:
+        return create_collection(
+            client=self.client, name=name, vector_size=vector_size, distance=distance
+        )
+
+    def delete_collection(self, name: str) -> bool:
+        return delete_collection(client=self.client, collection=name)
+
+    def list_collections(self) -> List[str]:
+        return list_collections(client=self.client)
+
+    def get_alias(self, alias: str) -> Optional[str]:
+        return get_alias(client=self.client, alias=alias)
+
+    def switch_alias(self, alias: str, collection: str) -> None:
+        switch_alias(client=self.client, alias=alias, collection=collection)
+
+    def upsert(self, collection: str, points: List[PointStruct]) -> None:
+        upsert(client=self.client, collection=collection, points=points)
+
+    def delete(self, collection: str, ids: List[Union[int, str]]) -> None:
+        if self.local:
+            # The local mode raises on unknown ids, a Qdrant server ignores them
+            existing = self.client.retrieve(
+                collection_name=collection, ids=ids, with_payload=False
+            )
+            ids = [point.id for point in existing]
+        if ids:
+            delete_points(client=self.client, collection=collection, ids=ids)
+
+    def count(self, collection: str) -> int:
+        return get_count(client=self.client, collection=collection)
+
+    def search(
+        self,
+        collection: str,
+        query_vector: Union[list, tuple, np.ndarray],
+        limit: int = 10,
+        with_vectors: bool = False,
+    ) -> List[ScoredPoint]:
+        return search(
+            client=self.client,
+            collection=collection,
+            query_vector=query_vector,
+            limit=limit,
+            with_vectors=with_vectors,
+        )
+
+    def search_collections(
+        self,
+        collections: List[str],
+        query_vector: Union[list, tuple, np.ndarray],
+        limit: int = 10,
+        with_vectors: bool = False,
+    ) -> List[ScoredPoint]:
+        # Every search is a network round-trip, so fan out over threads
+        return search_collections(
+            client=self.client,
+            collections=collections,
+            query_vector=query_vector,
+            limit=limit,
+            with_vectors=with_vectors,
+        )
+
+
+class NumpyBackend(RetrievalBackend):
+    """
+    In-process exact search over memory-mapped float32 matrices.
+
+    Every collection is a directory with:
+    - `meta.json`: vector size, distance and the generation of the data files,
+    - `vectors.f32`: row-major float32 matrix, normalized for cosine distance,
+    - `payloads.jsonl`: one `{"id": ..., "payload": ...}` record per row,
+    - `offsets.npy`: byte offset of every record in `payloads.jsonl`.
+    The data files of later generations carry it in their name, e.g. `vectors.2.f32`.
+
+    Aliases are kept in `aliases.json` next to the collections and replaced atomically,
+    so an app process picks up a switched alias on its next search.
+
+    Collections are written for readers in other processes, e.g. the app while the
+    indexer runs. New points are appended to the data files before the offsets are
+    replaced atomically, so a reader never sees rows that are not fully written.
+    Replacing or deleting points writes a new generation of the data files and then
+    switches `meta.json` to it. Readers reload a collection when `meta.json` or the
+    offsets were replaced, and keep the files they loaded open until then.
+
+    Searching is a single matrix-vector product over the memory-mapped matrix and an
+    `argpartition` for the top results, so only the payloads of the returned points
+    are read and parsed.
+
+    Args:
+        path (Union[str, Path]): Directory holding one subdirectory per collection.
+    """
+
+    parallel_upserts = False
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._collections: Dict[str, Dict] = {}
+        self._aliases: Dict[str, str] = {}
+        self._aliases_version = None
+
+    def create_collection(
+        self, name: str, vector_size: int = 1536, distance: Distance = Distance.COSINE
+    ) -> bool:
+        if distance not in (Distance.COSINE, Distance.DOT):
+            raise ValueError(f"Distance {distance} is not supported by NumpyBackend.")
+        logger.info(f'Creating collection: "{name}" with vector size: {vector_size}.')
+        directory = self.path / name
+        if directory.exists():
+            shutil.rmtree(directory)
+        directory.mkdir(parents=True)
+        paths = self._paths(directory, generation=0)
+        paths["vectors"].touch()
+        paths["payloads"].touch()
+        np.save(paths["offsets"], np.zeros(0, dtype=np.int64))
+        self._write_meta(
+            directory,
+            {"vector_size": vector_size, "distance": distance.value, "generation": 0},
+        )
+        self._collections.pop(name, None)
+        return True
+
+    def delete_collection(self, name: str) -> bool:
+        logger.info(f'Deleting collection: "{name}".')
+        directory = self.path / name
+        if not directory.is_dir():
+            return False
+        shutil.rmtree(directory)
+        self._collections.pop(name, None)
+        aliases = self._read_aliases()
+        self._write_aliases(
+            {alias: target for alias, target in aliases.items() if target != name}
+        )
+        return True
+
+    def list_collections(self) -> List[str]:
+        return sorted(path.name for path in self.path.iterdir() if path.is_dir())
+
+    def get_alias(self, alias: str) -> Optional[str]:
+        return self._read_aliases().get(alias)
+
+    def switch_alias(self, alias: str, collection: str) -> None:
+        if not (self.path / collection).is_dir():
+            raise ValueError(f'Collection "{collection}" does not exist.')
+        if (self.path / alias).is_dir():
+            raise ValueError(f'Alias "{alias}" is already a collection name.')
+        logger.info(f'Pointing alias "{alias}" to collection "{collection}".')
+        self._write_aliases({**self._read_aliases(), alias: collection})
+
+    def upsert(self, collection: str, points: List[PointStruct]) -> None:
+        if not points:
+            return
+        collection = self._resolve(collection)
+        data = self._load(collection)
+        vectors = np.asarray([point.vector for point in points], dtype=np.float32)
+        if data["distance"] == Distance.COSINE.value:
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        records = [{"id": point.id, "payload": point.payload} for point in points]
+
+        rows = self._ids(data)
+        ids = [record["id"] for record in records]
+        if len(set(ids)) < len(ids) or any(id in rows for id in ids):
+            self._rewrite(collection, data, vectors, records)
+        else:
+            self._append(collection, data, vectors, records)
+        self._collections.pop(collection, None)
+
+    def delete(self, collection: str, ids: List[Union[int, str]]) -> None:
+        collection = self._resolve(collection)
+        data = self._load(collection)
+        rows = self._ids(data)
+        removed = {rows[id] for id in ids if id in rows}
+        if not removed:
+            return
+        keep = np.asarray([row not in removed for row in range(len(data["offsets"]))])
+        records = [
+            record for row, record in enumerate(self._records(data)) if keep[row]
+        ]
+        vectors = np.array(data["vectors"])[keep]
+        self._write(self.path / collection, data, vectors, records)
+        self._collections.pop(collection, None)
+
+    def count(self, collection: str) -> int:
+        return len(self._load(self._resolve(collection))["offsets"])
+
+    def search(
+        self,
+        collection: str,
+        query_vector: Union[list, tuple, np.ndarray],
+        limit: int = 10,
+        with_vectors: bool = False,
+    ) -> List[ScoredPoint]:
+        collection = self._resolve(collection)
+        data = self._load(collection)
+        vectors = data["vectors"]
+        if len(vectors) == 0:
+            return []
+
+        query = np.asarray(query_vector, dtype=np.float32)
+        if data["distance"] == Distance.COSINE.value:
+            query = query / max(np.linalg.norm(query), 1e-12)
+        scores = vectors @ query
+
+        limit = min(limit, len(scores))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        search_results = []
+        file = data["payloads"]
+        with data["lock"]:
+            for row in top:
+                file.seek(int(data["offsets"][row]))
+                record = json.loads(file.readline())
+                search_results.append(
+                    ScoredPoint(
+                        id=record["id"],
+                        version=0,
+                        score=float(scores[row]),
+                        payload=record["payload"],
+                        vector=vectors[row].tolist() if with_vectors else None,
+                    )
+                )
+        return search_results
+
+    def _read_aliases(self) -> Dict[str, str]:
+        """Read the aliases again only when another process has replaced the file."""
+        path = self.path / "aliases.json"
+        # Every write replaces the file, so a new inode also marks a change
+        stat = path.stat() if path.exists() else None
+        version = (stat.st_ino, stat.st_mtime_ns) if stat else None
+        if version != self._aliases_version:
+            if version is None:
+                self._aliases = {}
+            else:
+                with open(path, "r", encoding="utf-8") as file:
+                    self._aliases = json.load(file)
+            self._aliases_version = version
+        return self._aliases
+
+    def _write_aliases(self, aliases: Dict[str, str]) -> None:
+        temp_path = self.path / "aliases.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(aliases, file)
+        os.replace(temp_path, self.path / "aliases.json")
+
+    def _resolve(self, collection: str) -> str:
+        return self._read_aliases().get(collection, collection)
+
+    @staticmethod
+    def _paths(directory: Path, generation: int) -> Dict[str, Path]:
+        """Data files of a generation, the first one has no generation in its names."""
+        suffix = f".{generation}" if generation else ""
+        return {
+            "vectors": directory / f"vectors{suffix}.f32",
+            "payloads": directory / f"payloads{suffix}.jsonl",
+            "offsets": directory / f"offsets{suffix}.npy",
+        }
+
+    @staticmethod
+    def _file_version(path: Path) -> Optional[Tuple[int, int]]:
+        # Every write replaces the file, so a new inode also marks a change
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _version(self, directory: Path, generation: int) -> Tuple:
+        return (
+            self._file_version(directory / "meta.json"),
+            self._file_version(self._paths(directory, generation)["offsets"]),
+        )
+
+    def _load(self, collection: str) -> Dict:
+        """Memory-map a collection and keep it until a write replaces its files."""
+        directory = self.path / collection
+        data = self._collections.get(collection)
+        if data is not None and data["version"] == self._version(
+            directory, data["generation"]
+        ):
+            return data
+        for attempt in range(3):
+            if not (directory / "meta.json").exists():
+                raise ValueError(f'Collection "{collection}" does not exist.')
+            try:
+                data = self._open(directory)
+                break
+            except FileNotFoundError:
+                # Another process switched to a new generation while we were reading
+                if attempt == 2:
+                    raise
+        self._collections[collection] = data
+        return data
+
+    def _open(self, directory: Path) -> Dict:
+        # Taken before reading, a write in between only causes another reload
+        meta_version = self._file_version(directory / "meta.json")
+        with open(directory / "meta.json", "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        generation = meta.get("generation", 0)
+        paths = self._paths(directory, generation)
+        version = (meta_version, self._file_version(paths["offsets"]))
+        offsets = np.load(paths["offsets"])
+        vectors = (
+            np.memmap(
+                paths["vectors"],
+                dtype=np.float32,
+                mode="r",
+                shape=(len(offsets), meta["vector_size"]),
+            )
+            if len(offsets)
+            else np.zeros((0, meta["vector_size"]), dtype=np.float32)
+        )
+        return dict(
+            meta,
+            generation=generation,
+            version=version,
+            vectors=vectors,
+            offsets=offsets,
+            # Kept open, the loaded generation stays readable after it is replaced
+            payloads=open(paths["payloads"], "rb"),
+            lock=threading.Lock(),
+            rows=None,
+        )
+
+    def _records(self, data: Dict) -> List[Dict]:
+        """All records of the loaded rows, without any appended after loading."""
+        with data["lock"]:
+            data["payloads"].seek(0)
+            return [
+                json.loads(line)
+                for line in itertools.islice(data["payloads"], len(data["offsets"]))
+            ]
+
+    def _ids(self, data: Dict) -> Dict:
+        """Map point ids to rows, read lazily because only upserts need it."""
+        if data["rows"] is None:
+            data["rows"] = {
+                record["id"]: row for row, record in enumerate(self._records(data))
+            }
+        return data["rows"]
+
+    def _append(
+        self, collection: str, data: Dict, vectors: np.ndarray, records: List[Dict]
+    ) -> None:
+        directory = self.path / collection
+        paths = self._paths(directory, data["generation"])
+        with open(paths["vectors"], "ab") as file:
+            file.write(vectors.tobytes())
+        offsets = []
+        with open(paths["payloads"], "ab") as file:
+            for record in records:
+                offsets.append(file.tell())
+                file.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+                file.write(b"\n")
+        # Replaced last, readers only see the new rows once they are written
+        self._replace_offsets(
+            paths["offsets"],
+            np.concatenate([data["offsets"], np.asarray(offsets, dtype=np.int64)]),
+        )
+
+    def _rewrite(
+        self, collection: str, data: Dict, vectors: np.ndarray, records: List[Dict]
+    ) -> None:
+        """Replace existing points and append the new ones, as a new generation."""
+        all_vectors = np.array(data["vectors"])
+        all_records = self._records(data)
+
+        num_existing = len(all_records)
+        new_vectors, new_records = [], []
+        for vector, record in zip(vectors, records):
+            row = data["rows"].get(record["id"])
+            if row is None:
+                data["rows"][record["id"]] = num_existing + len(new_records)
+                new_vectors.append(vector)
+                new_records.append(record)
+            elif row < num_existing:
+                all_vectors[row] = vector
+                all_records[row] = record
+            else:
+                new_vectors[row - num_existing] = vector
+                new_records[row - num_existing] = record
+        if new_vectors:
+            all_vectors = np.concatenate([all_vectors, np.stack(new_vectors)])
+        all_records.extend(new_records)
+        self._write(self.path / collection, data, all_vectors, all_records)
+
+    def _write(
+        self, directory: Path, data: Dict, vectors: np.ndarray, records: List[Dict]
+    ) -> None:
+        """Write all rows as a new generation of the data files and switch to it."""
+        generation = data["generation"] + 1
+        paths = self._paths(directory, generation)
+        vectors.astype(np.float32).tofile(paths["vectors"])
+        offsets = []
+        with open(paths["payloads"], "wb") as file:
+            for record in records:
+                offsets.append(file.tell())
+                file.write(json.dumps(record, ensure_ascii=False).encode("utf-8"))
+                file.write(b"\n")
+        self._replace_offsets(paths["offsets"], np.asarray(offsets, dtype=np.int64))
+        self._write_meta(
+            directory,
+            {
+                "vector_size": data["vector_size"],
+                "distance": data["distance"],
+                "generation": generation,
+            },
+        )
+        # Readers that loaded an older generation keep their open files
+        for path in directory.iterdir():
+            match = DATA_FILE_PATTERN.fullmatch(path.name)
+            if match and int(match.group(1) or 0) != generation:
+                try:
+                    path.unlink()
+                except OSError:
+                    # Windows does not delete open files, the next write retries
+                    pass
+
+    @staticmethod
+    def _replace_offsets(path: Path, offsets: np.ndarray) -> None:
+        temp_path = path.with_name(path.name + ".tmp")
+        with open(temp_path, "wb") as file:
+            np.save(file, offsets)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def _write_meta(directory: Path, meta: Dict) -> None:
+        temp_path = directory / "meta.json.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(temp_path, directory / "meta.json")
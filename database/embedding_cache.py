@@ -0,0 +1,142 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+from loguru import logger
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different spellings share a cache entry."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for query embeddings.
+
+    The first tier is an in-process LRU dictionary, the second an optional SQLite
+    store that survives restarts and is shared by every process using the same file.
+    Entries are keyed on the embedding model, the dimensions and the normalized text.
+    Vectors are kept as float32 in both tiers. All methods are thread safe, so one
+    instance can be shared by every Streamlit session.
+
+    Args:
+        max_size (int): Maximum number of embeddings kept in memory.
+        path (Union[str, Path], optional): SQLite file for the on-disk tier. If not set,
+            only the in-memory tier is used.
+        max_disk_size (int): Maximum number of embeddings kept on disk. The least
+            recently used rows are evicted first.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        path: Optional[Union[str, Path]] = None,
+        max_disk_size: int = 100_000,
+    ) -> None:
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        self._connection = None
+        if path is not None:
+            path = Path(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self._connection.commit()
+            logger.info(f'Embedding cache persisted to: "{path}".')
+
+    @staticmethod
+    def make_key(text: str, model: str, dimensions: int) -> str:
+        raw_key = f"{model}\x1f{dimensions}\x1f{normalize_text(text)}"
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, model: str, dimensions: int) -> Optional[List[float]]:
+        """Return the cached embedding or None if it is not cached."""
+        key = self.make_key(text=text, model=model, dimensions=dimensions)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return vector.tolist()
+
+            if self._connection is not None:
+                row = self._connection.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._connection.execute(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+                    self._connection.commit()
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    self._counters["disk_hits"] += 1
+                    return vector.tolist()
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(
+        self, text: str, model: str, dimensions: int, embedding: List[float]
+    ) -> None:
+        """Store an embedding in both tiers."""
+        key = self.make_key(text=text, model=model, dimensions=dimensions)
+        vector = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+            if self._connection is not None:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                    "VALUES (?, ?, ?)",
+                    (key, vector.tobytes(), time.time()),
+                )
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_used DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_disk_size,),
+                )
+                self._connection.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the current size of each tier."""
+        with self._lock:
+            stats = dict(self._counters, memory_size=len(self._memory))
+            if self._connection is not None:
+                stats["disk_size"] = self._connection.execute(
+                    "SELECT COUNT(*) FROM embeddings"
+                ).fetchone()[0]
+        return stats
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._connection is not None:
+                self._connection.execute("DELETE FROM embeddings")
+                self._connection.commit()
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        """Insert into the in-memory LRU, evicting the least recently used entry."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from loguru import logger
+
+
+class ArticleDiff(NamedTuple):
+    changed: List[str]  # keys of new or modified articles
+    removed: List[str]  # keys of articles no longer in the law
+    unchanged: int
+
+
+def article_key(article: Dict) -> str:
+    """Identify an article within its law by title and link."""
+    return f"{article['title']}|{article['link']}"
+
+
+def article_hash(article: Dict, model: str) -> str:
+    """Hash everything that ends up in the embedding request or the payload."""
+    content = json.dumps(
+        [model, article["title"], article["link"], article["texts"]],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def point_id(law: str, key: str) -> str:
+    """Stable point id of an article, so a changed article replaces its old point."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{law}/{key}"))
+
+
+def load_manifest(path: Path) -> Optional[Dict]:
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_manifest(path: Path, manifest: Dict) -> None:
+    """Write the manifest atomically, so an interrupted write cannot corrupt it."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, ensure_ascii=False)
+    os.replace(temp_path, path)
+
+
+def hash_articles(articles: List[Dict], model: str) -> Dict[str, str]:
+    """Map the key of every article to its content hash."""
+    hashes = {}
+    for article in articles:
+        key = article_key(article)
+        if key in hashes:
+            logger.warning(f'Duplicate article "{key}", keeping the last one.')
+        hashes[key] = article_hash(article, model)
+    return hashes
+
+
+def diff_articles(current: Dict[str, str], previous: Dict[str, str]) -> ArticleDiff:
+    """Compare the article hashes of the scraped law with the indexed ones."""
+    changed = [key for key, value in current.items() if previous.get(key) != value]
+    removed = [key for key in previous if key not in current]
+    return ArticleDiff(
+        changed=changed, removed=removed, unchanged=len(current) - len(changed)
+    )
@@ -0,0 +1,199 @@
+"""
+Token counting shared by the app, the embedding preparation and the request processor.
+
+Encodings are resolved once per model or encoding name and reused. Many texts are
+counted with `encode_batch`, which tokenizes in threads outside the GIL. Large
+request files can be pre-counted in a process pool with `add_token_counts`, which
+stores the count of every request under `token_consumption`, so the request
+processor does not tokenize anything while it dispatches.
+
+Usage:
+```
+python -m database.tokenizer --requests_filepath database/to_process/zakon_o_radu.jsonl --processes 4
+```
+"""
+
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import tiktoken
+from loguru import logger
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> tiktoken.Encoding:
+    """Returns the tiktoken encoding for a model, resolved only once per model."""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        logger.info("Warning: model not found. Using cl100k_base encoding.")
+        return get_encoding_by_name("cl100k_base")
+
+
+@lru_cache(maxsize=None)
+def get_encoding_by_name(encoding_name: str) -> tiktoken.Encoding:
+    """Returns a tiktoken encoding by name, e.g. "cl100k_base", resolved only once."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+def num_tokens_from_string(string: str, model: str) -> int:
+    """Returns the number of tokens in a text string."""
+    return len(get_encoding(model).encode(string))
+
+
+def num_tokens_from_strings(
+    strings: Sequence[str], encoding: tiktoken.Encoding, num_threads: int = 8
+) -> List[int]:
+    """Returns the number of tokens of every string, tokenized in parallel threads."""
+    if len(strings) < 2:
+        return [len(encoding.encode(string)) for string in strings]
+    tokens = encoding.encode_batch(list(strings), num_threads=num_threads)
+    return [len(string_tokens) for string_tokens in tokens]
+
+
+def num_tokens_consumed_from_request(
+    request_json: dict,
+    api_endpoint: str,
+    token_encoding_name: str,
+) -> int:
+    """Count the number of tokens in the request. Only supports completion and embedding requests."""
+    encoding = get_encoding_by_name(token_encoding_name)
+    # if completions request, tokens = prompt + n * max_tokens
+    if api_endpoint.endswith("completions"):
+        max_tokens = request_json.get("max_tokens", 15)
+        n = request_json.get("n", 1)
+        completion_tokens = n * max_tokens
+
+        # chat completions
+        if api_endpoint.startswith("chat/"):
+            num_tokens = 0
+            for message in request_json["messages"]:
+                num_tokens += 4  # every message follows <im_start>{role/name}\n{content}<im_end>\n
+                for key, value in message.items():
+                    num_tokens += len(encoding.encode(value))
+                    if key == "name":  # if there's a name, the role is omitted
+                        num_tokens -= 1  # role is always required and always 1 token
+            num_tokens += 2  # every reply is primed with <im_start>assistant
+            return num_tokens + completion_tokens
+        # normal completions
+        else:
+            prompt = request_json["prompt"]
+            if isinstance(prompt, str):  # single prompt
+                prompt_tokens = len(encoding.encode(prompt))
+                num_tokens = prompt_tokens + completion_tokens
+                return num_tokens
+            elif isinstance(prompt, list):  # multiple prompts
+                prompt_tokens = sum(num_tokens_from_strings(prompt, encoding))
+                num_tokens = prompt_tokens + completion_tokens * len(prompt)
+                return num_tokens
+            else:
+                raise TypeError(
+                    'Expecting either string or list of strings for "prompt" field in completion request'
+                )
+    # if embeddings request, tokens = input tokens
+    elif api_endpoint == "embeddings":
+        input = request_json["input"]
+        if isinstance(input, str):  # single input
+            num_tokens = len(encoding.encode(input))
+            return num_tokens
+        elif isinstance(input, list):  # multiple inputs
+            num_tokens = sum(num_tokens_from_strings(input, encoding))
+            return num_tokens
+        else:
+            raise TypeError(
+                'Expecting either string or list of strings for "inputs" field in embedding request'
+            )
+    # more logic needed to support other API calls (e.g., edits, inserts, DALL-E)
+    else:
+        raise NotImplementedError(
+            f'API endpoint "{api_endpoint}" not implemented in this script'
+        )
+
+
+def _count_lines(
+    lines: List[str], api_endpoint: str, token_encoding_name: str
+) -> List[str]:
+    """Add the token count to every request line without one. Runs in a worker."""
+    counted = []
+    for line in lines:
+        request_json = json.loads(line)
+        if "token_consumption" not in request_json:
+            request_json["token_consumption"] = num_tokens_consumed_from_request(
+                request_json, api_endpoint, token_encoding_name
+            )
+            line = json.dumps(request_json) + "\n"
+        counted.append(line)
+    return counted
+
+
+def add_token_counts(
+    requests_filepath: Path,
+    api_endpoint: str = "embeddings",
+    token_encoding_name: str = "cl100k_base",
+    processes: Optional[int] = None,
+    chunk_size: int = 1000,
+) -> None:
+    """
+    Store the token count of every request of a JSONL file under `token_consumption`.
+
+    The request processor reads the count instead of tokenizing the request. Requests
+    that are already counted are kept as they are. The file is rewritten atomically.
+
+    Args:
+        requests_filepath (Path): Requests file of the request processor.
+        api_endpoint (str): Endpoint the requests are sent to, e.g. "embeddings".
+        token_encoding_name (str): The name of the token encoding.
+        processes (Optional[int]): Number of worker processes. With 1, the requests
+            are counted in this process. Defaults to the number of CPUs.
+        chunk_size (int): Number of lines sent to a worker at a time.
+    """
+    processes = processes or os.cpu_count() or 1
+    temp_filepath = requests_filepath.with_suffix(".tmp")
+    with open(requests_filepath, "r", encoding="utf-8") as requests_file, open(
+        temp_filepath, "w", encoding="utf-8"
+    ) as output_file:
+        chunks = iter(lambda: list(itertools.islice(requests_file, chunk_size)), [])
+        if processes == 1:
+            for chunk in chunks:
+                output_file.writelines(
+                    _count_lines(chunk, api_endpoint, token_encoding_name)
+                )
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as executor:
+                while True:
+                    # a few chunks per worker at a time, never the whole file
+                    window = list(itertools.islice(chunks, 2 * processes))
+                    if not window:
+                        break
+                    for counted in executor.map(
+                        _count_lines,
+                        window,
+                        itertools.repeat(api_endpoint),
+                        itertools.repeat(token_encoding_name),
+                    ):
+                        output_file.writelines(counted)
+    os.replace(temp_filepath, requests_filepath)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pre-count the tokens of a request file for the request processor."
+    )
+    parser.add_argument("--requests_filepath", type=Path, required=True)
+    parser.add_argument("--api_endpoint", type=str, default="embeddings")
+    parser.add_argument("--token_encoding_name", type=str, default="cl100k_base")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    add_token_counts(
+        requests_filepath=args.requests_filepath,
+        api_endpoint=args.api_endpoint,
+        token_encoding_name=args.token_encoding_name,
+        processes=args.processes,
+    )
@@ -1,18 +1,27 @@
+import asyncio
+import itertools
 import json
-import subprocess
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Union
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
 
 import numpy as np
-import tiktoken
 from langfuse.decorators import observe
 from langfuse.openai import openai
 from loguru import logger
+from openai import NOT_GIVEN
 from openai.types import CreateEmbeddingResponse
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
     Distance,
     Filter,
+    PointIdsList,
     PointStruct,
     ScoredPoint,
     UpdateResult,
@@ -20,6 +29,15 @@ from qdrant_client.http.models import (
 )
 from tqdm.auto import tqdm
 
+from database.tokenizer import (
+    get_encoding,
+    num_tokens_from_string,
+    num_tokens_from_strings,
+)
+
+if TYPE_CHECKING:
+    from database.api_request_parallel_processor import StatusTracker
+
 
 def create_collection(
     client: QdrantClient,
@@ -42,6 +60,33 @@ def delete_collection(
     return client.delete_collection(collection_name=collection, timeout=timeout)
 
 
+def list_collections(client: QdrantClient) -> List[str]:
+    return [collection.name for collection in client.get_collections().collections]
+
+
+def get_alias(client: QdrantClient, alias: str) -> Optional[str]:
+    """Return the collection an alias points to, or None if the alias does not exist."""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def switch_alias(client: QdrantClient, alias: str, collection: str) -> bool:
+    """Point an alias to a collection, replacing its old target in one request."""
+    logger.info(f'Pointing alias "{alias}" to collection "{collection}".')
+    operations = [
+        CreateAliasOperation(
+            create_alias=CreateAlias(collection_name=collection, alias_name=alias)
+        )
+    ]
+    if get_alias(client=client, alias=alias) is not None:
+        operations.insert(
+            0, DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias))
+        )
+    return client.update_collection_aliases(change_aliases_operations=operations)
+
+
 def get_collection_info(client: QdrantClient, collection: str) -> Dict:
     return client.get_collection(collection_name=collection)
 
@@ -55,19 +100,19 @@ def upsert(
     collection: str,
     points: List[PointStruct],
 ) -> UpdateResult:
-    """Upsert data points into a Qdrant collection."""
-    return client.upsert(collection_name=collection, points=points)
+    """Upsert data points into a Qdrant collection and wait until they are applied."""
+    return client.upsert(collection_name=collection, points=points, wait=True)
 
 
-def num_tokens_from_string(string: str, model: str) -> int:
-    """Returns the number of tokens in a text string."""
-    try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        logger.info("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
+def delete_points(
+    client: QdrantClient, collection: str, ids: List[Union[int, str]]
+) -> UpdateResult:
+    """Delete data points by id from a Qdrant collection."""
+    return client.delete(
+        collection_name=collection,
+        points_selector=PointIdsList(points=ids),
+        wait=True,
+    )
 
 
 def search(
@@ -87,12 +132,66 @@ def search(
     )
 
 
+def search_collections(
+    client: QdrantClient,
+    collections: List[str],
+    query_vector: Union[list, tuple, np.ndarray],
+    limit: int = 10,
+    query_filter: Filter = None,
+    with_vectors: bool = False,
+) -> List[ScoredPoint]:
+    """
+    Search several collections concurrently and merge the results.
+
+    Each collection is queried from its own worker thread, so routing a query to
+    several laws costs one round-trip to Qdrant instead of one per collection.
+
+    Args:
+        client (QdrantClient): Client to interact with Qdrant's API.
+        collections (List[str]): Names of the collections to search.
+        query_vector (Union[list, tuple, np.ndarray]): The query embedding.
+        limit (int): Maximum number of results per collection.
+        query_filter (Filter): Optional filter applied to every collection.
+        with_vectors (bool): Whether to return the stored vectors.
+
+    Returns:
+        List[ScoredPoint]: Results from all collections, sorted by descending score.
+    """
+
+    def search_collection(collection: str) -> List[ScoredPoint]:
+        return search(
+            client=client,
+            collection=collection,
+            query_vector=query_vector,
+            limit=limit,
+            query_filter=query_filter,
+            with_vectors=with_vectors,
+        )
+
+    if len(collections) == 1:
+        search_results = search_collection(collections[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(collections)) as executor:
+            search_results = [
+                point
+                for points in executor.map(search_collection, collections)
+                for point in points
+            ]
+    return sorted(search_results, key=lambda x: x.score, reverse=True)
+
+
 @observe()
-def embed_text(text: Union[str, list], model: str) -> CreateEmbeddingResponse:
+def embed_text(
+    text: Union[str, list], model: str, dimensions: int = None
+) -> CreateEmbeddingResponse:
     """
     Create embeddings using OpenAI API.
     """
-    response = openai.embeddings.create(input=text, model=model)
+    response = openai.embeddings.create(
+        input=text,
+        model=model,
+        dimensions=dimensions if dimensions is not None else NOT_GIVEN,
+    )
     return response
 
 
@@ -103,12 +202,106 @@ def format_context(payload: dict) -> str:
     return text
 
 
-def get_context(search_results: List[ScoredPoint], top_k: int = None) -> str:
+def mmr_rerank(
+    search_results: List[ScoredPoint],
+    query_vector: Union[list, tuple, np.ndarray],
+    top_k: int,
+    lambda_mult: float = 0.7,
+) -> List[ScoredPoint]:
+    """
+    Select a relevant but diverse subset of search results with maximal marginal relevance.
+
+    Uses the vectors returned with the search results, so the search must be run with
+    `with_vectors=True`. All pairwise similarities are computed with one matrix
+    product, and every greedy step only updates a running maximum.
+
+    Args:
+        search_results (List[ScoredPoint]): Search results with vectors.
+        query_vector (Union[list, tuple, np.ndarray]): The query embedding.
+        top_k (int): Number of results to select.
+        lambda_mult (float): Trade-off between relevance (1.0) and diversity (0.0).
+
+    Returns:
+        List[ScoredPoint]: The selected results, in order of selection.
+    """
+    if len(search_results) <= 1:
+        return search_results
+
+    vectors = np.asarray([point.vector for point in search_results], dtype=np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_vector, dtype=np.float32)
+    relevance = vectors @ (query / max(np.linalg.norm(query), 1e-12))
+    similarities = vectors @ vectors.T
+
+    selected = [int(np.argmax(relevance))]
+    max_similarity = similarities[selected[0]].copy()
+    candidates = np.ones(len(search_results), dtype=bool)
+    candidates[selected[0]] = False
+    for _ in range(min(top_k, len(search_results)) - 1):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~candidates] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        candidates[best] = False
+        np.maximum(max_similarity, similarities[best], out=max_similarity)
+    return [search_results[i] for i in selected]
+
+
+def get_context(
+    search_results: List[ScoredPoint],
+    top_k: int = None,
+    token_budget: int = None,
+    model: str = "gpt-4o",
+    score_gap: float = None,
+    min_results: int = 1,
+    keep_order: bool = False,
+) -> str:
+    """
+    Pack the best search results into the context for the chat model.
+
+    Results are taken in order of descending score until one of the limits is hit,
+    or in the order they are given with `keep_order`.
+
+    Args:
+        search_results (List[ScoredPoint]): Search results from one or more collections.
+        top_k (int, optional): Maximum number of results.
+        token_budget (int, optional): Maximum number of context tokens. Results that do
+            not fit are skipped, so a shorter lower-ranked article can still be used.
+        model (str): Model whose tokenizer is used to count the tokens.
+        score_gap (float, optional): Stop at the first drop in score larger than this
+            between consecutive results, as everything after it is much less relevant.
+        min_results (int): Number of results kept regardless of the score gap.
+        keep_order (bool): Keep the order of `search_results`, e.g. the selection
+            order of `mmr_rerank`, instead of sorting them by score.
+
+    Returns:
+        str: The formatted context.
+    """
+    if not keep_order:
+        search_results = sorted(search_results, key=lambda x: x.score, reverse=True)
     if top_k is not None:
-        search_results = sorted(search_results, key=lambda x: x.score, reverse=True)[
-            :top_k
-        ]
-    return "\n".join([format_context(point.payload) for point in search_results])
+        search_results = search_results[:top_k]
+
+    if score_gap is not None:
+        scores = sorted((point.score for point in search_results), reverse=True)
+        for i in range(max(min_results, 1), len(scores)):
+            if scores[i - 1] - scores[i] > score_gap:
+                search_results = [
+                    point for point in search_results if point.score >= scores[i - 1]
+                ]
+                break
+
+    contexts = [format_context(point.payload) for point in search_results]
+    if token_budget is not None:
+        packed, used_tokens = [], 0
+        for context in contexts:
+            # One extra token for the newline joining the contexts
+            num_tokens = num_tokens_from_string(context, model=model) + 1
+            if used_tokens + num_tokens <= token_budget:
+                packed.append(context)
+                used_tokens += num_tokens
+        contexts = packed
+    return "\n".join(contexts)
 
 
 def load_json(path: Path) -> List[Dict]:
@@ -135,108 +328,302 @@ def load_json(path: Path) -> List[Dict]:
 
 
 def prepare_for_embedding(
-    output_path: Path, scraped_data: List[Dict], model: str
+    output_path: Path,
+    scraped_data: List[Dict],
+    model: str,
+    ids: Optional[List[Union[int, str]]] = None,
+    max_inputs: int = 512,
+    max_tokens: int = 100000,
+    max_input_tokens: int = 8191,
 ) -> None:
     """
     Prepare data for embedding and save to a file.
 
+    Articles are packed into multi-input embedding requests of at most `max_inputs`
+    articles and `max_tokens` tokens. The id, title and link of every article are kept
+    in the request metadata, so `split_embedding_results` can map the embeddings back.
+    An article longer than `max_input_tokens` gets a request of its own, so the API
+    error it causes does not fail its neighbours. The token count of every request is
+    stored as well, so the request processor does not tokenize it again.
+
     Args:
         output_path (Path): The path to save the prepared data.
         scraped_data (List[Dict]): The scraped data to be prepared.
         model (str): The embedding model to be used.
+        ids (Optional[List[Union[int, str]]]): Point ids of the articles. Defaults to
+            their position in `scraped_data`.
+        max_inputs (int): Maximum number of articles per request.
+        max_tokens (int): Maximum number of tokens per request.
+        max_input_tokens (int): Maximum number of tokens the model accepts per input.
 
     Returns:
         None
     """
-    jobs = [
-        {
-            "model": model,
-            "id": id,
-            "title": sample["title"],
-            "link": sample["link"],
-            "input": f"{sample['title']}: {' '.join(sample['texts'])}",
-        }
-        for id, sample in enumerate(scraped_data)
+    requests, inputs, articles, num_tokens = [], [], [], 0
+
+    def flush() -> None:
+        nonlocal inputs, articles, num_tokens
+        if inputs:
+            requests.append(
+                {
+                    "model": model,
+                    "input": inputs,
+                    "token_consumption": num_tokens,
+                    "metadata": {"articles": articles},
+                }
+            )
+        inputs, articles, num_tokens = [], [], 0
+
+    texts = [
+        f"{sample['title']}: {' '.join(sample['texts'])}" for sample in scraped_data
     ]
+    for id, sample, text, text_tokens in zip(
+        ids if ids is not None else range(len(scraped_data)),
+        scraped_data,
+        texts,
+        num_tokens_from_strings(texts, get_encoding(model)),
+    ):
+        oversized = text_tokens > max_input_tokens
+        full = len(inputs) == max_inputs or num_tokens + text_tokens > max_tokens
+        if oversized or full:
+            flush()
+        inputs.append(text)
+        articles.append({"id": id, "title": sample["title"], "link": sample["link"]})
+        num_tokens += text_tokens
+        if oversized:
+            flush()
+    flush()
+
     with open(output_path, "w", encoding="utf-8") as file:
-        for job in jobs:
-            json_string = json.dumps(job)
+        for request in requests:
+            json_string = json.dumps(request)
             file.write(json_string + "\n")
 
 
-def get_token_num(text: str, model_name: str) -> int:
+def split_embedding_results(results_path: Path, output_path: Path) -> None:
     """
-    Get the number of tokens in a text for a given model.
+    Split the results of multi-input embedding requests into one line per article.
+
+    Every line of the output holds the article and its embedding, or the errors of
+    its failed request, as `load_and_process_embeddings` expects.
 
     Args:
-        text (str): The input text.
-        model_name (str): The name of the model.
+        results_path (Path): Results of the request processor.
+        output_path (Path): Where to write the per-article results.
+    """
+    with open(output_path, "w", encoding="utf-8") as output_file:
+        for article, embedding, errors in iter_article_embeddings(results_path):
+            # The errors of a failed request are saved instead of a response
+            result = {"data": [{"embedding": embedding}]} if errors is None else errors
+            output_file.write(json.dumps([article, result]) + "\n")
 
-    Returns:
-        int: The number of tokens in the text.
+
+def iter_article_embeddings(
+    results_path: Path,
+) -> Iterator[Tuple[Dict, Optional[List[float]], Optional[List]]]:
+    """
+    Stream the articles of multi-input embedding results.
+
+    Yields:
+        Tuple[Dict, Optional[List[float]], Optional[List]]: The article with its id,
+            title, link and input text, its embedding and, if its request failed or
+            its response has no embedding for it, the errors instead.
+    """
+    with open(results_path, "r", encoding="utf-8") as results_file:
+        for line in results_file:
+            request, response, metadata = json.loads(line)
+            embeddings = (
+                {item["index"]: item["embedding"] for item in response["data"]}
+                if isinstance(response, dict)
+                else {}
+            )
+            for index, (article, text) in enumerate(
+                zip(metadata["articles"], request["input"])
+            ):
+                if index in embeddings:
+                    errors = None
+                elif isinstance(response, list):
+                    errors = response
+                else:
+                    errors = [f"The response has no embedding for input {index}."]
+                yield {**article, "input": text}, embeddings.get(index), errors
+
+
+def metadata_path(embeddings_path: Path) -> Path:
+    """Sidecar holding the articles of the rows of a binary embeddings file."""
+    return embeddings_path.with_suffix(".meta.jsonl")
+
+
+def write_embedding_arrays(
+    results_path: Path, output_path: Path, dtype: str = "float32"
+) -> None:
+    """
+    Write the results of multi-input embedding requests to a binary `.npy` file.
+
+    Row `i` of the array holds the embedding of the article with `"row": i` in the
+    JSON lines sidecar next to it, which also holds the id, title, link and text.
+    Articles of failed requests are listed in the sidecar with their errors and
+    without a row. The results are read twice, first to size the array, so the
+    embeddings are copied into a memory map and never held as Python lists.
+
+    Args:
+        results_path (Path): Results of the request processor.
+        output_path (Path): Where to write the `.npy` file.
+        dtype (str): "float32", or "float16" to halve the size at a small loss of
+            precision.
     """
-    enc = tiktoken.encoding_for_model(model_name)
-    return len(enc.encode(text))
+    num_rows, dimensions = 0, 0
+    for _, embedding, _ in iter_article_embeddings(results_path):
+        if embedding is not None:
+            num_rows += 1
+            dimensions = len(embedding)
+
+    if num_rows:
+        vectors = np.lib.format.open_memmap(
+            output_path, mode="w+", dtype=dtype, shape=(num_rows, dimensions)
+        )
+    else:
+        vectors = np.empty((0, 0), dtype=dtype)  # an empty file cannot be mapped
+    row = 0
+    with open(metadata_path(output_path), "w", encoding="utf-8") as metadata_file:
+        for article, embedding, errors in iter_article_embeddings(results_path):
+            if embedding is not None:
+                vectors[row] = embedding
+                article["row"] = row
+                row += 1
+            else:
+                article["errors"] = errors
+            metadata_file.write(json.dumps(article, ensure_ascii=False) + "\n")
+    if num_rows:
+        vectors.flush()
+    else:
+        np.save(output_path, vectors)
+
+
+def iter_array_points(path: Path, report: "LoadReport") -> Iterator[PointStruct]:
+    """
+    Stream the points of embeddings written by `write_embedding_arrays`.
+
+    The vectors are memory-mapped and the sidecar is read line by line, so only the
+    current point is held in memory.
+    """
+    vectors = np.load(path, mmap_mode="r")
+    with open(metadata_path(path), "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                article = json.loads(line)
+                if article.get("row") is None:
+                    logger.debug(
+                        f"Article {article['id']} was not embedded: {article['errors']}"
+                    )
+                    report.skipped += 1
+                    continue
+                point = PointStruct(
+                    id=article["id"],
+                    vector=vectors[article["row"]].tolist(),
+                    payload={
+                        "title": article["title"],
+                        "text": article["input"],
+                        "link": article["link"],
+                    },
+                )
+            except (json.JSONDecodeError, KeyError, IndexError) as e:
+                logger.debug(f"Malformed line in {metadata_path(path)}: {e!r}")
+                report.malformed += 1
+                continue
+            yield point
+
+
+def embedding_files(embeddings_dir: Path) -> List[Path]:
+    """Embedding files of a directory in either format, without the sidecars."""
+    return sorted(
+        path
+        for path in embeddings_dir.iterdir()
+        if path.suffix == ".npy"
+        or (path.suffix == ".jsonl" and not path.name.endswith(".meta.jsonl"))
+    )
 
 
 def run_api_request_processor(
-    requests_filepath: Path,
-    save_path: Path,
+    request_files: Dict[Path, Path],
     max_requests_per_minute: int = 2500,
     max_tokens_per_minute: int = 900000,
     token_encoding_name: str = "cl100k_base",
     max_attempts: int = 5,
-    logging_level: int = 20,
-) -> None:
+    adaptive_rate_limits: bool = True,
+    max_in_flight: int = 100,
+    status_path: Optional[Path] = None,
+) -> "StatusTracker":
     """
     Run the API request processor to call the OpenAI API in parallel, creating embeddings with the specified model.
 
+    The requests of all files are processed concurrently in this process and share one
+    request and token budget, with a single progress bar and error report. Requests
+    that already succeeded for an existing results file are skipped, so an
+    interrupted run can be resumed. Delete the results file to start over.
+
     Args:
-        requests_filepath (Path): The path to the requests file.
-        save_path (Path): The path to save the results.
+        request_files (Dict[Path, Path]): Maps every requests file to the JSONL file
+            its results are appended to.
         max_requests_per_minute (int): Maximum number of requests per minute.
         max_tokens_per_minute (int): Maximum number of tokens per minute.
         token_encoding_name (str): The name of the token encoding.
         max_attempts (int): Maximum number of attempts for each request.
-        logging_level (int): Logging level.
+        adaptive_rate_limits (bool): Whether to follow the rate limit headers of the
+            API instead of the static limits above.
+        max_in_flight (int): Maximum number of requests sent and not finished yet,
+            which bounds memory and open sockets when responses are slow.
+        status_path (Optional[Path]): JSON file the throughput, latency, retry and
+            queue metrics are written to every 10 seconds while the run lasts.
 
     Returns:
-        None
+        StatusTracker: Counts of succeeded and failed requests, also per results file.
     """
-    if not requests_filepath.exists():
-        logger.error(f"File {requests_filepath} does not exist.")
-        raise FileNotFoundError(f"File {requests_filepath} does not exist.")
-    if save_path.suffix != ".jsonl":
-        logger.error(f"Save path {save_path} must be JSONL.")
-        raise ValueError(f"Save path {save_path} must be JSONL.")
-
-    command = [
-        "python",
-        "database/api_request_parallel_processor.py",
-        "--requests_filepath",
-        requests_filepath,
-        "--save_filepath",
-        save_path,
-        "--request_url",
-        "https://api.openai.com/v1/embeddings",
-        "--max_requests_per_minute",
-        str(max_requests_per_minute),
-        "--max_tokens_per_minute",
-        str(max_tokens_per_minute),
-        "--token_encoding_name",
-        token_encoding_name,
-        "--max_attempts",
-        str(max_attempts),
-        "--logging_level",
-        str(logging_level),
-    ]
-    result = subprocess.run(command, text=True, capture_output=True)
+    # Imported here, so the app, which only queries, does not need aiohttp
+    from database.api_request_parallel_processor import (
+        process_api_requests,
+        read_request_files,
+    )
 
-    if result.returncode == 0:
-        logger.info(f"Embeddings saved to: {save_path}")
-    else:
-        logger.error("Error in Embedding execution!")
-        logger.error("Error:", result.stderr)
+    for requests_filepath, save_path in request_files.items():
+        if not requests_filepath.exists():
+            logger.error(f"File {requests_filepath} does not exist.")
+            raise FileNotFoundError(f"File {requests_filepath} does not exist.")
+        if save_path.suffix != ".jsonl":
+            logger.error(f"Save path {save_path} must be JSONL.")
+            raise ValueError(f"Save path {save_path} must be JSONL.")
+
+    total = 0
+    for requests_filepath in request_files:
+        with open(requests_filepath, "rb") as file:
+            total += sum(1 for _ in file)
+
+    status_tracker = asyncio.run(
+        process_api_requests(
+            requests=read_request_files(
+                {str(path): str(save_path) for path, save_path in request_files.items()}
+            ),
+            request_url="https://api.openai.com/v1/embeddings",
+            api_key=os.environ["OPENAI_API_KEY"],
+            max_requests_per_minute=max_requests_per_minute,
+            max_tokens_per_minute=max_tokens_per_minute,
+            token_encoding_name=token_encoding_name,
+            max_attempts=max_attempts,
+            total=total,
+            adaptive_rate_limits=adaptive_rate_limits,
+            checkpoint=True,
+            max_in_flight=max_in_flight,
+            status_filepath=str(status_path) if status_path is not None else None,
+        )
+    )
+
+    logger.info(
+        f"Embedded {status_tracker.num_tasks_succeeded} / {status_tracker.num_tasks_started} "
+        f"requests of {len(request_files)} files."
+    )
+    for save_path, num_failed in status_tracker.failed_by_file.items():
+        logger.error(f"{num_failed} requests failed, errors saved to: {save_path}")
+    return status_tracker
 
 
 # Eliminate this or make it more general
@@ -248,17 +635,28 @@ def validate_path(path: Path) -> None:
 
 
 def create_embeddings(
-    scraped_dir: Path, to_process_dir: Path, embeddings_dir: Path, model: str
+    scraped_dir: Path,
+    to_process_dir: Path,
+    embeddings_dir: Path,
+    model: str,
+    resume: bool = False,
+    embedding_format: str = "jsonl",
 ) -> None:
     """
     Embed scraped law files by preparing the data and running the request processor
     to call the OpenAI API in parallel, creating embeddings with the specified model.
+    All files are embedded in a single processor run that shares the rate limits.
+    Live metrics of the run are written to `status.json` in `to_process_dir`.
 
     Args:
         scraped_dir (Path): Directory to the law files.
         to_process_dir (Path): Directory to process files.
         embeddings_dir (Path): Directory for storing embeddings.
         model (str): The embedding model to be used.
+        resume (bool): Whether to keep the results of an interrupted run and only
+            send the requests that did not succeed yet.
+        embedding_format (str): "jsonl" for one JSON line per article, or "float32"
+            or "float16" for a binary `.npy` file with a JSON lines sidecar.
 
      Raises:
         ValueError: If any of the provided paths are invalid.
@@ -268,10 +666,11 @@ def create_embeddings(
     validate_path(to_process_dir)
     validate_path(embeddings_dir)
 
-    scraped_paths = list(scraped_dir.iterdir())
+    scraped_paths = sorted(scraped_dir.glob("*.json"))
 
+    request_files = {}
     for file_path in tqdm(
-        scraped_paths, desc="Embedding scraped files", total=len(scraped_paths)
+        scraped_paths, desc="Preparing scraped files", total=len(scraped_paths)
     ):
         scraped_data = load_json(path=file_path)
 
@@ -281,44 +680,58 @@ def create_embeddings(
             scraped_data=scraped_data,
             model=model,
         )
-
-        processed_filepath = embeddings_dir / requests_filepath.name
-        run_api_request_processor(
-            requests_filepath=requests_filepath, save_path=processed_filepath
+        request_files[requests_filepath] = to_process_dir / (
+            file_path.stem + "_results.jsonl"
         )
 
+    # The request processor appends to its results files
+    if not resume:
+        for results_filepath in request_files.values():
+            results_filepath.unlink(missing_ok=True)
+    run_api_request_processor(
+        request_files=request_files, status_path=to_process_dir / "status.json"
+    )
 
-def load_and_process_embeddings(path: Path) -> List[PointStruct]:
-    """
-    Load embeddings from a JSON lines file and process them into data points.
+    for requests_filepath, results_filepath in request_files.items():
+        jsonl_path = embeddings_dir / requests_filepath.name
+        npy_path = jsonl_path.with_suffix(".npy")
+        # Remove the other format, so a law is not indexed from stale embeddings
+        if embedding_format == "jsonl":
+            npy_path.unlink(missing_ok=True)
+            metadata_path(npy_path).unlink(missing_ok=True)
+            split_embedding_results(
+                results_path=results_filepath, output_path=jsonl_path
+            )
+        else:
+            jsonl_path.unlink(missing_ok=True)
+            write_embedding_arrays(
+                results_path=results_filepath,
+                output_path=npy_path,
+                dtype=embedding_format,
+            )
 
-    Args:
-        path (Path): The path to the JSON lines file containing embeddings.
 
-    Returns:
-        List[PointStruct]: A list of PointStruct objects containing the processed data.
+@dataclass
+class LoadReport:
+    """Counts of the records read by `iter_embedding_batches`."""
+
+    loaded: int = 0  # points yielded
+    skipped: int = 0  # articles whose embedding request failed
+    malformed: int = 0  # lines that could not be parsed or lack a field
 
-    Raises:
-        FileNotFoundError: If the file does not exist.
-        IOError: If there is an error reading the file.
-        json.JSONDecodeError: If there is an error parsing the JSON.
-    """
-    if not path.exists():
-        logger.error(f"File: {path} does not exist.")
-        raise FileNotFoundError(f"File: {path} does not exist.")
 
-    try:
-        with open(path, "r", encoding="utf-8") as file:
-            embedding_data = [json.loads(line) for line in file]
-    except (IOError, json.JSONDecodeError) as e:
-        logger.error(f"Error reading or parsing file: {e}")
-        raise
-
-    points = []
-    for item in embedding_data:
-        try:
-            points.append(
-                PointStruct(
+def iter_jsonl_points(path: Path, report: LoadReport) -> Iterator[PointStruct]:
+    """Stream the points of a JSON lines embeddings file, parsing one line at a time."""
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                item = json.loads(line)
+                if isinstance(item[1], list):
+                    # Failed requests are saved with their errors instead of a response
+                    logger.debug(f"Skipping a failed request in {path}: {item[1]}")
+                    report.skipped += 1
+                    continue
+                point = PointStruct(
                     id=item[0]["id"],
                     vector=item[1]["data"][0]["embedding"],
                     payload={
@@ -327,8 +740,71 @@ def load_and_process_embeddings(path: Path) -> List[PointStruct]:
                         "link": item[0]["link"],
                     },
                 )
-            )
-        except KeyError as e:
-            logger.error(f"Missing key in embedded data: {e}")
-            continue
-    return points
+            except (json.JSONDecodeError, KeyError, IndexError, TypeError) as e:
+                logger.debug(f"Malformed line in {path}: {e!r}")
+                report.malformed += 1
+                continue
+            yield point
+
+
+def iter_embedding_batches(
+    path: Path, batch_size: int = 256, report: Optional[LoadReport] = None
+) -> Iterator[List[PointStruct]]:
+    """
+    Stream the points of an embeddings file in batches of a fixed size.
+
+    Records are parsed lazily, so memory stays flat however large the file is.
+    Articles of failed requests and malformed lines are skipped, counted in
+    `report` and summarized once the file is exhausted.
+
+    Args:
+        path (Path): JSON lines file, or `.npy` file with its sidecar.
+        batch_size (int): Number of points per batch, the last batch may be smaller.
+        report (Optional[LoadReport]): Filled with the counts while iterating.
+
+    Yields:
+        List[PointStruct]: The next batch of points.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    if not path.exists():
+        logger.error(f"File: {path} does not exist.")
+        raise FileNotFoundError(f"File: {path} does not exist.")
+    report = report if report is not None else LoadReport()
+    points = (
+        iter_array_points(path, report)
+        if path.suffix == ".npy"
+        else iter_jsonl_points(path, report)
+    )
+
+    while True:
+        batch = list(itertools.islice(points, batch_size))
+        if not batch:
+            break
+        report.loaded += len(batch)
+        yield batch
+
+    if report.skipped or report.malformed:
+        logger.warning(
+            f"Loaded {report.loaded} points from {path}, skipped {report.skipped} "
+            f"articles of failed requests and {report.malformed} malformed lines."
+        )
+
+
+def load_and_process_embeddings(path: Path) -> List[PointStruct]:
+    """
+    Load embeddings from a JSON lines or `.npy` file and process them into data points.
+
+    All points are held in memory, stream large files with `iter_embedding_batches`.
+
+    Args:
+        path (Path): The path to the file containing embeddings.
+
+    Returns:
+        List[PointStruct]: A list of PointStruct objects containing the processed data.
+
+    Raises:
+        FileNotFoundError: If the file does not exist.
+    """
+    return [point for batch in iter_embedding_batches(path) for point in batch]
@@ -1,54 +1,394 @@
 import argparse
+import itertools
 import json
 import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import Dict, Iterable, List
 
+import backoff
 from loguru import logger
 from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
 from tqdm.auto import tqdm
 
+from database.backends import NumpyBackend, QdrantBackend, RetrievalBackend
+from database.indexer import (
+    article_key,
+    diff_articles,
+    hash_articles,
+    load_manifest,
+    point_id,
+    save_manifest,
+)
 from database.utils import (
-    create_collection,
+    LoadReport,
     create_embeddings,
-    get_count,
-    load_and_process_embeddings,
-    upsert,
+    embedding_files,
+    iter_embedding_batches,
+    load_json,
+    prepare_for_embedding,
+    run_api_request_processor,
+    split_embedding_results,
+    validate_path,
 )
+from database.versions import build_target, publish_version, rollback
+from llm.response_cache import ResponseCache
+
+
+def load_checkpoint(path: Path) -> Dict:
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_checkpoint(path: Path, checkpoint: Dict) -> None:
+    """Write the checkpoint atomically, so an interrupted write cannot corrupt it."""
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(checkpoint, file)
+    os.replace(temp_path, path)
+
+
+def upsert_in_batches(
+    backend: RetrievalBackend,
+    collection: str,
+    batches: Iterable[List[PointStruct]],
+    checkpoint_path: Path,
+    source: str,
+    batch_size: int = 256,
+    max_workers: int = 4,
+    recreate: bool = True,
+) -> int:
+    """
+    Create a collection and upsert batches of points into it in parallel, resuming if possible.
+
+    Every batch is upserted with `wait=True` and retried with exponential backoff.
+    Completed batches are recorded in a checkpoint file. If the checkpoint matches the
+    current `source` and batch size, the collection is not recreated and only the
+    missing batches are upserted. The checkpoint is removed once all batches are done.
+    Batches are consumed lazily and at most two per worker are pending, so a streamed
+    input is never held in memory as a whole.
+
+    Args:
+        backend (RetrievalBackend): Backend holding the collection.
+        collection (str): Name of the collection.
+        batches (Iterable[List[PointStruct]]): Points to upsert, in batches of
+            `batch_size` as made by `iter_embedding_batches`.
+        checkpoint_path (Path): Checkpoint file of this collection.
+        source (str): Fingerprint of the input, a checkpoint is only reused if it matches.
+        batch_size (int): Number of points per batch, part of the checkpoint.
+        max_workers (int): Number of batches upserted concurrently.
+        recreate (bool): Whether to start from an empty collection. If False, the
+            points are upserted into the existing collection.
+
+    Returns:
+        int: The number of points in the collection afterwards.
+    """
+    checkpoint = {"source": source, "batch_size": batch_size, "done": []}
+    if checkpoint_path.exists():
+        previous = load_checkpoint(checkpoint_path)
+        if all(previous[key] == checkpoint[key] for key in ["source", "batch_size"]):
+            checkpoint = previous
+            logger.info(
+                f'Resuming "{collection}": {len(checkpoint["done"])} batches done.'
+            )
+    batches = iter(batches)
+    first_batch = next(batches, [])
+    if not checkpoint["done"]:
+        if recreate:
+            backend.create_collection(
+                name=collection,
+                vector_size=len(first_batch[0].vector) if first_batch else 1536,
+            )
+        checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
+    def upsert_batch(index: int, batch: List[PointStruct]) -> int:
+        backend.upsert(collection=collection, points=batch)
+        return index
+
+    failed = []
+    pending = {}  # future -> batch index
+
+    def collect(futures) -> None:
+        for future in futures:
+            index = pending.pop(future)
+            progress.update()
+            # A failed batch stays out of the checkpoint and is retried on the next run
+            if future.exception() is not None:
+                logger.error(
+                    f"Batch {index} of {collection} failed: {future.exception()}"
+                )
+                failed.append(index)
+                continue
+            checkpoint["done"].append(future.result())
+            save_checkpoint(checkpoint_path, checkpoint)
+
+    done = set(checkpoint["done"])
+    workers = max_workers if backend.parallel_upserts else 1
+    with ThreadPoolExecutor(max_workers=workers) as executor, tqdm(
+        desc=f"Upserting {collection}", unit="batch"
+    ) as progress:
+        for index, batch in enumerate(itertools.chain([first_batch], batches)):
+            if index in done or not batch:
+                continue
+            if len(pending) >= 2 * workers:
+                collect(wait(pending, return_when=FIRST_COMPLETED).done)
+            pending[executor.submit(upsert_batch, index, batch)] = index
+        collect(wait(pending).done)
+
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} batches of {collection} failed. Rerun with --skip_embedding to resume."
+        )
+    checkpoint_path.unlink()
+    return backend.count(collection=collection)
+
+
+def index_incrementally(
+    backend: RetrievalBackend,
+    scraped_path: Path,
+    manifest_path: Path,
+    to_process_dir: Path,
+    checkpoint_dir: Path,
+    model: str,
+    batch_size: int = 256,
+    max_workers: int = 4,
+    keep_previous: int = 1,
+) -> Dict[str, int]:
+    """
+    Bring the collection of one law in line with its scraped file, embedding only the diff.
+
+    The manifest maps every indexed article to a hash of its content. New and changed
+    articles are embedded and upserted under a point id derived from the article, so
+    they replace their previous version. Articles missing from the scraped file are
+    deleted. Without a manifest, or if the embedding model changed, all articles are
+    embedded into a new version of the collection, which is published only if every
+    article was embedded. The manifest only records articles that were upserted, so
+    failed requests are embedded again on the next run.
+
+    Args:
+        backend (RetrievalBackend): Backend holding the collection.
+        scraped_path (Path): Scraped law file.
+        manifest_path (Path): Manifest of the law.
+        to_process_dir (Path): Directory for the embedding requests and results.
+        checkpoint_dir (Path): Directory for upsert checkpoints.
+        model (str): The embedding model to be used.
+        batch_size (int): Number of points per upsert request.
+        max_workers (int): Number of batches upserted concurrently.
+        keep_previous (int): Number of older versions kept for rollback on a rebuild.
+
+    Returns:
+        Dict[str, int]: Number of changed, removed, unchanged and failed articles.
+    """
+    collection = scraped_path.stem.replace("-", "_")
+    scraped_data = load_json(path=scraped_path)
+    articles = {article_key(article): article for article in scraped_data}
+    hashes = hash_articles(scraped_data, model)
+
+    manifest = load_manifest(manifest_path)
+    rebuild = manifest is None or manifest["model"] != model
+    previous = {} if rebuild else manifest["articles"]
+    diff = diff_articles(current=hashes, previous=previous)
+    logger.info(
+        f'"{collection}": {len(diff.changed)} new or changed, '
+        f"{len(diff.removed)} removed, {diff.unchanged} unchanged articles."
+        + (" Rebuilding the collection." if rebuild else "")
+    )
+
+    failed = []
+    if diff.changed:
+        ids = {point_id(collection, key): key for key in diff.changed}
+        requests_filepath = to_process_dir / f"{scraped_path.stem}.changes.jsonl"
+        results_filepath = to_process_dir / f"{scraped_path.stem}.changes_results.jsonl"
+        prepare_for_embedding(
+            output_path=requests_filepath,
+            scraped_data=[articles[key] for key in diff.changed],
+            model=model,
+            ids=list(ids),
+        )
+        # The request processor appends to its results file
+        results_filepath.unlink(missing_ok=True)
+        run_api_request_processor(request_files={requests_filepath: results_filepath})
+        embeddings_filepath = (
+            to_process_dir / f"{scraped_path.stem}.changes_embeddings.jsonl"
+        )
+        split_embedding_results(
+            results_path=results_filepath, output_path=embeddings_filepath
+        )
+        # A diff is small enough to keep its points in memory
+        batches = list(
+            iter_embedding_batches(path=embeddings_filepath, batch_size=batch_size)
+        )
+        # Small diffs go into the live collection, whose readers reload the written
+        # points, rebuilds into a new version
+        target = build_target(backend, collection) if rebuild else collection
+        upsert_in_batches(
+            backend=backend,
+            collection=target,
+            batches=batches,
+            checkpoint_path=checkpoint_dir / f"{target}.json",
+            source=(
+                f"{embeddings_filepath.resolve()}:"
+                f"{embeddings_filepath.stat().st_mtime_ns}"
+            ),
+            batch_size=batch_size,
+            max_workers=max_workers,
+            recreate=rebuild,
+        )
+        upserted = {ids[point.id] for batch in batches for point in batch}
+        failed = [key for key in diff.changed if key not in upserted]
+        if failed:
+            logger.error(f"{len(failed)} articles of {collection} were not embedded.")
+        if rebuild:
+            try:
+                publish_version(
+                    backend=backend,
+                    alias=collection,
+                    collection=target,
+                    expected_count=len(diff.changed),
+                    keep_previous=keep_previous,
+                )
+            except RuntimeError as e:
+                logger.error(f"There are missing points in {target} collection. {e}")
+                # The manifest describes the live collection, which is unchanged, so
+                # the next run rebuilds again
+                return {
+                    "changed": 0,
+                    "removed": 0,
+                    "unchanged": diff.unchanged,
+                    "failed": len(failed),
+                }
+
+    if diff.removed:
+        backend.delete(
+            collection=collection,
+            ids=[point_id(collection, key) for key in diff.removed],
+        )
+
+    articles_hashes = {key: previous[key] for key in previous if key in hashes}
+    articles_hashes.update(
+        {key: hashes[key] for key in diff.changed if key not in failed}
+    )
+    save_manifest(manifest_path, {"model": model, "articles": articles_hashes})
+    return {
+        "changed": len(diff.changed) - len(failed),
+        "removed": len(diff.removed),
+        "unchanged": diff.unchanged,
+        "failed": len(failed),
+    }
 
 
 def main(args: argparse.Namespace) -> None:
     """Main function to create embeddings and vector database."""
-    logger.info("Creating embeddings.")
-    create_embeddings(
-        scraped_dir=args.scraped_dir,
-        to_process_dir=args.to_process_dir,
-        embeddings_dir=args.embeddings_dir,
-        model=args.model,
-    )
+    if args.backend == "numpy":
+        backend = NumpyBackend(path=args.index_dir)
+    else:
+        backend = QdrantBackend(
+            client=QdrantClient(
+                url=os.environ["QDRANT_CLUSTER_URL"],
+                api_key=os.environ["QDRANT_API_KEY"],
+            )
+        )
+
+    if args.rollback:
+        for collection_name in args.rollback:
+            version = rollback(backend=backend, alias=collection_name)
+            logger.info(f'Rolled "{collection_name}" back to "{version}".')
+            # The manifest describes the version rolled back from, the next
+            # incremental run has to rebuild
+            (args.manifest_dir / f"{collection_name}.json").unlink(missing_ok=True)
+            if args.response_cache_path.exists():
+                ResponseCache(path=args.response_cache_path).invalidate(
+                    [collection_name]
+                )
+        return
+
+    if args.incremental:
+        validate_path(args.to_process_dir)
+        scraped_paths = sorted(args.scraped_dir.glob("*.json"))
+        for scraped_path in tqdm(scraped_paths, desc="Indexing scraped files"):
+            collection_name = scraped_path.stem.replace("-", "_")
+            try:
+                stats = index_incrementally(
+                    backend=backend,
+                    scraped_path=scraped_path,
+                    manifest_path=args.manifest_dir / f"{collection_name}.json",
+                    to_process_dir=args.to_process_dir,
+                    checkpoint_dir=args.checkpoint_dir,
+                    model=args.model,
+                    batch_size=args.batch_size,
+                    max_workers=args.workers,
+                    keep_previous=args.keep_versions,
+                )
+            except RuntimeError as e:
+                # Failed upserts are not in the manifest and are retried next run
+                logger.error(f'Indexing "{collection_name}" failed. {e}')
+                continue
+            # Cached answers may quote changed or removed articles
+            if not (stats["changed"] or stats["removed"]):
+                continue
+            if args.response_cache_path.exists():
+                ResponseCache(path=args.response_cache_path).invalidate(
+                    [collection_name]
+                )
+        return
+
+    if not args.skip_embedding:
+        logger.info("Creating embeddings.")
+        create_embeddings(
+            scraped_dir=args.scraped_dir,
+            to_process_dir=args.to_process_dir,
+            embeddings_dir=args.embeddings_dir,
+            model=args.model,
+            resume=args.resume_embedding,
+            embedding_format=args.embedding_format,
+        )
 
     logger.info("Creating vector database.")
-    qdrant_client = QdrantClient(
-        url=os.environ["QDRANT_CLUSTER_URL"],
-        api_key=os.environ["QDRANT_API_KEY"],
-    )
-    data_paths = list(args.embeddings_dir.iterdir())
+    data_paths = embedding_files(args.embeddings_dir)
     for path in tqdm(data_paths, total=len(data_paths), desc="Creating collections"):
         # Check if this is necessary
         collection_name = path.stem.replace("-", "_")
         collection_name = collection_name
-        points = load_and_process_embeddings(path=path)
+        report = LoadReport()
 
-        create_collection(client=qdrant_client, name=collection_name)
-        upsert(client=qdrant_client, collection=collection_name, points=points)
-
-        point_num = get_count(client=qdrant_client, collection=collection_name)
-        if not point_num == len(points):
-            logger.error(f"There are missing points in {collection_name} collection.")
+        # The app keeps querying the live version until the new one is published
+        target = build_target(backend, collection_name)
+        point_num = upsert_in_batches(
+            backend=backend,
+            collection=target,
+            batches=iter_embedding_batches(
+                path=path, batch_size=args.batch_size, report=report
+            ),
+            checkpoint_path=args.checkpoint_dir / f"{target}.json",
+            source=f"{path.resolve()}:{path.stat().st_size}:{path.stat().st_mtime_ns}",
+            batch_size=args.batch_size,
+            max_workers=args.workers,
+        )
+        try:
+            publish_version(
+                backend=backend,
+                alias=collection_name,
+                collection=target,
+                expected_count=report.loaded,
+                keep_previous=args.keep_versions,
+            )
+        except RuntimeError as e:
+            logger.error(f"There are missing points in {target} collection. {e}")
+            continue
+        # Full builds use positional ids, the next incremental run has to rebuild
+        (args.manifest_dir / f"{collection_name}.json").unlink(missing_ok=True)
 
         logger.info(
-            f'Created "{collection_name}" collection with {point_num} data points.'
+            f'Published "{target}" as "{collection_name}" with {point_num} data points.'
         )
 
+        # Cached answers built from the old collection are no longer valid
+        if args.response_cache_path.exists():
+            ResponseCache(path=args.response_cache_path).invalidate([collection_name])
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -69,6 +409,75 @@ if __name__ == "__main__":
         default=Path("./database/embeddings"),
         help="Directory for storing embeddings.",
     )
+    parser.add_argument(
+        "--skip_embedding",
+        action="store_true",
+        help="Reuse the embeddings already in the embeddings directory.",
+    )
+    parser.add_argument(
+        "--resume_embedding",
+        action="store_true",
+        help="Resume an interrupted embedding run, sending only unfinished requests.",
+    )
+    parser.add_argument(
+        "--embedding_format",
+        choices=["jsonl", "float32", "float16"],
+        default="jsonl",
+        help="Store embeddings as JSON lines or as a binary .npy file with a sidecar.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Embed and upsert only new or changed articles, delete removed ones.",
+    )
+    parser.add_argument(
+        "--manifest_dir",
+        type=Path,
+        default=Path("./database/manifests"),
+        help="Directory for the article hashes of incrementally indexed collections.",
+    )
+    parser.add_argument(
+        "--keep_versions",
+        type=int,
+        default=1,
+        help="Number of previous collection versions kept for rollback.",
+    )
+    parser.add_argument(
+        "--rollback",
+        nargs="+",
+        metavar="COLLECTION",
+        help="Point the given collections back to their previous version and exit.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["qdrant", "numpy"],
+        default="qdrant",
+        help="Retrieval backend to fill, see `retrieval.backend` in config.yaml.",
+    )
+    parser.add_argument(
+        "--index_dir",
+        type=Path,
+        default=Path("./database/index"),
+        help="Directory of the in-process index, used by the numpy backend.",
+    )
+    parser.add_argument(
+        "--batch_size", type=int, default=256, help="Number of points per upsert."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of concurrent upserts."
+    )
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=Path,
+        default=Path("./database/checkpoints"),
+        help="Directory for upsert checkpoints of interrupted builds.",
+    )
+    parser.add_argument(
+        "--response_cache_path",
+        type=Path,
+        default=Path("./database/cache/responses.sqlite"),
+        help="Semantic response cache of the app, invalidated for rebuilt collections.",
+    )
     parser.add_argument(
         "--model",
         type=str,
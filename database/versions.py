@@ -0,0 +1,104 @@
+import re
+import time
+from typing import List, Tuple
+
+from loguru import logger
+
+from database.backends import RetrievalBackend
+
+
+def version_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+
+def list_versions(backend: RetrievalBackend, alias: str) -> List[Tuple[int, str]]:
+    """Versioned collections of an alias, oldest first."""
+    pattern = re.compile(rf"{re.escape(alias)}_v(\d+)")
+    versions = []
+    for collection in backend.list_collections():
+        match = pattern.fullmatch(collection)
+        if match:
+            versions.append((int(match.group(1)), collection))
+    return sorted(versions)
+
+
+def build_target(backend: RetrievalBackend, alias: str) -> str:
+    """
+    Collection to build the next version of an alias in.
+
+    A version newer than the live one is an unpublished build, for example of an
+    interrupted run, and is reused so its upsert checkpoint can resume.
+    """
+    versions = list_versions(backend, alias)
+    live = backend.get_alias(alias)
+    live_version = next((v for v, name in versions if name == live), 0)
+    if versions and versions[-1][0] > live_version:
+        return versions[-1][1]
+    return version_name(alias, versions[-1][0] + 1 if versions else 1)
+
+
+def publish_version(
+    backend: RetrievalBackend,
+    alias: str,
+    collection: str,
+    expected_count: int,
+    keep_previous: int = 1,
+) -> None:
+    """
+    Verify a freshly built collection and switch the alias to it.
+
+    Args:
+        backend (RetrievalBackend): Backend holding the collections.
+        alias (str): Name the app queries, for example "zakon_o_radu".
+        collection (str): The new version, for example "zakon_o_radu_v7".
+        expected_count (int): Number of points the new version must contain.
+        keep_previous (int): Number of older versions kept for rollback.
+
+    Raises:
+        RuntimeError: If the new version does not hold the expected number of points.
+            The alias keeps pointing to the previous version.
+
+    Replacing a collection built before versioning is not atomic: the law cannot be
+    queried from the deletion of the old collection until the alias is created.
+    """
+    point_num = backend.count(collection=collection)
+    if point_num != expected_count:
+        raise RuntimeError(
+            f'"{collection}" has {point_num} points instead of {expected_count}, '
+            f'"{alias}" was not switched.'
+        )
+
+    if alias in backend.list_collections():
+        # Built before versioning. An alias cannot share its name with a collection,
+        # so the collection has to be deleted before the alias can be created, and
+        # queries of the law fail in between. This only happens on its first publish.
+        logger.warning(f'Replacing the unversioned collection "{alias}".')
+        start_time = time.perf_counter()
+        backend.delete_collection(name=alias)
+        backend.switch_alias(alias=alias, collection=collection)
+        logger.warning(
+            f'"{alias}" was unavailable for '
+            f"{(time.perf_counter() - start_time) * 1000:.0f} ms while it was replaced."
+        )
+    else:
+        backend.switch_alias(alias=alias, collection=collection)
+
+    versions = list_versions(backend, alias)
+    current = next(v for v, name in versions if name == collection)
+    older = [name for v, name in versions if v < current]
+    for name in older[: max(len(older) - keep_previous, 0)]:
+        backend.delete_collection(name=name)
+
+
+def rollback(backend: RetrievalBackend, alias: str) -> str:
+    """Point the alias back to the newest version older than the live one."""
+    live = backend.get_alias(alias)
+    versions = list_versions(backend, alias)
+    live_version = next((v for v, name in versions if name == live), None)
+    if live_version is None:
+        raise ValueError(f'"{alias}" does not point to a versioned collection.')
+    previous = [name for v, name in versions if v < live_version]
+    if not previous:
+        raise ValueError(f'"{alias}" has no previous version to roll back to.')
+    backend.switch_alias(alias=alias, collection=previous[-1])
+    return previous[-1]
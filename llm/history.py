@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+from llm.prompts import SUMMARY_HEADER
+
+
+def format_turn(message: Dict) -> str:
+    return f"{message['role']}: {message['content']}"
+
+
+@dataclass
+class ConversationHistory:
+    """
+    Token-bounded view of a conversation, kept in the session state.
+
+    The most recent turns are kept verbatim within a token budget. Older turns are
+    folded into a running summary. The summary is updated incrementally: only the
+    turns that fall out of the verbatim window since the last update are sent to the
+    summarizer. When folding is needed, the window is shrunk to half the budget, so
+    the summarizer is not called again on every new turn.
+    """
+
+    summary: str = ""
+    num_summarized: int = 0  # leading messages already folded into the summary
+
+    def forget(self, num_messages: int) -> None:
+        """Account for `num_messages` dropped from the start of the message list."""
+        self.num_summarized = max(self.num_summarized - max(num_messages, 0), 0)
+
+    def render(
+        self,
+        messages: List[Dict],
+        token_budget: int,
+        count_tokens: Callable[[str], int],
+        summarize: Callable[[str, str], str],
+    ) -> str:
+        """
+        Render the conversation for the chat prompt.
+
+        Args:
+            messages (List[Dict]): The conversation messages, oldest first.
+            token_budget (int): Maximum number of tokens for the verbatim turns.
+            count_tokens (Callable[[str], int]): Counts the tokens of a text.
+            summarize (Callable[[str, str], str]): Takes the current summary and the
+                turns to fold into it and returns the new summary.
+
+        Returns:
+            str: The summary of older turns followed by the recent turns.
+        """
+        turns = [format_turn(message) for message in messages]
+        turn_tokens = [count_tokens(turn) for turn in turns]
+
+        start = self._window_start(turn_tokens, token_budget)
+        if start > self.num_summarized:
+            # Fold down to half the budget so the next turns fit without summarizing
+            start = max(start, self._window_start(turn_tokens, token_budget // 2))
+            self.summary = summarize(
+                self.summary, "\n".join(turns[self.num_summarized : start])
+            )
+            self.num_summarized = start
+
+        recent = "\n".join(turns[self.num_summarized :])
+        if not self.summary:
+            return recent
+        return SUMMARY_HEADER.format(summary=self.summary) + recent
+
+    def _window_start(self, turn_tokens: List[int], token_budget: int) -> int:
+        """Index of the oldest turn of the newest run of turns that fits the budget."""
+        start, used_tokens = len(turn_tokens), 0
+        while start > self.num_summarized:
+            used_tokens += turn_tokens[start - 1]
+            if used_tokens > token_budget:
+                break
+            start -= 1
+        return start
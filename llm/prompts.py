@@ -92,6 +92,30 @@ KONTEKST:
 
 """
 
+SUMMARY_HEADER = """Sažetak ranijeg dela konverzacije:
+{summary}
+
+Poslednje poruke:
+"""
+
+SUMMARY_PROMPT = """
+Tvoj zadatak je da ažuriraš sažetak konverzacije između klijenta (user) i pravnog asistenta (assistant).
+Dobićeš dosadašnji sažetak i nove poruke koje treba uključiti u njega.
+- Zadrži pitanja klijenta, bitne činjenice o njegovoj situaciji i zaključke asistenta.
+- Zadrži nazive zakona i brojeve članova na koje se asistent pozivao.
+- Izostavi pozdrave, ponavljanja i formatiranje.
+- Sažetak treba da bude kratak, najviše nekoliko pasusa.
+Vrati samo novi sažetak.
+"""
+
+SUMMARY_UPDATE_PROMPT = """
+DOSADAŠNJI SAŽETAK:
+{summary}
+
+NOVE PORUKE:
+{conversation}
+"""
+
 DEFAULT_CONTEXT = "Nema konteksta za korisnikovo pitanje."
 
 QUERY_PROMPT = """
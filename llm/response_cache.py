@@ -0,0 +1,166 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Generator, List, Optional, Union
+
+import numpy as np
+from loguru import logger
+
+
+def prompt_version_hash(*parts: str) -> str:
+    """Hash everything that shapes an answer besides the query, e.g. prompts and model."""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def replay_answer(answer: str, chunk_size: int = 8) -> Generator[str, None, None]:
+    """
+    Yield a stored answer in chunks of `chunk_size` words.
+
+    Whitespace is kept attached to the words, so joining the chunks gives back the
+    original answer exactly.
+    """
+    words = re.findall(r"\s*\S+\s*", answer) or [answer]
+    for i in range(0, len(words), chunk_size):
+        yield "".join(words[i : i + chunk_size])
+
+
+class ResponseCache:
+    """
+    Semantic cache for generated answers, stored in SQLite.
+
+    An entry matches a new query when it was produced for the same routed collections
+    and prompt version, is younger than `ttl_seconds` and its query embedding has a
+    cosine similarity of at least `similarity_threshold` with the new query embedding.
+    The store lives on disk, so `database/vector_database.py` can invalidate entries
+    of rebuilt collections while the app is running.
+
+    Args:
+        path (Union[str, Path]): SQLite file for the cache.
+        similarity_threshold (float): Minimum cosine similarity for a hit.
+        ttl_seconds (float): Maximum age of a cached answer.
+        max_size (int): Maximum number of stored answers, oldest are evicted first.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        similarity_threshold: float = 0.95,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_size: int = 10_000,
+    ) -> None:
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "collections TEXT NOT NULL, "
+            "prompt_version TEXT NOT NULL, "
+            "embedding BLOB NOT NULL, "
+            "answer TEXT NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_key "
+            "ON responses (collections, prompt_version)"
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def _collections_key(collections: List[str]) -> str:
+        # Delimit every name so invalidation can match whole collection names
+        return "|" + "|".join(sorted(set(collections))) + "|"
+
+    def get(
+        self, embedding: List[float], collections: List[str], prompt_version: str
+    ) -> Optional[str]:
+        """Return the answer of the most similar cached query, or None on a miss."""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT embedding, answer FROM responses "
+                "WHERE collections = ? AND prompt_version = ? AND created_at >= ?",
+                (
+                    self._collections_key(collections),
+                    prompt_version,
+                    time.time() - self.ttl_seconds,
+                ),
+            ).fetchall()
+        if not rows:
+            return None
+
+        query = np.asarray(embedding, dtype=np.float32)
+        cached = np.stack([np.frombuffer(row[0], dtype=np.float32) for row in rows])
+        similarities = (cached @ query) / (
+            np.linalg.norm(cached, axis=1) * np.linalg.norm(query) + 1e-12
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+            return None
+        logger.info(f"Response cache hit with similarity {similarities[best]:.4f}.")
+        return rows[best][1]
+
+    def put(
+        self,
+        embedding: List[float],
+        collections: List[str],
+        prompt_version: str,
+        answer: str,
+    ) -> None:
+        """Store an answer, evicting expired and the oldest entries over `max_size`."""
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO responses "
+                "(collections, prompt_version, embedding, answer, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    self._collections_key(collections),
+                    prompt_version,
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                    answer,
+                    now,
+                ),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE id IN ("
+                "SELECT id FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,),
+            )
+            self._connection.commit()
+
+    def invalidate(self, collections: Optional[List[str]] = None) -> int:
+        """
+        Remove cached answers built from any of the given collections.
+
+        Args:
+            collections (List[str], optional): Collections that changed. If not set,
+                the whole cache is cleared.
+
+        Returns:
+            int: The number of removed answers.
+        """
+        if collections is not None and not collections:
+            return 0
+        with self._lock:
+            if collections is None:
+                cursor = self._connection.execute("DELETE FROM responses")
+            else:
+                cursor = self._connection.execute(
+                    "DELETE FROM responses WHERE "
+                    + " OR ".join(["instr(collections, ?) > 0"] * len(collections)),
+                    [f"|{collection}|" for collection in collections],
+                )
+            self._connection.commit()
+        logger.info(f"Invalidated {cursor.rowcount} cached responses.")
+        return cursor.rowcount
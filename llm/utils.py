@@ -4,20 +4,20 @@ from llm.prompts import (
     CONTEXT_PROMPT,
     CONVERSATION_PROMPT,
     QUERY_PROMPT,
+    SUMMARY_PROMPT,
+    SUMMARY_UPDATE_PROMPT,
     SYSTEM_PROMPT,
 )
 
 
-def formate_messages_chat(
-    context: str, query: str, conversation: List[str]
-) -> List[Dict]:
+def formate_messages_chat(context: str, query: str, conversation: str) -> List[Dict]:
     """
     Prepare the list of messages for the chat model.
 
     Args:
         context (str): The context information.
         query (str): The user's query.
-        conversation (List[str]): The conversation history.
+        conversation (str): The conversation history.
 
     Returns:
         List[Dict]: The list of messages formatted for the chat model.
@@ -31,3 +31,25 @@ def formate_messages_chat(
         {"role": "user", "content": CONTEXT_PROMPT.format(context=context)},
         {"role": "user", "content": QUERY_PROMPT.format(query=query)},
     ]
+
+
+def formate_messages_summary(summary: str, conversation: str) -> List[Dict]:
+    """
+    Prepare the list of messages for updating the conversation summary.
+
+    Args:
+        summary (str): The current summary, empty if there is none yet.
+        conversation (str): The turns to fold into the summary.
+
+    Returns:
+        List[Dict]: The list of messages formatted for the summary model.
+    """
+    return [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {
+            "role": "user",
+            "content": SUMMARY_UPDATE_PROMPT.format(
+                summary=summary or "-", conversation=conversation
+            ),
+        },
+    ]
@@ -0,0 +1,229 @@
+import argparse
+import os
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Sequence, Union
+
+import numpy as np
+from loguru import logger
+from qdrant_client import QdrantClient
+
+
+class RoutingDecision(NamedTuple):
+    collections: List[str]
+    confidence: float
+    confident: bool
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale every row to unit length so dot products are cosine similarities."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(
+    vectors: np.ndarray, n_clusters: int, n_iterations: int = 10, seed: int = 0
+) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity and return the unit centroids."""
+    n_clusters = min(n_clusters, len(vectors))
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_clusters, replace=False)]
+    for _ in range(n_iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        # Keep the previous centroid for clusters that lost all their members
+        empty = ~np.bincount(labels, minlength=n_clusters).astype(bool)
+        sums[empty] = centroids[empty]
+        centroids = normalize_rows(sums)
+    return centroids
+
+
+class CentroidRouter:
+    """
+    Local router that compares a query embedding with per-collection centroids.
+
+    Every collection is summarized by a few centroids of its article embeddings. A
+    query is scored against all centroids with one matrix product and each collection
+    gets the score of its closest centroid. Collections within `margin` of the best
+    score are selected. The decision is confident when the best score reaches
+    `min_similarity` and the selected collections are separated from the rest by at
+    least `min_confidence`. Otherwise the caller should fall back to the LLM router.
+
+    Args:
+        collections (Sequence[str]): Collection names.
+        centroids (np.ndarray): Matrix of shape (n_centroids, dimensions).
+        owners (np.ndarray): Index into `collections` for every centroid, sorted.
+        min_similarity (float): Minimum best score for a confident decision.
+        margin (float): Maximum distance from the best score to still be selected.
+        min_confidence (float): Minimum gap between selected and rejected collections.
+    """
+
+    def __init__(
+        self,
+        collections: Sequence[str],
+        centroids: np.ndarray,
+        owners: np.ndarray,
+        min_similarity: float = 0.3,
+        margin: float = 0.03,
+        min_confidence: float = 0.02,
+    ) -> None:
+        order = np.argsort(owners, kind="stable")
+        self.collections = np.asarray(collections)
+        self.centroids = normalize_rows(np.asarray(centroids, dtype=np.float32)[order])
+        self.owners = np.asarray(owners)[order]
+        # Start offset of every collection's centroids, used by np.maximum.reduceat
+        self._offsets = np.searchsorted(self.owners, np.arange(len(self.collections)))
+        self.min_similarity = min_similarity
+        self.margin = margin
+        self.min_confidence = min_confidence
+
+    def scores(self, embeddings: np.ndarray) -> np.ndarray:
+        """Return the (n_queries, n_collections) matrix of routing scores."""
+        embeddings = normalize_rows(np.atleast_2d(np.asarray(embeddings, np.float32)))
+        similarities = embeddings @ self.centroids.T
+        return np.maximum.reduceat(similarities, self._offsets, axis=1)
+
+    def route_batch(self, embeddings: np.ndarray) -> List[RoutingDecision]:
+        """Route several query embeddings at once."""
+        scores = self.scores(embeddings)
+        best = scores.max(axis=1, keepdims=True)
+        selected = scores >= best - self.margin
+
+        lowest_selected = np.where(selected, scores, np.inf).min(axis=1)
+        highest_rejected = np.where(selected, -np.inf, scores).max(axis=1)
+        # With every collection selected there is nothing to separate from
+        confidence = np.where(
+            np.isfinite(highest_rejected), lowest_selected - highest_rejected, 1.0
+        )
+        confident = (best[:, 0] >= self.min_similarity) & (
+            confidence >= self.min_confidence
+        )
+        return [
+            RoutingDecision(
+                collections=self.collections[row].tolist(),
+                confidence=float(confidence[i]),
+                confident=bool(confident[i]),
+            )
+            for i, row in enumerate(selected)
+        ]
+
+    def route(self, embedding: Union[List[float], np.ndarray]) -> RoutingDecision:
+        """Route a single query embedding."""
+        return self.route_batch(np.asarray(embedding, dtype=np.float32))[0]
+
+    @classmethod
+    def from_qdrant(
+        cls,
+        client: QdrantClient,
+        collections: Sequence[str],
+        n_centroids: int = 4,
+        batch_size: int = 256,
+        **kwargs,
+    ) -> "CentroidRouter":
+        """Build the centroids from the article vectors stored in Qdrant."""
+        centroids, owners = [], []
+        for index, collection in enumerate(collections):
+            vectors, offset = [], None
+            while True:
+                points, offset = client.scroll(
+                    collection_name=collection,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=False,
+                    with_vectors=True,
+                )
+                vectors.extend(point.vector for point in points)
+                if offset is None:
+                    break
+            logger.info(f'Loaded {len(vectors)} vectors from "{collection}".')
+            collection_centroids = spherical_kmeans(
+                normalize_rows(np.asarray(vectors, dtype=np.float32)), n_centroids
+            )
+            centroids.append(collection_centroids)
+            owners.extend([index] * len(collection_centroids))
+        return cls(
+            collections=collections,
+            centroids=np.concatenate(centroids),
+            owners=np.asarray(owners),
+            **kwargs,
+        )
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                collections=self.collections,
+                centroids=self.centroids,
+                owners=self.owners,
+            )
+        logger.info(f'Saved {len(self.centroids)} centroids to "{path}".')
+
+    @classmethod
+    def load(cls, path: Path, **kwargs) -> "CentroidRouter":
+        data = np.load(path)
+        return cls(
+            collections=data["collections"].tolist(),
+            centroids=data["centroids"],
+            owners=data["owners"],
+            **kwargs,
+        )
+
+
+def routing_agreement(
+    local: List[List[str]], reference: List[List[str]]
+) -> Dict[str, float]:
+    """
+    Exact-match rate and mean Jaccard similarity between two sets of decisions.
+
+    Without decisions to compare, both are 0.0, so the result is always a number.
+    """
+    if not local:
+        return {"exact_match": 0.0, "jaccard": 0.0}
+    exact, jaccard = [], []
+    for local_collections, reference_collections in zip(local, reference):
+        local_set, reference_set = set(local_collections), set(reference_collections)
+        exact.append(local_set == reference_set)
+        jaccard.append(
+            len(local_set & reference_set) / max(len(local_set | reference_set), 1)
+        )
+    return {"exact_match": float(np.mean(exact)), "jaccard": float(np.mean(jaccard))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the local router centroids from the Qdrant collections."
+    )
+    parser.add_argument(
+        "--collections",
+        nargs="+",
+        default=[
+            "zakon_o_radu",
+            "zakon_o_porezu_na_dohodak_gradjana",
+            "zakon_o_zastiti_podataka_o_licnosti",
+            "zakon_o_zastiti_potrosaca",
+            "porodicni_zakon",
+        ],
+        help="Collections to build centroids for.",
+    )
+    parser.add_argument(
+        "--n_centroids", type=int, default=4, help="Centroids per collection."
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("./router/centroids.npz"),
+        help="Where to save the centroids.",
+    )
+    args = parser.parse_args()
+
+    qdrant_client = QdrantClient(
+        url=os.environ["QDRANT_CLUSTER_URL"],
+        api_key=os.environ["QDRANT_API_KEY"],
+    )
+    router = CentroidRouter.from_qdrant(
+        client=qdrant_client,
+        collections=args.collections,
+        n_centroids=args.n_centroids,
+    )
+    router.save(args.output)
@@ -1,5 +1,8 @@
+import json
 from typing import Dict, List
 
+from openai import OpenAI
+
 from router.router_prompt import ROUTER_PROMPT, USER_QUERY
 
 
@@ -19,3 +22,35 @@ def formate_messages_router(
         {"role": "system", "content": ROUTER_PROMPT},
         {"role": "user", "content": USER_QUERY.format(query=query)},
     ]
+
+
+def semantic_query_router(
+    client: OpenAI,
+    query: str,
+    prompt: str = ROUTER_PROMPT,
+    model: str = "gpt-3.5-turbo",
+    temperature: float = 0,
+) -> List[str]:
+    """
+    Route a query to the relevant collections with the LLM router.
+
+    Args:
+        client (OpenAI): The OpenAI client.
+        query (str): The user's query.
+        prompt (str): The router system prompt.
+        model (str): The model name to use.
+        temperature (float): The temperature setting for the model.
+
+    Returns:
+        List[str]: The names of the relevant collections.
+    """
+    response = client.chat.completions.create(
+        model=model,
+        response_format={"type": "json_object"},
+        temperature=temperature,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": USER_QUERY.format(query=query)},
+        ],
+    )
+    return json.loads(response.choices[0].message.content)["response"]
@@ -1,13 +1,34 @@
 import argparse
+import codecs
+import io
 import json
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Literal
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlparse
 
 import requests
 from bs4 import BeautifulSoup
+from bs4.dammit import EncodingDetector
 from loguru import logger
+from lxml import etree
+from requests.adapters import HTTPAdapter
 from tqdm.auto import tqdm
 from tqdm.contrib.logging import tqdm_logging_redirect
+from urllib3.util.retry import Retry
 
 
 def check_class_element(element, class_name: Literal["normal", "clan"]) -> bool:
@@ -15,37 +36,31 @@ def check_class_element(element, class_name: Literal["normal", "clan"]) -> bool:
     return element.get("class") == [class_name]
 
 
-def run_scraper(soup: BeautifulSoup, url: str) -> List[Dict]:
-    """
-    Scrape law articles from the provided BeautifulSoup object.
+# Strings inside these elements are not text to BeautifulSoup's `get_text`
+NON_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
 
-    This function processes the HTML content parsed by BeautifulSoup to extract law articles.
-    Each article is identified by a specific class and contains a title, a list of text paragraphs,
-    and a link to the article section.
+
+def collect_articles(
+    paragraphs: Iterable[Tuple[str, str, Optional[str]]], url: str
+) -> List[Dict]:
+    """
+    Group paragraphs into law articles.
 
     Args:
-        soup (BeautifulSoup): The BeautifulSoup object containing the parsed HTML content.
+        paragraphs (Iterable[Tuple[str, str, Optional[str]]]): The class name
+            ("clan" or "normal"), the stripped text and, for "clan" paragraphs, the
+            name of the first anchor of every <p> element, in document order.
         url (str): The base URL of the website to construct full article links.
 
     Returns:
-        List[Dict]: A list of dictionaries, each representing a law article with the following keys:
-            - "title" (str): The title of the article.
-            - "texts" (List[str]): A list of text paragraphs within the article.
-            - "link" (str): The URL link to the specific article section.
+        List[Dict]: The law articles, see `run_scraper`.
     """
     law_articles = []
     article_title = None
     article_texts = []
     article_link = None
 
-    # Find all <p> elements in the HTML
-    elements = soup.find_all("p")
-    for el in elements:
-        # Determine the class name of the element
-        class_name = (
-            "clan" if check_class_element(element=el, class_name="clan") else "normal"
-        )
-
+    for class_name, text, name_attr in paragraphs:
         # If the element is a title (class "clan"), start a new article
         if class_name == "clan":
             if article_title:
@@ -59,14 +74,13 @@ def run_scraper(soup: BeautifulSoup, url: str) -> List[Dict]:
                 )
                 article_texts = []
             # Get the article title
-            article_title = el.get_text(strip=True)
+            article_title = text
 
             # Get the link to the article section
-            name_attr = el.find("a").get("name") if el.find("a") else None
             article_link = f"{url}#{name_attr}" if name_attr else None
         # If the element is part of an article's text, add it to the current article
         elif article_title and class_name == "normal":
-            article_texts.append(el.get_text(strip=True))
+            article_texts.append(text)
 
     # Save the last article
     if article_title and article_texts:
@@ -77,43 +91,304 @@ def run_scraper(soup: BeautifulSoup, url: str) -> List[Dict]:
     return law_articles
 
 
-def main(urls: List[str], output_dir: Path) -> None:
+def run_scraper(soup: BeautifulSoup, url: str) -> List[Dict]:
+    """
+    Scrape law articles from the provided BeautifulSoup object.
+
+    This function processes the HTML content parsed by BeautifulSoup to extract law articles.
+    Each article is identified by a specific class and contains a title, a list of text paragraphs,
+    and a link to the article section.
+
+    Args:
+        soup (BeautifulSoup): The BeautifulSoup object containing the parsed HTML content.
+        url (str): The base URL of the website to construct full article links.
+
+    Returns:
+        List[Dict]: A list of dictionaries, each representing a law article with the following keys:
+            - "title" (str): The title of the article.
+            - "texts" (List[str]): A list of text paragraphs within the article.
+            - "link" (str): The URL link to the specific article section.
+    """
+
+    def paragraphs() -> Iterator[Tuple[str, str, Optional[str]]]:
+        # Find all <p> elements in the HTML
+        for el in soup.find_all("p"):
+            # Determine the class name of the element
+            if check_class_element(element=el, class_name="clan"):
+                name_attr = el.find("a").get("name") if el.find("a") else None
+                yield "clan", el.get_text(strip=True), name_attr
+            else:
+                yield "normal", el.get_text(strip=True), None
+
+    return collect_articles(paragraphs(), url=url)
+
+
+def element_text(element: etree._Element) -> str:
+    """The text of an lxml element as BeautifulSoup's `get_text(strip=True)` has it."""
+
+    def strings(el: etree._Element, skip: bool) -> Iterator[str]:
+        # Comments and processing instructions have no string tag, only their tail
+        if el.text and not skip and isinstance(el.tag, str):
+            yield el.text
+        for child in el:
+            skip_child = isinstance(child.tag, str) and child.tag in NON_TEXT_TAGS
+            yield from strings(child, skip or skip_child)
+            if child.tail and not skip:
+                yield child.tail
+
+    return "".join(string.strip() for string in strings(element, skip=False))
+
+
+def run_scraper_lxml(
+    source: Union[bytes, Path, BinaryIO], url: str, encoding: Optional[str] = None
+) -> List[Dict]:
+    """
+    Scrape law articles from HTML while it is parsed, without building a full tree.
+
+    Produces the same articles as `run_scraper`. The <p> elements are streamed with
+    lxml's `iterparse` and cleared once they are read, so only the open ancestors of
+    the current paragraph are held in memory. Paragraphs nested in another <p> are
+    read with their outermost <p>, in document order as `find_all` returns them.
+
+    Args:
+        source (Union[bytes, Path, BinaryIO]): The HTML, or a path or seekable binary
+            file to read it from.
+        url (str): The base URL of the website to construct full article links.
+        encoding (Optional[str]): Encoding of the HTML. If None, the encoding the
+            page declares is used, and UTF-8 if it declares none.
+
+    Returns:
+        List[Dict]: The law articles, see `run_scraper`.
+    """
+
+    if isinstance(source, Path):
+        with open(source, "rb") as file:
+            return run_scraper_lxml(source=file, url=url, encoding=encoding)
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    if encoding is None:
+        head = source.read(4096)
+        source.seek(0)
+        # libxml2 would fall back to Latin-1, BeautifulSoup detects UTF-8
+        if not head.startswith(
+            (codecs.BOM_UTF8, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+        ) and not EncodingDetector.find_declared_encoding(head, is_html=True):
+            encoding = "utf-8"
+
+    def paragraphs() -> Iterator[Tuple[str, str, Optional[str]]]:
+        depth = 0  # <p> elements open around the current one
+        for event, element in etree.iterparse(
+            source,
+            events=("start", "end"),
+            tag="p",
+            html=True,
+            encoding=encoding,
+        ):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth:
+                continue
+            for el in element.iter("p"):
+                # As BeautifulSoup splits the class attribute on whitespace
+                if el.get("class", "").split() == ["clan"]:
+                    anchor = next(el.iterdescendants("a"), None)
+                    name_attr = anchor.get("name") if anchor is not None else None
+                    yield "clan", element_text(el), name_attr
+                else:
+                    yield "normal", element_text(el), None
+            # Free the paragraph and everything parsed before it
+            element.clear(keep_tail=True)
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+
+    return collect_articles(paragraphs(), url=url)
+
+
+def load_http_cache(path: Path) -> Dict[str, Dict[str, str]]:
+    """Load the ETag and Last-Modified validators of the scraped URLs."""
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def save_http_cache(path: Path, cache: Dict[str, Dict[str, str]]) -> None:
+    """Write the validators atomically, so an interrupted write cannot corrupt them."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(cache, file, indent=4)
+    os.replace(temp_path, path)
+
+
+def create_session(per_host: int) -> requests.Session:
+    """
+    Create a session that keeps up to `per_host` connections open to every host.
+
+    Connection errors and 429 and 5xx responses are retried with exponential backoff.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adapter = HTTPAdapter(pool_maxsize=per_host, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def scrape_url(
+    session: requests.Session,
+    url: str,
+    output_dir: Path,
+    validators: Optional[Dict[str, str]],
+    host_limit: threading.Semaphore,
+    timeout: float = 30.0,
+    parser: Literal["bs4", "lxml"] = "bs4",
+) -> Tuple[str, Optional[Dict[str, str]]]:
+    """
+    Scrape the law articles of one URL and save them as a JSON file.
+
+    If the saved file exists and `validators` hold the ETag or Last-Modified of the
+    page it was scraped from, the page is requested conditionally. An unchanged page
+    answers with 304 Not Modified and is neither downloaded nor parsed again.
+
+    Args:
+        session (requests.Session): Session with the connection pool.
+        url (str): The URL to scrape.
+        output_dir (Path): The directory where the JSON file is saved.
+        validators (Optional[Dict[str, str]]): Validators cached from the last scrape.
+        host_limit (threading.Semaphore): Limits the concurrent requests to the host.
+        timeout (float): Seconds to wait for the connection and for the response.
+        parser (Literal["bs4", "lxml"]): Build a BeautifulSoup tree (`run_scraper`)
+            or stream the paragraphs with lxml (`run_scraper_lxml`).
+
+    Returns:
+        Tuple[str, Optional[Dict[str, str]]]: "saved", "unchanged" or "failed", and
+            the validators to cache for the URL, None if none should be cached.
+    """
+    save_path = output_dir / f"{Path(url).stem}.json"
+    headers = {}
+    # Without the saved file, a 304 would leave nothing to keep
+    if validators and save_path.exists():
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+    try:
+        with host_limit:
+            response = session.get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304:
+            logger.info(f'"{url}" is unchanged, keeping "{save_path}"')
+            return "unchanged", validators
+        # Ensure we handle HTTP errors
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.error(f'Failed to fetch URL: "{url}" - {e}')
+        return "failed", validators
+
+    try:
+        if parser == "lxml":
+            law_articles = run_scraper_lxml(source=response.content, url=url)
+        else:
+            soup = BeautifulSoup(response.content, "lxml")
+            law_articles = run_scraper(soup=soup, url=url)
+    except Exception as e:
+        logger.error(f'Failed to scrape data from URL: "{url}" - {e}')
+        return "failed", None
+
+    try:
+        # Written atomically, a cut-off file must never be kept as unchanged. The
+        # hidden temp file is not taken for a law if a crash leaves it behind.
+        temp_path = save_path.with_name(f".{save_path.stem}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(law_articles, file, indent=4, ensure_ascii=False)
+        os.replace(temp_path, save_path)
+        logger.info(f'Successfully saved data to "{save_path}"')
+    except Exception as e:
+        logger.error(f'Failed to save data to "{save_path}" - {e}')
+        return "failed", None
+
+    new_validators = {}
+    if response.headers.get("ETag"):
+        new_validators["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        new_validators["last_modified"] = response.headers["Last-Modified"]
+    return "saved", new_validators or None
+
+
+def main(
+    urls: List[str],
+    output_dir: Path,
+    workers: int = 4,
+    per_host: int = 2,
+    timeout: float = 30.0,
+    cache_path: Optional[Path] = None,
+    parser: Literal["bs4", "lxml"] = "bs4",
+) -> None:
     """
     Scrape law articles from a list of URLs and save them as JSON files.
 
+    The URLs are fetched concurrently over a pooled session, with at most `per_host`
+    requests to the same host at a time.
+
     Args:
         urls (List[str]): A list of URLs to scrape.
         output_dir (Path): The directory where the JSON files will be saved.
+        workers (int): Number of URLs scraped concurrently.
+        per_host (int): Maximum number of concurrent requests to one host.
+        timeout (float): Seconds to wait for the connection and for the response.
+        cache_path (Optional[Path]): JSON file with the ETag and Last-Modified of every
+            scraped URL, to skip unchanged pages. No cache is used if None.
+        parser (Literal["bs4", "lxml"]): HTML parser backend, see `scrape_url`.
     """
     # Ensure the output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    with tqdm_logging_redirect():
-        for url in tqdm(urls, desc="Scraping laws", total=len(urls)):
-            save_path = output_dir / f"{Path(url).stem}.json"
+    cache = load_http_cache(cache_path) if cache_path is not None else {}
+    host_limits = {
+        urlparse(url).netloc: threading.BoundedSemaphore(per_host) for url in urls
+    }
+    statuses = Counter()
 
-            try:
-                response = requests.get(url)
-                # Ensure we handle HTTP errors
-                response.raise_for_status()
-            except requests.RequestException as e:
-                logger.error(f'Failed to fetch URL: "{url}" - {e}')
-                continue
+    with tqdm_logging_redirect(), create_session(per_host=per_host) as session:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    scrape_url,
+                    session=session,
+                    url=url,
+                    output_dir=output_dir,
+                    validators=cache.get(url),
+                    host_limit=host_limits[urlparse(url).netloc],
+                    timeout=timeout,
+                    parser=parser,
+                ): url
+                for url in urls
+            }
+            for future in tqdm(
+                as_completed(futures), desc="Scraping laws", total=len(urls)
+            ):
+                url = futures[future]
+                status, validators = future.result()
+                statuses[status] += 1
+                if validators:
+                    cache[url] = validators
+                else:
+                    cache.pop(url, None)
+                if cache_path is not None:
+                    save_http_cache(cache_path, cache)
 
-            soup = BeautifulSoup(response.content, "lxml")
-
-            try:
-                law_articles = run_scraper(soup=soup, url=url)
-            except Exception as e:
-                logger.error(f'Failed to scrape data from URL: "{url}" - {e}')
-                continue
-
-            try:
-                with open(save_path, "w", encoding="utf-8") as file:
-                    json.dump(law_articles, file, indent=4, ensure_ascii=False)
-                logger.info(f'Successfully saved data to "{save_path}"')
-            except Exception as e:
-                logger.error(f'Failed to save data to "{save_path}" - {e}')
+    logger.info(
+        f"Scraped {statuses['saved']} laws, {statuses['unchanged']} unchanged, "
+        f"{statuses['failed']} failed."
+    )
 
 
 if __name__ == "__main__":
@@ -131,6 +406,38 @@ if __name__ == "__main__":
         default=Path("scraper/laws"),
         help="Directory to save the JSON files.",
     )
+    parser.add_argument(
+        "--workers", type=int, default=4, help="Number of URLs scraped concurrently."
+    )
+    parser.add_argument(
+        "--per-host",
+        type=int,
+        default=2,
+        help="Maximum number of concurrent requests to one host.",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=30.0,
+        help="Seconds to wait for the connection and for the response.",
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=Path,
+        default=Path("scraper/.http_cache.json"),
+        help="ETag and Last-Modified of the scraped URLs, to skip unchanged pages.",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=["bs4", "lxml"],
+        default="bs4",
+        help="Build a BeautifulSoup tree, or stream the paragraphs with lxml.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Download and parse every page, even if it is unchanged.",
+    )
 
     args = parser.parse_args()
 
@@ -140,4 +447,12 @@ if __name__ == "__main__":
         with open(args.file, "r", encoding="utf-8") as file:
             urls = [line.strip() for line in file if line.strip()]
 
-    main(urls=urls, output_dir=args.output_dir)
+    main(
+        urls=urls,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        per_host=args.per_host,
+        timeout=args.timeout,
+        cache_path=None if args.no_cache else args.cache_path,
+        parser=args.parser,
+    )
@@ -0,0 +1,484 @@
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+
+from database.api_request_parallel_processor import (
+    APIRequest,
+    RequestScheduler,
+    ResultWriter,
+    StatusTracker,
+    TokenBucket,
+    checkpoint_filepath,
+    deduplicate_results,
+    hash_request,
+    load_checkpoint,
+    parse_duration,
+    process_api_requests,
+    retry_delay,
+)
+
+
+def make_request(task_id: int, save_filepath: str = "results.jsonl") -> APIRequest:
+    return APIRequest(
+        task_id=task_id,
+        request_json={"model": "m", "input": "text"},
+        token_consumption=1,
+        attempts_left=1,
+        metadata=None,
+        save_filepath=save_filepath,
+    )
+
+
+class TokenBucketTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_acquire_sleeps_until_capacity_is_refilled(self) -> None:
+        bucket = TokenBucket(max_requests_per_minute=600, max_tokens_per_minute=1e9)
+        bucket.available_request_capacity = 0
+        start_time = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire(tokens=1)
+        # 600 requests per minute refill one request every 0.1 s
+        self.assertAlmostEqual(time.monotonic() - start_time, 0.5, delta=0.1)
+
+    async def test_token_limit(self) -> None:
+        bucket = TokenBucket(max_requests_per_minute=1e6, max_tokens_per_minute=6000)
+        await bucket.acquire(tokens=6000)
+        start_time = time.monotonic()
+        await bucket.acquire(tokens=20)
+        self.assertAlmostEqual(time.monotonic() - start_time, 0.2, delta=0.1)
+
+
+class RequestSchedulerTests(unittest.IsolatedAsyncioTestCase):
+
+    async def test_requests_are_returned_when_due(self) -> None:
+        scheduler = RequestScheduler()
+        scheduler.put(make_request(0), delay=0.2)
+        scheduler.put(make_request(1))
+        self.assertEqual((await scheduler.get()).task_id, 1)
+
+        self.assertFalse(scheduler.has_ready())
+        start_time = time.monotonic()
+        self.assertEqual((await scheduler.get()).task_id, 0)
+        self.assertAlmostEqual(time.monotonic() - start_time, 0.2, delta=0.1)
+
+    async def test_notify_wakes_up_get(self) -> None:
+        scheduler = RequestScheduler()
+        asyncio.get_running_loop().call_later(0.05, scheduler.notify)
+        self.assertIsNone(await asyncio.wait_for(scheduler.get(), timeout=1))
+
+
+class RetryDelayTests(unittest.TestCase):
+
+    def test_delay_is_jittered_and_capped(self) -> None:
+        delays = [retry_delay(num_errors=3) for _ in range(100)]
+        self.assertTrue(all(0 <= delay <= 8 for delay in delays))
+        self.assertGreater(len(set(delays)), 1)
+        self.assertLessEqual(retry_delay(num_errors=20, max_delay=60), 60)
+
+
+class AdaptiveRateLimitTests(unittest.IsolatedAsyncioTestCase):
+    """Calls a local mock of the embeddings endpoint that emits rate limit headers."""
+
+    async def asyncSetUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_filepath = str(Path(self.temp_dir.name) / "results.jsonl")
+        self.responses = []  # (status, headers) returned by the mock, in order
+
+        async def embeddings(request: web.Request) -> web.Response:
+            status, headers = self.responses.pop(0)
+            if status == 429:
+                body = {"error": {"message": "Too many requests", "type": "requests"}}
+            else:
+                body = {"data": [{"index": 0, "embedding": [0.1, 0.2]}]}
+            return web.json_response(body, status=status, headers=headers)
+
+        app = web.Application()
+        app.router.add_post("/v1/embeddings", embeddings)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/embeddings"
+
+        self.bucket = TokenBucket(max_requests_per_minute=10, max_tokens_per_minute=1000)
+        self.scheduler = RequestScheduler()
+        self.status_tracker = StatusTracker(num_tasks_in_progress=1)
+
+    async def asyncTearDown(self) -> None:
+        await self.runner.cleanup()
+        self.temp_dir.cleanup()
+
+    async def call_api(self, request: APIRequest) -> None:
+        async with ResultWriter() as result_writer, aiohttp.ClientSession() as session:
+            await request.call_api(
+                session=session,
+                request_url=self.request_url,
+                request_header={},
+                scheduler=self.scheduler,
+                status_tracker=self.status_tracker,
+                result_writer=result_writer,
+                rate_limiter=self.bucket,
+            )
+
+    async def test_budget_follows_reported_limits(self) -> None:
+        self.responses.append(
+            (
+                200,
+                {
+                    "x-ratelimit-limit-requests": "3000",
+                    "x-ratelimit-limit-tokens": "1000000",
+                    "x-ratelimit-remaining-requests": "2999",
+                    "x-ratelimit-remaining-tokens": "500",
+                    "x-ratelimit-reset-requests": "20ms",
+                    "x-ratelimit-reset-tokens": "30s",
+                },
+            )
+        )
+        await self.call_api(make_request(0, self.save_filepath))
+
+        self.assertEqual(self.status_tracker.num_tasks_succeeded, 1)
+        self.assertAlmostEqual(self.bucket.max_requests_per_minute, 2700)
+        self.assertAlmostEqual(self.bucket.max_tokens_per_minute, 900000)
+        # The remaining capacity only ever lowers the local estimate
+        self.assertLessEqual(self.bucket.available_request_capacity, 10)
+        self.assertLessEqual(self.bucket.available_token_capacity, 500)
+
+    async def test_exhausted_budget_waits_for_reset(self) -> None:
+        self.responses.append(
+            (
+                429,
+                {
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": "300ms",
+                },
+            )
+        )
+        request = make_request(0, self.save_filepath)
+        request.attempts_left = 1
+        await self.call_api(request)
+
+        # The 429 counts as a rate limit error although the message differs
+        self.assertEqual(self.status_tracker.num_rate_limit_errors, 1)
+        self.assertEqual(len(self.scheduler._queue), 1)
+        start_time = time.monotonic()
+        await self.bucket.acquire(tokens=1)
+        self.assertAlmostEqual(time.monotonic() - start_time, 0.3, delta=0.1)
+
+
+class ResultWriterTests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filenames = [
+            str(Path(self.temp_dir.name) / f"law_{i}_results.jsonl") for i in range(2)
+        ]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def read_lines(self, filename: str) -> list:
+        with open(filename) as file:
+            return [json.loads(line) for line in file]
+
+    async def test_results_are_written_in_order_per_file(self) -> None:
+        async with ResultWriter(max_queue_size=10, batch_size=4) as result_writer:
+            for i in range(50):
+                await result_writer.write([{"id": i}], self.filenames[i % 2])
+
+        self.assertEqual(
+            [line[0]["id"] for line in self.read_lines(self.filenames[0])],
+            list(range(0, 50, 2)),
+        )
+        self.assertEqual(len(self.read_lines(self.filenames[1])), 25)
+
+    async def test_queued_results_are_flushed_on_cancellation(self) -> None:
+        async def produce() -> None:
+            async with ResultWriter(max_queue_size=100) as result_writer:
+                for i in range(20):
+                    await result_writer.write([{"id": i}], self.filenames[0])
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(produce())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertEqual(len(self.read_lines(self.filenames[0])), 20)
+
+    async def test_failed_writer_does_not_block_writes(self) -> None:
+        missing_dir_filename = str(Path(self.temp_dir.name) / "missing" / "r.jsonl")
+
+        async def produce() -> None:
+            async with ResultWriter(max_queue_size=2, batch_size=1) as result_writer:
+                for i in range(100):
+                    await result_writer.write([{"id": i}], missing_dir_filename)
+
+        # Without the error, the writes would wait for the full queue forever
+        with self.assertRaises(FileNotFoundError):
+            await asyncio.wait_for(produce(), timeout=5)
+
+    async def test_close_raises_the_error_of_the_writer(self) -> None:
+        missing_dir_filename = str(Path(self.temp_dir.name) / "missing" / "r.jsonl")
+        with self.assertRaises(FileNotFoundError):
+            async with ResultWriter() as result_writer:
+                await result_writer.write([{"id": 0}], missing_dir_filename)
+                # The writer has failed and stopped before it is closed
+                await asyncio.sleep(0.1)
+
+
+class ParseDurationTests(unittest.TestCase):
+
+    def test_parse_duration(self) -> None:
+        self.assertAlmostEqual(parse_duration("20ms"), 0.02)
+        self.assertAlmostEqual(parse_duration("1s"), 1.0)
+        self.assertAlmostEqual(parse_duration("6m0s"), 360.0)
+        self.assertAlmostEqual(parse_duration("1m30.5s"), 90.5)
+        self.assertAlmostEqual(parse_duration("1h2m"), 3720.0)
+
+
+class CheckpointTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_filepath = str(Path(self.temp_dir.name) / "results.jsonl")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_hash_ignores_key_order_and_empty_metadata(self) -> None:
+        self.assertEqual(
+            hash_request({"model": "m", "input": "a", "metadata": {}}),
+            hash_request({"input": "a", "model": "m"}),
+        )
+        self.assertNotEqual(
+            hash_request({"model": "m", "input": "a", "metadata": {"id": 1}}),
+            hash_request({"model": "m", "input": "a", "metadata": {"id": 2}}),
+        )
+
+    def test_load_checkpoint_terminates_cut_off_lines(self) -> None:
+        request_hash = hash_request({"model": "m", "input": "a"})
+        with open(self.save_filepath, "w") as file:
+            file.write('[{"model": "m", "input": "a"}, {"data": []}]\n[{"mo')
+        with open(checkpoint_filepath(self.save_filepath), "w") as file:
+            file.write(json.dumps(request_hash) + '\n"ab')
+
+        self.assertEqual(load_checkpoint(self.save_filepath), {request_hash})
+        with open(self.save_filepath) as file:
+            self.assertTrue(file.read().endswith("\n"))
+
+    def test_stale_checkpoint_is_removed(self) -> None:
+        with open(checkpoint_filepath(self.save_filepath), "w") as file:
+            file.write(json.dumps("abc") + "\n")
+
+        self.assertEqual(load_checkpoint(self.save_filepath), set())
+        self.assertFalse(Path(checkpoint_filepath(self.save_filepath)).exists())
+
+    def test_deduplicate_prefers_success(self) -> None:
+        request = {"model": "m", "input": "a"}
+        lines = [
+            [request, ["Timeout"], {"id": 1}],
+            [request, {"data": [1]}, {"id": 1}],
+            [request, {"data": [2]}, {"id": 1}],
+            [request, ["Timeout"], {"id": 1}],
+            [request, ["Timeout"], {"id": 2}],
+        ]
+        with open(self.save_filepath, "w") as file:
+            for line in lines:
+                file.write(json.dumps(line) + "\n")
+            file.write('[{"mo\n')
+
+        deduplicate_results(self.save_filepath)
+
+        with open(self.save_filepath) as file:
+            results = [json.loads(line) for line in file]
+        self.assertEqual(results, [lines[2], lines[4]])
+
+
+class BackpressureTests(unittest.IsolatedAsyncioTestCase):
+    """Sends requests to a slow local mock, counting the calls it serves at once."""
+
+    async def asyncSetUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_filepath = str(Path(self.temp_dir.name) / "results.jsonl")
+        self.concurrent_calls = 0
+        self.peak_concurrent_calls = 0
+        self.request_bodies = []
+
+        async def embeddings(request: web.Request) -> web.Response:
+            self.request_bodies.append(await request.json())
+            self.concurrent_calls += 1
+            self.peak_concurrent_calls = max(
+                self.peak_concurrent_calls, self.concurrent_calls
+            )
+            await asyncio.sleep(0.05)
+            self.concurrent_calls -= 1
+            return web.json_response({"data": [{"index": 0, "embedding": [0.1]}]})
+
+        app = web.Application()
+        app.router.add_post("/v1/embeddings", embeddings)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/embeddings"
+
+    async def asyncTearDown(self) -> None:
+        await self.runner.cleanup()
+        self.temp_dir.cleanup()
+
+    async def process(self, num_requests: int, **kwargs) -> StatusTracker:
+        # Stored token counts spare the processor from loading a tiktoken encoding
+        requests = (
+            (
+                {"model": "m", "input": f"text {i}", "token_consumption": 1},
+                self.save_filepath,
+            )
+            for i in range(num_requests)
+        )
+        return await process_api_requests(
+            requests=requests,
+            request_url=self.request_url,
+            api_key="key",
+            max_requests_per_minute=1e6,
+            max_tokens_per_minute=1e6,
+            token_encoding_name="cl100k_base",
+            max_attempts=1,
+            **kwargs,
+        )
+
+    async def test_requests_in_flight_are_bounded(self) -> None:
+        status_tracker = await self.process(40, max_in_flight=4)
+
+        self.assertEqual(status_tracker.num_tasks_succeeded, 40)
+        self.assertEqual(status_tracker.peak_requests_in_flight, 4)
+        self.assertLessEqual(self.peak_concurrent_calls, 4)
+        self.assertLessEqual(status_tracker.num_connections_opened, 4)
+        # The stored token count is not sent to the API
+        self.assertNotIn("token_consumption", self.request_bodies[0])
+
+    async def test_status_file_reports_metrics(self) -> None:
+        status_filepath = Path(self.temp_dir.name) / "status.json"
+        await self.process(
+            20,
+            total=20,
+            max_in_flight=5,
+            status_filepath=str(status_filepath),
+            status_interval=0.05,
+        )
+
+        with open(status_filepath) as file:
+            status = json.load(file)
+        self.assertEqual(status["requests"]["succeeded"], 20)
+        self.assertEqual(status["attempts"], {"1": 20})
+        self.assertEqual(sum(status["latency_seconds"]["histogram"].values()), 20)
+        self.assertGreaterEqual(status["latency_seconds"]["mean"], 0.05)
+        self.assertGreater(status["throughput"]["average_tokens_per_minute"], 0)
+        self.assertEqual(status["throughput"]["max_tokens_per_minute"], 1e6)
+        self.assertEqual(status["queues"]["in_flight"], 0)
+        self.assertEqual(status["eta_seconds"], 0)
+
+
+class ResumeTests(unittest.IsolatedAsyncioTestCase):
+    """Runs the processor twice against a local mock that fails some inputs once."""
+
+    async def asyncSetUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.save_filepath = str(Path(self.temp_dir.name) / "results.jsonl")
+        self.failing_inputs = set()
+        self.request_inputs = []
+
+        async def embeddings(request: web.Request) -> web.Response:
+            body = await request.json()
+            self.request_inputs.append(body["input"])
+            if body["input"] in self.failing_inputs:
+                return web.json_response(
+                    {"error": {"message": "The server had an error."}}, status=500
+                )
+            return web.json_response({"data": [{"index": 0, "embedding": [0.1]}]})
+
+        app = web.Application()
+        app.router.add_post("/v1/embeddings", embeddings)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.request_url = f"http://127.0.0.1:{port}/v1/embeddings"
+
+    async def asyncTearDown(self) -> None:
+        await self.runner.cleanup()
+        self.temp_dir.cleanup()
+
+    async def process(self) -> StatusTracker:
+        self.request_inputs = []
+        requests = (
+            (
+                {"model": "m", "input": f"text {i}", "token_consumption": 1},
+                self.save_filepath,
+            )
+            for i in range(6)
+        )
+        return await process_api_requests(
+            requests=requests,
+            request_url=self.request_url,
+            api_key="key",
+            max_requests_per_minute=1e6,
+            max_tokens_per_minute=1e6,
+            token_encoding_name="cl100k_base",
+            max_attempts=1,
+            checkpoint=True,
+        )
+
+    async def test_second_run_sends_only_the_failed_requests(self) -> None:
+        self.failing_inputs = {"text 2", "text 4"}
+        status_tracker = await self.process()
+        self.assertEqual(status_tracker.num_tasks_succeeded, 4)
+        self.assertEqual(status_tracker.num_tasks_failed, 2)
+        with open(checkpoint_filepath(self.save_filepath)) as file:
+            self.assertEqual(len(file.read().splitlines()), 4)
+
+        self.failing_inputs = set()
+        status_tracker = await self.process()
+
+        self.assertEqual(sorted(self.request_inputs), ["text 2", "text 4"])
+        self.assertEqual(status_tracker.num_tasks_skipped, 4)
+        self.assertEqual(status_tracker.num_tasks_succeeded, 2)
+        with open(self.save_filepath) as file:
+            results = [json.loads(line) for line in file]
+        # One successful result per request, the failed attempts are dropped
+        self.assertEqual(
+            sorted(result[0]["input"] for result in results),
+            [f"text {i}" for i in range(6)],
+        )
+        self.assertTrue(all("data" in result[1] for result in results))
+
+        await self.process()
+        self.assertEqual(self.request_inputs, [])
+
+
+class EntryPointTests(unittest.TestCase):
+
+    def test_help(self) -> None:
+        # Run from the repository root as the module docstring shows
+        output = subprocess.run(
+            [sys.executable, "-m", "database.api_request_parallel_processor", "--help"],
+            cwd=Path(__file__).parent.parent,
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        self.assertIn("--requests_filepath", output)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import tempfile
+import unittest
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from database.backends import NumpyBackend, QdrantBackend
+
+
+class NumpyBackendTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.collection_name = "test_collection"
+        self.vector_size = 5
+        vectors = [
+            [0.83339819, 0.18442204, 0.73398492, 0.07254654, 0.59678415],
+            [0.82178091, 0.62781154, 0.61448299, 0.42460477, 0.17078789],
+            [0.40205651, 0.23181339, 0.66545951, 0.63117029, 0.69641706],
+            [0.63051502, 0.41224181, 0.34113335, 0.28599009, 0.98405654],
+            [0.86858374, 0.96695683, 0.90005845, 0.36327329, 0.05520949],
+        ]
+        self.points = [
+            PointStruct(id=i, vector=vector, payload={"text": f"article {i}"})
+            for i, vector in enumerate(vectors)
+        ]
+        self.numpy_backend = NumpyBackend(path=self.temp_dir.name)
+        self.qdrant_backend = QdrantBackend(client=QdrantClient(":memory:"), local=True)
+        for backend in [self.numpy_backend, self.qdrant_backend]:
+            backend.create_collection(
+                name=self.collection_name, vector_size=self.vector_size
+            )
+            backend.upsert(collection=self.collection_name, points=self.points[:3])
+            backend.upsert(collection=self.collection_name, points=self.points[3:])
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_count(self) -> None:
+        self.assertEqual(self.numpy_backend.count(self.collection_name), 5)
+
+    def test_search_matches_qdrant(self) -> None:
+        for point in self.points:
+            expected = self.qdrant_backend.search(
+                collection=self.collection_name, query_vector=point.vector, limit=3
+            )
+            result = self.numpy_backend.search(
+                collection=self.collection_name, query_vector=point.vector, limit=3
+            )
+            self.assertEqual([p.id for p in result], [p.id for p in expected])
+            for actual_point, expected_point in zip(result, expected):
+                self.assertAlmostEqual(actual_point.score, expected_point.score, 5)
+                self.assertEqual(actual_point.payload, expected_point.payload)
+
+    def test_upsert_replaces_existing_points(self) -> None:
+        self.numpy_backend.upsert(
+            collection=self.collection_name,
+            points=[
+                PointStruct(id=1, vector=self.points[4].vector, payload={"text": "new"})
+            ],
+        )
+        result = self.numpy_backend.search(
+            collection=self.collection_name,
+            query_vector=self.points[4].vector,
+            limit=2,
+            with_vectors=True,
+        )
+        self.assertEqual(self.numpy_backend.count(self.collection_name), 5)
+        self.assertEqual({p.id for p in result}, {1, 4})
+        self.assertEqual(len(result[0].vector), self.vector_size)
+
+    def test_delete_matches_qdrant(self) -> None:
+        for backend in [self.numpy_backend, self.qdrant_backend]:
+            backend.delete(collection=self.collection_name, ids=[1, 3, 42])
+            result = backend.search(
+                collection=self.collection_name,
+                query_vector=self.points[0].vector,
+                limit=5,
+            )
+            self.assertEqual(backend.count(self.collection_name), 3)
+            self.assertEqual({p.id for p in result}, {0, 2, 4})
+
+    def test_writes_of_another_instance_are_seen(self) -> None:
+        # The app keeps its own instance while the indexer writes in another process
+        writer = NumpyBackend(path=self.temp_dir.name)
+        new_point = PointStruct(id=5, vector=[0.0, 0.0, 0.0, 0.0, 1.0], payload={})
+        writer.upsert(collection=self.collection_name, points=[new_point])
+
+        self.assertEqual(self.numpy_backend.count(self.collection_name), 6)
+        result = self.numpy_backend.search(
+            collection=self.collection_name, query_vector=new_point.vector, limit=1
+        )
+        self.assertEqual(result[0].id, 5)
+
+        writer.delete(collection=self.collection_name, ids=[5])
+        self.assertEqual(self.numpy_backend.count(self.collection_name), 5)
+
+    def test_replaced_points_of_another_instance_are_seen(self) -> None:
+        self.numpy_backend.search(
+            collection=self.collection_name, query_vector=self.points[0].vector
+        )
+        writer = NumpyBackend(path=self.temp_dir.name)
+        writer.upsert(
+            collection=self.collection_name,
+            points=[PointStruct(id=0, vector=self.points[0].vector, payload={})],
+        )
+
+        result = self.numpy_backend.search(
+            collection=self.collection_name, query_vector=self.points[0].vector
+        )
+        self.assertEqual(len(result), 5)
+        self.assertEqual(result[0].id, 0)
+        self.assertEqual(result[0].payload, {})
+        self.assertEqual(
+            {p.id: p.payload["text"] for p in result[1:]},
+            {i: f"article {i}" for i in range(1, 5)},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,240 @@
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from qdrant_client.http.models import PointStruct, ScoredPoint
+
+from database.backends import NumpyBackend
+from database.utils import format_context, get_context, mmr_rerank
+from utils import Config, determine_context, get_context_budget, load_config
+
+
+def count_words(text: str, model: str) -> int:
+    """Stands in for the tokenizer, whose encodings are downloaded on first use."""
+    return len(text.split())
+
+
+def article(id: int, words: int = 1, collection: str = "zakon"):
+    return {
+        "title": f"Član {id}",
+        "link": f"{collection}#clan_{id}",
+        "text": " ".join(["reč"] * words),
+    }
+
+
+def scored_point(id: int, score: float, words: int = 1, collection: str = "zakon"):
+    payload = article(id, words=words, collection=collection)
+    return ScoredPoint(id=id, version=0, score=score, payload=payload)
+
+
+# Articles 0 and 1 are near-duplicates, article 2 is less relevant but different
+QUERY = [1.0, 1.0]
+NEAR_DUPLICATES = {0: [1.0, 0.31], 1: [1.0, 0.30], 2: [0.2, 1.0]}
+
+
+def context_ids(context: str):
+    return [
+        int(line.removeprefix("Naslov: Član "))
+        for line in context.splitlines()
+        if line.startswith("Naslov: ")
+    ]
+
+
+@patch("database.utils.num_tokens_from_string", count_words)
+class GetContextTests(unittest.TestCase):
+
+    def test_results_are_packed_by_descending_score(self) -> None:
+        results = [scored_point(1, 0.5), scored_point(2, 0.9), scored_point(3, 0.7)]
+
+        context = get_context(results)
+
+        self.assertEqual(context_ids(context), [2, 3, 1])
+        self.assertEqual(
+            context,
+            "\n".join(format_context(results[i].payload) for i in [1, 2, 0]),
+        )
+
+    def test_top_k(self) -> None:
+        results = [scored_point(id, 1 - id / 10) for id in range(5)]
+        self.assertEqual(context_ids(get_context(results, top_k=3)), [0, 1, 2])
+
+    def test_collections_are_merged_by_score(self) -> None:
+        labor_law = [scored_point(1, 0.9, collection="zakon_o_radu")]
+        labor_law.append(scored_point(2, 0.6, collection="zakon_o_radu"))
+        family_law = [scored_point(3, 0.8, collection="porodicni_zakon")]
+        family_law.append(scored_point(4, 0.7, collection="porodicni_zakon"))
+
+        context = get_context(labor_law + family_law, top_k=3)
+
+        self.assertEqual(context_ids(context), [1, 3, 4])
+        self.assertIn("porodicni_zakon#clan_3", context)
+
+    def test_token_budget_skips_results_that_do_not_fit(self) -> None:
+        results = [
+            scored_point(1, 0.9, words=10),
+            scored_point(2, 0.8, words=50),
+            scored_point(3, 0.7, words=10),
+        ]
+        # The title and link lines are 7 words, one token joins the contexts, so
+        # the short articles take 18 tokens and the long one 58
+        self.assertEqual(context_ids(get_context(results, token_budget=36)), [1, 3])
+        self.assertEqual(context_ids(get_context(results, token_budget=35)), [1])
+        self.assertEqual(get_context(results, token_budget=17), "")
+
+    def test_keep_order(self) -> None:
+        results = [scored_point(1, 0.9), scored_point(3, 0.7), scored_point(2, 0.8)]
+
+        context = get_context(results, top_k=2, score_gap=0.25, keep_order=True)
+
+        self.assertEqual(context_ids(context), [1, 3])
+        # The score gap is measured by score, not between neighbours in the order
+        context = get_context(results, score_gap=0.05, min_results=2, keep_order=True)
+        self.assertEqual(context_ids(context), [1, 2])
+
+    def test_score_gap_stops_at_the_first_large_drop(self) -> None:
+        results = [
+            scored_point(1, 0.90),
+            scored_point(2, 0.85),
+            scored_point(3, 0.60),
+            scored_point(4, 0.58),
+        ]
+        self.assertEqual(context_ids(get_context(results, score_gap=0.1)), [1, 2])
+        self.assertEqual(
+            context_ids(get_context(results, score_gap=0.3)), [1, 2, 3, 4]
+        )
+
+    def test_min_results_are_kept_regardless_of_the_score_gap(self) -> None:
+        results = [scored_point(1, 0.9), scored_point(2, 0.4), scored_point(3, 0.35)]
+
+        self.assertEqual(context_ids(get_context(results, score_gap=0.1)), [1])
+        self.assertEqual(
+            context_ids(get_context(results, score_gap=0.1, min_results=2)), [1, 2, 3]
+        )
+        self.assertEqual(
+            context_ids(get_context(results, score_gap=0.01, min_results=2)), [1, 2]
+        )
+
+
+class MMRRerankTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.results = [
+            ScoredPoint(id=id, version=0, score=0.0, payload={}, vector=vector)
+            for id, vector in NEAR_DUPLICATES.items()
+        ]
+
+    def test_near_duplicates_are_not_selected_together(self) -> None:
+        selected = mmr_rerank(self.results, query_vector=QUERY, top_k=2)
+        self.assertEqual([point.id for point in selected], [0, 2])
+
+    def test_selection_order_trades_relevance_for_diversity(self) -> None:
+        selected = mmr_rerank(self.results, query_vector=QUERY, top_k=3)
+        self.assertEqual([point.id for point in selected], [0, 2, 1])
+
+    def test_relevance_only(self) -> None:
+        selected = mmr_rerank(
+            self.results, query_vector=QUERY, top_k=2, lambda_mult=1.0
+        )
+        self.assertEqual([point.id for point in selected], [0, 1])
+
+    def test_top_k_is_bounded_by_the_results(self) -> None:
+        self.assertEqual(len(mmr_rerank(self.results, QUERY, top_k=10)), 3)
+        self.assertEqual(mmr_rerank(self.results[:1], QUERY, top_k=1), self.results[:1])
+        self.assertEqual(mmr_rerank([], QUERY, top_k=2), [])
+
+
+class DetermineContextTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.backend = NumpyBackend(path=self.temp_dir.name)
+        self.backend.create_collection(name="zakon", vector_size=2)
+        # Ten hits, the search limit of the config: one article in nine versions
+        # that differ only slightly, and one different article
+        points = [
+            PointStruct(id=id, vector=[1.0, 0.3 + id / 1000], payload=article(id))
+            for id in range(9)
+        ]
+        points.append(PointStruct(id=9, vector=[0.2, 1.0], payload=article(9)))
+        self.backend.upsert(collection="zakon", points=points)
+        self.config = load_config()
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_mmr_order_is_kept(self) -> None:
+        context = determine_context(
+            collections=["zakon"],
+            embedding=QUERY,
+            retrieval_backend=self.backend,
+            config=self.config,
+        )
+
+        ids = context_ids(context)
+        self.assertEqual(len(ids), 10)
+        # The different article is packed right after the most relevant one
+        self.assertEqual(ids[:2], [8, 9])
+
+    @patch("database.utils.num_tokens_from_string", count_words)
+    def test_token_budget_cuts_the_mmr_selection(self) -> None:
+        # Every article takes 9 tokens, see GetContextTests
+        context = determine_context(
+            collections=["zakon"],
+            embedding=QUERY,
+            retrieval_backend=self.backend,
+            config=self.config,
+            token_budget=7 * 9,
+        )
+
+        ids = context_ids(context)
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(ids[:2], [8, 9])
+
+    def test_mmr_top_k(self) -> None:
+        self.config.context.mmr.top_k = 3
+
+        context = determine_context(
+            collections=["zakon"],
+            embedding=QUERY,
+            retrieval_backend=self.backend,
+            config=self.config,
+        )
+
+        self.assertEqual(len(context_ids(context)), 3)
+
+    def test_without_mmr_the_hits_are_packed_by_score(self) -> None:
+        self.config.context.mmr.enabled = False
+
+        context = determine_context(
+            collections=["zakon"],
+            embedding=QUERY,
+            retrieval_backend=self.backend,
+            config=self.config,
+        )
+
+        self.assertEqual(context_ids(context), [8, 7, 6, 5, 4, 3, 2, 1, 0, 9])
+
+
+@patch("utils.num_tokens_from_string", count_words)
+class GetContextBudgetTests(unittest.TestCase):
+
+    def config(self, max_prompt_tokens: int, min_context_tokens: int) -> Config:
+        config = load_config()
+        config.context.max_prompt_tokens = max_prompt_tokens
+        config.context.min_context_tokens = min_context_tokens
+        return config
+
+    def test_prompt_tokens_are_taken_from_the_budget(self) -> None:
+        budget = get_context_budget("pitanje", "", self.config(100_000, 0))
+        longer_budget = get_context_budget(
+            "pitanje", "prethodni razgovor " * 100, self.config(100_000, 0)
+        )
+        self.assertLess(budget, 100_000)
+        self.assertEqual(budget - longer_budget, 200)
+
+    def test_budget_is_never_below_the_minimum(self) -> None:
+        self.assertEqual(get_context_budget("pitanje", "", self.config(10, 500)), 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from database.utils import (
+    LoadReport,
+    embedding_files,
+    iter_embedding_batches,
+    load_and_process_embeddings,
+    metadata_path,
+    split_embedding_results,
+    write_embedding_arrays,
+)
+
+
+class SplitEmbeddingResultsTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.results_path = Path(self.temp_dir.name) / "results.jsonl"
+        self.output_path = Path(self.temp_dir.name) / "embeddings.jsonl"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write_results(self, lines) -> None:
+        with open(self.results_path, "w", encoding="utf-8") as file:
+            for line in lines:
+                file.write(json.dumps(line) + "\n")
+
+    def batch(self, ids):
+        request = {"model": "m", "input": [f"Član {id}: tekst" for id in ids]}
+        metadata = {
+            "articles": [
+                {"id": id, "title": f"Član {id}", "link": f"clan_{id}"} for id in ids
+            ]
+        }
+        return request, metadata
+
+    def test_embeddings_are_matched_by_index(self) -> None:
+        request, metadata = self.batch([7, 8, 9])
+        # The API may return the embeddings in any order
+        response = {
+            "data": [
+                {"index": index, "embedding": [float(id), 1.0]}
+                for index, id in reversed(list(enumerate([7, 8, 9])))
+            ]
+        }
+        self.write_results([[request, response, metadata]])
+        split_embedding_results(self.results_path, self.output_path)
+
+        points = load_and_process_embeddings(self.output_path)
+        self.assertEqual([point.id for point in points], [7, 8, 9])
+        for point in points:
+            self.assertEqual(point.vector[0], float(point.id))
+            self.assertEqual(point.payload["text"], f"Član {point.id}: tekst")
+            self.assertEqual(point.payload["link"], f"clan_{point.id}")
+
+    def test_failed_request_fails_only_its_articles(self) -> None:
+        request, metadata = self.batch([1, 2])
+        failed_request, failed_metadata = self.batch([3])
+        response = {
+            "data": [
+                {"index": 0, "embedding": [1.0, 0.0]},
+                {"index": 1, "embedding": [0.0, 1.0]},
+            ]
+        }
+        self.write_results(
+            [
+                [request, response, metadata],
+                [failed_request, ["maximum context length"], failed_metadata],
+            ]
+        )
+        split_embedding_results(self.results_path, self.output_path)
+
+        with open(self.output_path, "r", encoding="utf-8") as file:
+            self.assertEqual(len(file.readlines()), 3)
+        points = load_and_process_embeddings(self.output_path)
+        self.assertEqual([point.id for point in points], [1, 2])
+
+    def test_missing_embedding_fails_only_its_article(self) -> None:
+        request, metadata = self.batch([1, 2, 3])
+        response = {
+            "data": [
+                {"index": 0, "embedding": [1.0, 0.0]},
+                {"index": 2, "embedding": [0.0, 1.0]},
+            ]
+        }
+        self.write_results([[request, response, metadata]])
+        split_embedding_results(self.results_path, self.output_path)
+
+        points = load_and_process_embeddings(self.output_path)
+        self.assertEqual([point.id for point in points], [1, 3])
+        self.assertEqual(points[1].vector, [0.0, 1.0])
+
+        npy_path = Path(self.temp_dir.name) / "embeddings.npy"
+        write_embedding_arrays(self.results_path, npy_path)
+        self.assertEqual(load_and_process_embeddings(npy_path), points)
+
+    def test_binary_format_matches_jsonl(self) -> None:
+        request, metadata = self.batch([1, 2])
+        failed_request, failed_metadata = self.batch([3])
+        response = {
+            "data": [
+                {"index": 1, "embedding": [0.0, 1.0, 0.5]},
+                {"index": 0, "embedding": [1.0, 0.0, 0.25]},
+            ]
+        }
+        self.write_results(
+            [
+                [request, response, metadata],
+                [failed_request, ["maximum context length"], failed_metadata],
+            ]
+        )
+        split_embedding_results(self.results_path, self.output_path)
+        expected = load_and_process_embeddings(self.output_path)
+
+        for dtype in ["float32", "float16"]:
+            npy_path = Path(self.temp_dir.name) / f"embeddings_{dtype}.npy"
+            write_embedding_arrays(self.results_path, npy_path, dtype=dtype)
+
+            self.assertEqual(np.load(npy_path).dtype, np.dtype(dtype))
+            with open(metadata_path(npy_path), "r", encoding="utf-8") as file:
+                self.assertEqual(len(file.readlines()), 3)
+            points = load_and_process_embeddings(npy_path)
+            self.assertEqual(points, expected)
+
+    def test_binary_format_without_embeddings(self) -> None:
+        request, metadata = self.batch([1])
+        self.write_results([[request, ["Timeout"], metadata]])
+        npy_path = Path(self.temp_dir.name) / "embeddings.npy"
+        write_embedding_arrays(self.results_path, npy_path)
+
+        self.assertEqual(load_and_process_embeddings(npy_path), [])
+        # The sidecar is not an embedding file of its own
+        self.assertEqual(
+            embedding_files(Path(self.temp_dir.name)), [npy_path, self.results_path]
+        )
+
+    def test_batches_are_streamed_and_bad_records_reported(self) -> None:
+        request, metadata = self.batch(list(range(5)))
+        failed_request, failed_metadata = self.batch([5])
+        response = {
+            "data": [{"index": index, "embedding": [1.0, 0.0]} for index in range(5)]
+        }
+        self.write_results(
+            [
+                [request, response, metadata],
+                [failed_request, ["Timeout"], failed_metadata],
+            ]
+        )
+        split_embedding_results(self.results_path, self.output_path)
+        with open(self.output_path, "a", encoding="utf-8") as file:
+            file.write('[{"id": 6, "title"\n')  # cut off by a crash
+
+        report = LoadReport()
+        batches = iter_embedding_batches(self.output_path, batch_size=2, report=report)
+        first_batch = next(batches)
+        # Records are parsed lazily, the rest of the file is not read yet
+        self.assertEqual(report, LoadReport(loaded=2))
+        self.assertEqual([point.id for point in first_batch], [0, 1])
+
+        self.assertEqual([len(batch) for batch in batches], [2, 1])
+        self.assertEqual(report, LoadReport(loaded=5, skipped=1, malformed=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from database.embedding_cache import EmbeddingCache
+
+
+class EmbeddingCacheTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = Path(self.temp_dir.name) / "embeddings.sqlite"
+        self.model = "text-embedding-3-small"
+        self.dimensions = 4
+        self.embedding = [0.25, 0.5, 0.75, 1.0]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def test_normalized_text_shares_entry(self) -> None:
+        cache = EmbeddingCache(max_size=2)
+        cache.put("Koliko je sati?", self.model, self.dimensions, self.embedding)
+
+        self.assertEqual(
+            cache.get("  Koliko je   sati? ", self.model, self.dimensions),
+            self.embedding,
+        )
+        self.assertIsNone(cache.get("Koliko je sati?", self.model, 8))
+        self.assertEqual(cache.stats()["memory_hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_lru_eviction(self) -> None:
+        cache = EmbeddingCache(max_size=2)
+        for text in ["a", "b", "c"]:
+            cache.put(text, self.model, self.dimensions, self.embedding)
+
+        self.assertIsNone(cache.get("a", self.model, self.dimensions))
+        self.assertIsNotNone(cache.get("c", self.model, self.dimensions))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_disk_tier_survives_restart(self) -> None:
+        cache = EmbeddingCache(max_size=1, path=self.cache_path, max_disk_size=2)
+        for text in ["a", "b", "c"]:
+            cache.put(text, self.model, self.dimensions, self.embedding)
+
+        restarted_cache = EmbeddingCache(max_size=1, path=self.cache_path)
+        self.assertEqual(
+            restarted_cache.get("c", self.model, self.dimensions), self.embedding
+        )
+        self.assertIsNone(restarted_cache.get("a", self.model, self.dimensions))
+        self.assertEqual(restarted_cache.stats()["disk_hits"], 1)
+        self.assertEqual(restarted_cache.stats()["disk_size"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from typing import List, Tuple
+
+from llm.history import ConversationHistory, format_turn
+from llm.prompts import SUMMARY_HEADER
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def conversation(num_messages: int):
+    """Messages whose turns are 10 words each, "role:" included."""
+    return [
+        {
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join([f"poruka{i}"] * 9),
+        }
+        for i in range(num_messages)
+    ]
+
+
+class StubSummarizer:
+    """Records every call and returns a numbered summary."""
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, str]] = []
+
+    def __call__(self, summary: str, turns: str) -> str:
+        self.calls.append((summary, turns))
+        return f"sažetak {len(self.calls)}"
+
+
+class ConversationHistoryTests(unittest.TestCase):
+
+    # Four turns of 10 words fit, the fifth does not
+    token_budget = 45
+
+    def setUp(self) -> None:
+        self.history = ConversationHistory()
+        self.summarize = StubSummarizer()
+
+    def render(self, messages) -> str:
+        return self.history.render(
+            messages=messages,
+            token_budget=self.token_budget,
+            count_tokens=count_words,
+            summarize=self.summarize,
+        )
+
+    def test_turns_within_the_budget_are_kept_verbatim(self) -> None:
+        messages = conversation(4)
+
+        rendered = self.render(messages)
+
+        self.assertEqual(rendered, "\n".join(map(format_turn, messages)))
+        self.assertEqual(self.summarize.calls, [])
+
+    def test_older_turns_are_folded_down_to_half_the_budget(self) -> None:
+        messages = conversation(5)
+
+        rendered = self.render(messages)
+
+        # Half the budget holds the two newest turns, the rest is summarized
+        self.assertEqual(
+            self.summarize.calls,
+            [("", "\n".join(map(format_turn, messages[:3])))],
+        )
+        self.assertEqual(self.history.num_summarized, 3)
+        self.assertEqual(
+            rendered,
+            SUMMARY_HEADER.format(summary="sažetak 1")
+            + "\n".join(map(format_turn, messages[3:])),
+        )
+
+    def test_summary_is_updated_only_with_newly_folded_turns(self) -> None:
+        messages = conversation(9)
+        self.render(messages[:5])
+
+        # The window has room again, so the next turns are added without summarizing
+        for end in [6, 7]:
+            self.render(messages[:end])
+        self.assertEqual(len(self.summarize.calls), 1)
+
+        self.render(messages[:8])
+        self.assertEqual(
+            self.summarize.calls[1],
+            ("sažetak 1", "\n".join(map(format_turn, messages[3:6]))),
+        )
+        self.assertEqual(self.history.num_summarized, 6)
+
+    def test_forget_keeps_the_summary_in_sync_with_dropped_messages(self) -> None:
+        messages = conversation(5)
+        rendered = self.render(messages)
+
+        self.history.forget(2)
+
+        self.assertEqual(self.history.num_summarized, 1)
+        self.assertEqual(self.render(messages[2:]), rendered)
+        self.assertEqual(len(self.summarize.calls), 1)
+
+    def test_forget_is_bounded(self) -> None:
+        self.history.num_summarized = 3
+
+        self.history.forget(-1)
+        self.assertEqual(self.history.num_summarized, 3)
+        self.history.forget(10)
+        self.assertEqual(self.history.num_summarized, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+from database.indexer import article_key, diff_articles, hash_articles, point_id
+
+
+class IndexerTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.model = "text-embedding-3-small"
+        self.articles = [
+            {"title": f"Član {i}", "link": f"clan_{i}", "texts": [f"Tekst {i}."]}
+            for i in range(1, 5)
+        ]
+        self.previous = hash_articles(self.articles, self.model)
+
+    def test_unchanged_law_has_empty_diff(self) -> None:
+        diff = diff_articles(current=self.previous, previous=self.previous)
+        self.assertEqual((diff.changed, diff.removed, diff.unchanged), ([], [], 4))
+
+    def test_diff_finds_changed_new_and_removed_articles(self) -> None:
+        articles = [dict(article) for article in self.articles[1:]]
+        articles[0]["texts"] = ["Izmenjen tekst."]
+        articles.append({"title": "Član 5", "link": "clan_5", "texts": ["Novi."]})
+
+        diff = diff_articles(
+            current=hash_articles(articles, self.model), previous=self.previous
+        )
+        self.assertEqual(diff.changed, [article_key(articles[0]), "Član 5|clan_5"])
+        self.assertEqual(diff.removed, [article_key(self.articles[0])])
+        self.assertEqual(diff.unchanged, 2)
+
+    def test_model_change_changes_every_hash(self) -> None:
+        diff = diff_articles(
+            current=hash_articles(self.articles, "text-embedding-3-large"),
+            previous=self.previous,
+        )
+        self.assertEqual(len(diff.changed), 4)
+
+    def test_point_id_is_stable_per_law(self) -> None:
+        key = article_key(self.articles[0])
+        self.assertEqual(point_id("zakon_o_radu", key), point_id("zakon_o_radu", key))
+        self.assertNotEqual(
+            point_id("zakon_o_radu", key), point_id("porodicni_zakon", key)
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
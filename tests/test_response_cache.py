@@ -0,0 +1,80 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from llm.response_cache import ResponseCache, replay_answer
+from utils import get_prompt_version, load_config
+
+
+class ResponseCacheTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResponseCache(
+            path=Path(self.temp_dir.name) / "responses.sqlite",
+            similarity_threshold=0.95,
+        )
+        self.collections = ["zakon_o_radu", "porodicni_zakon"]
+        self.prompt_version = "v1"
+        self.embedding = [1.0, 0.0, 0.0]
+        self.answer = "**Sažetak**\nImate pravo na  20 dana godišnjeg odmora.\n"
+        self.cache.put(
+            embedding=self.embedding,
+            collections=self.collections,
+            prompt_version=self.prompt_version,
+            answer=self.answer,
+        )
+
+    def tearDown(self) -> None:
+        self.cache._connection.close()
+        self.temp_dir.cleanup()
+
+    def test_similar_query_hits(self) -> None:
+        answer = self.cache.get(
+            embedding=[0.99, 0.05, 0.0],
+            collections=list(reversed(self.collections)),
+            prompt_version=self.prompt_version,
+        )
+        self.assertEqual(answer, self.answer)
+
+    def test_misses(self) -> None:
+        # Dissimilar query, different collections and different prompt version
+        self.assertIsNone(
+            self.cache.get([0.0, 1.0, 0.0], self.collections, self.prompt_version)
+        )
+        self.assertIsNone(
+            self.cache.get(self.embedding, ["zakon_o_radu"], self.prompt_version)
+        )
+        self.assertIsNone(self.cache.get(self.embedding, self.collections, "v2"))
+
+    def test_invalidate_collection(self) -> None:
+        self.assertEqual(self.cache.invalidate(["zakon_o_zastiti_potrosaca"]), 0)
+        self.assertEqual(self.cache.invalidate(["porodicni_zakon"]), 1)
+        self.assertIsNone(
+            self.cache.get(self.embedding, self.collections, self.prompt_version)
+        )
+
+    def test_replay_preserves_answer(self) -> None:
+        chunks = list(replay_answer(self.answer, chunk_size=3))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), self.answer)
+
+
+class PromptVersionTests(unittest.TestCase):
+
+    def test_context_settings_change_the_version(self) -> None:
+        config = load_config()
+        version = get_prompt_version(config)
+        self.assertEqual(get_prompt_version(load_config()), version)
+
+        for field, value in [("max_articles", 3), ("max_prompt_tokens", 8000)]:
+            changed = load_config()
+            setattr(changed.context, field, value)
+            self.assertNotEqual(get_prompt_version(changed), version)
+        changed = load_config()
+        changed.context.mmr.lambda_mult = 0.5
+        self.assertNotEqual(get_prompt_version(changed), version)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,12 +3,52 @@ import unittest
 from pathlib import Path
 from typing import List
 
+import numpy as np
+from loguru import logger
 from openai import OpenAI
+from qdrant_client import QdrantClient
 
+from router.centroid_router import CentroidRouter, routing_agreement
 from router.query_router import semantic_query_router
 from router.router_prompt import ROUTER_PROMPT
 from utils import load_config
 
+# Define test cases for both Serbian and English queries
+TEST_QUERIES_SR = [
+    (
+        "Da li mogu da tražim alimentaciju ako se razvedem?",
+        ["porodicni_zakon"],
+    ),
+    (
+        "Kako da zaštitim svoje podatke na internetu?",
+        ["zakon_o_zastiti_podataka_o_licnosti"],
+        # ["zakon_o_zastiti_podataka_o_licnosti", "zakon_o_zastiti_potrosaca"],
+    ),
+    (
+        "Šta su moja prava kao potrošača i lica na koje se podaci odnose kada kupujem online?",
+        ["zakon_o_zastiti_potrosaca", "zakon_o_zastiti_podataka_o_licnosti"],
+    ),
+    ("Koliko je sati?", ["nema_zakona"]),
+    ("Koja su prava zaposlenih na bolovanje?", ["zakon_o_radu"]),
+]
+TEST_QUERIES_EN = [
+    (
+        "Can I ask for alimony if I get divorced?",
+        ["porodicni_zakon"],
+    ),
+    (
+        "How can I protect my data online?",
+        ["zakon_o_zastiti_podataka_o_licnosti"],
+        # ["zakon_o_zastiti_podataka_o_licnosti", "zakon_o_zastiti_potrosaca"],
+    ),
+    (
+        "What are my rights as a consumer and data subject when shopping online?",
+        ["zakon_o_zastiti_potrosaca", "zakon_o_zastiti_podataka_o_licnosti"],
+    ),
+    ("What time is it?", ["nema_zakona"]),
+    ("What are the rights of employees on medical leave?", ["zakon_o_radu"]),
+]
+
 
 class RouterTest(unittest.TestCase):
 
@@ -21,40 +61,8 @@ class RouterTest(unittest.TestCase):
         self.openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
 
         # Define test cases for both Serbian and English queries
-        self.test_queries_sr = [
-            (
-                "Da li mogu da tražim alimentaciju ako se razvedem?",
-                ["porodicni_zakon"],
-            ),
-            (
-                "Kako da zaštitim svoje podatke na internetu?",
-                ["zakon_o_zastiti_podataka_o_licnosti"],
-                # ["zakon_o_zastiti_podataka_o_licnosti", "zakon_o_zastiti_potrosaca"],
-            ),
-            (
-                "Šta su moja prava kao potrošača i lica na koje se podaci odnose kada kupujem online?",
-                ["zakon_o_zastiti_potrosaca", "zakon_o_zastiti_podataka_o_licnosti"],
-            ),
-            ("Koliko je sati?", ["nema_zakona"]),
-            ("Koja su prava zaposlenih na bolovanje?", ["zakon_o_radu"]),
-        ]
-        self.test_queries_en = [
-            (
-                "Can I ask for alimony if I get divorced?",
-                ["porodicni_zakon"],
-            ),
-            (
-                "How can I protect my data online?",
-                ["zakon_o_zastiti_podataka_o_licnosti"],
-                # ["zakon_o_zastiti_podataka_o_licnosti", "zakon_o_zastiti_potrosaca"],
-            ),
-            (
-                "What are my rights as a consumer and data subject when shopping online?",
-                ["zakon_o_zastiti_potrosaca", "zakon_o_zastiti_podataka_o_licnosti"],
-            ),
-            ("What time is it?", ["nema_zakona"]),
-            ("What are the rights of employees on medical leave?", ["zakon_o_radu"]),
-        ]
+        self.test_queries_sr = TEST_QUERIES_SR
+        self.test_queries_en = TEST_QUERIES_EN
 
     def test_semantic_query_router_sr(self) -> None:
         """Test Serbian queries against the router."""
@@ -84,5 +92,111 @@ class RouterTest(unittest.TestCase):
         )
 
 
+class CentroidRouterTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.router = CentroidRouter(
+            collections=["zakon_o_radu", "porodicni_zakon", "zakon_o_zastiti_potrosaca"],
+            centroids=np.array(
+                [[1.0, 0.0, 0.0], [0.9, 0.1, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+            ),
+            owners=np.array([0, 0, 1, 2]),
+            min_similarity=0.5,
+            margin=0.05,
+            min_confidence=0.1,
+        )
+
+    def test_single_collection(self) -> None:
+        decision = self.router.route([0.95, 0.2, 0.1])
+        self.assertEqual(decision.collections, ["zakon_o_radu"])
+        self.assertTrue(decision.confident)
+
+    def test_multiple_collections(self) -> None:
+        decision = self.router.route([0.0, 1.0, 1.0])
+        self.assertEqual(
+            sorted(decision.collections),
+            ["porodicni_zakon", "zakon_o_zastiti_potrosaca"],
+        )
+        self.assertTrue(decision.confident)
+
+    def test_low_confidence(self) -> None:
+        # Ambiguous between two collections and off-topic queries fall back to the LLM
+        self.assertFalse(self.router.route([0.0, 1.0, 0.9]).confident)
+        self.assertFalse(self.router.route([-1.0, -1.0, -1.0]).confident)
+
+    def test_routing_agreement(self) -> None:
+        agreement = routing_agreement(
+            [["zakon_o_radu"], ["porodicni_zakon", "zakon_o_radu"]],
+            [["zakon_o_radu"], ["porodicni_zakon"]],
+        )
+        self.assertEqual(agreement, {"exact_match": 0.5, "jaccard": 0.75})
+        self.assertEqual(
+            routing_agreement([], []), {"exact_match": 0.0, "jaccard": 0.0}
+        )
+
+
+@unittest.skipUnless(
+    "QDRANT_CLUSTER_URL" in os.environ, "Centroids are built from the Qdrant cluster."
+)
+class CentroidRouterAgreementTest(unittest.TestCase):
+    """Report how often the local router agrees with the LLM router."""
+
+    def setUp(self) -> None:
+        self.config = load_config(yaml_file_path=Path("./config.yaml"))
+        self.openai_client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
+        self.qdrant_client = QdrantClient(
+            url=os.environ["QDRANT_CLUSTER_URL"],
+            api_key=os.environ["QDRANT_API_KEY"],
+        )
+        local_config = self.config.openai.router.local
+        self.router = CentroidRouter.from_qdrant(
+            client=self.qdrant_client,
+            collections=[
+                "zakon_o_radu",
+                "zakon_o_porezu_na_dohodak_gradjana",
+                "zakon_o_zastiti_podataka_o_licnosti",
+                "zakon_o_zastiti_potrosaca",
+                "porodicni_zakon",
+            ],
+            min_similarity=local_config.min_similarity,
+            margin=local_config.margin,
+            min_confidence=local_config.min_confidence,
+        )
+
+    def test_agreement_with_llm_router(self) -> None:
+        queries = [query for query, _ in TEST_QUERIES_SR + TEST_QUERIES_EN]
+        response = self.openai_client.embeddings.create(
+            input=queries, model=self.config.openai.embeddings.model
+        )
+        decisions = self.router.route_batch(
+            np.array([item.embedding for item in response.data])
+        )
+        llm_collections = [
+            semantic_query_router(
+                client=self.openai_client,
+                query=query,
+                prompt=ROUTER_PROMPT,
+                model=self.config.openai.router.model,
+                temperature=self.config.openai.router.temperature,
+            )
+            for query in queries
+        ]
+        confident = [i for i, decision in enumerate(decisions) if decision.confident]
+
+        all_agreement = routing_agreement(
+            [decision.collections for decision in decisions], llm_collections
+        )
+        confident_agreement = routing_agreement(
+            [decisions[i].collections for i in confident],
+            [llm_collections[i] for i in confident],
+        )
+        logger.info(
+            f"Local router confident on {len(confident)}/{len(queries)} queries. "
+            f"Agreement with the LLM router - all: {all_agreement}, "
+            f"confident only: {confident_agreement}"
+        )
+        self.assertEqual(len(decisions), len(queries))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,184 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from bs4 import BeautifulSoup
+
+from scraper.scraper import main, run_scraper, run_scraper_lxml
+
+FIXTURE_PATH = Path(__file__).parent / "fixtures" / "law_page.html"
+
+LAW_PAGE = """
+<html><body>
+<p class="clan"><a name="clan1"></a>Član 1</p>
+<p class="normal">Ovim zakonom uređuju se prava.</p>
+<p class="clan"><a name="clan2"></a>Član 2</p>
+<p class="normal">Odredbe ovog zakona primenjuju se.</p>
+</body></html>
+"""
+
+
+class LawPageHandler(BaseHTTPRequestHandler):
+    """Serves the same law page under every path, with an ETag."""
+
+    etag = '"v1"'
+    requests = []  # (path, If-None-Match header) of every request
+    concurrent_requests = 0
+    peak_concurrent_requests = 0
+    lock = threading.Lock()
+
+    def do_GET(self) -> None:
+        cls = type(self)
+        with cls.lock:
+            cls.requests.append((self.path, self.headers.get("If-None-Match")))
+            cls.concurrent_requests += 1
+            cls.peak_concurrent_requests = max(
+                cls.peak_concurrent_requests, cls.concurrent_requests
+            )
+        time.sleep(0.05)
+        with cls.lock:
+            cls.concurrent_requests -= 1
+
+        if self.headers.get("If-None-Match") == cls.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = LAW_PAGE.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", cls.etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class ScraperTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        LawPageHandler.requests = []
+        LawPageHandler.peak_concurrent_requests = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), LawPageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        port = self.server.server_address[1]
+        self.urls = [
+            f"http://127.0.0.1:{port}/propisi/zakon_{i}.html" for i in range(6)
+        ]
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = Path(self.temp_dir.name) / "laws"
+        self.cache_path = Path(self.temp_dir.name) / "http_cache.json"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def scrape(self, parser: str = "bs4") -> None:
+        main(
+            urls=self.urls,
+            output_dir=self.output_dir,
+            workers=4,
+            per_host=2,
+            timeout=5.0,
+            cache_path=self.cache_path,
+            parser=parser,
+        )
+
+    def test_concurrent_scrape_respects_the_host_limit(self) -> None:
+        self.scrape()
+
+        self.assertEqual(len(LawPageHandler.requests), 6)
+        self.assertLessEqual(LawPageHandler.peak_concurrent_requests, 2)
+        # Only the laws are in the output directory, no temp files
+        self.assertEqual(
+            sorted(path.name for path in self.output_dir.iterdir()),
+            [f"zakon_{i}.json" for i in range(6)],
+        )
+        with open(self.output_dir / "zakon_0.json", "r", encoding="utf-8") as file:
+            articles = json.load(file)
+        self.assertEqual(
+            [article["title"] for article in articles], ["Član 1", "Član 2"]
+        )
+        self.assertEqual(articles[0]["link"], f"{self.urls[0]}#clan1")
+
+    def test_unchanged_pages_are_not_scraped_again(self) -> None:
+        self.scrape()
+        saved_path = self.output_dir / "zakon_0.json"
+        modified_time = saved_path.stat().st_mtime_ns
+        missing_path = self.output_dir / "zakon_1.json"
+        missing_path.unlink()
+        LawPageHandler.requests = []
+
+        self.scrape()
+
+        # Every page is revalidated, only the one without a saved file is downloaded
+        validated = dict(LawPageHandler.requests)
+        self.assertEqual(validated["/propisi/zakon_0.html"], '"v1"')
+        self.assertIsNone(validated["/propisi/zakon_1.html"])
+        self.assertEqual(saved_path.stat().st_mtime_ns, modified_time)
+        self.assertTrue(missing_path.exists())
+
+    def test_parsers_save_the_same_articles(self) -> None:
+        saved = {}
+        for parser in ["bs4", "lxml"]:
+            self.output_dir = Path(self.temp_dir.name) / parser
+            self.scrape(parser=parser)
+            with open(self.output_dir / "zakon_0.json", "r", encoding="utf-8") as file:
+                saved[parser] = json.load(file)
+        self.assertEqual(saved["lxml"], saved["bs4"])
+
+
+class StreamingParserTests(unittest.TestCase):
+
+    url = "https://www.paragraf.rs/propisi/zakon.html"
+
+    def assert_same_articles(self, html: bytes) -> None:
+        expected = run_scraper(BeautifulSoup(html, "lxml"), url=self.url)
+        self.assertEqual(run_scraper_lxml(html, url=self.url), expected)
+
+    def test_fixture(self) -> None:
+        html = FIXTURE_PATH.read_bytes()
+        self.assert_same_articles(html)
+
+        articles = run_scraper_lxml(FIXTURE_PATH, url=self.url)
+        self.assertEqual(
+            [article["title"] for article in articles],
+            ["Član 1", "Član 2", "Član 3", "Član 4vrh", "Član 5", "Član 7"],
+        )
+        self.assertEqual(articles[0]["link"], f"{self.url}#clan_1")
+
+    def test_page_without_declared_encoding(self) -> None:
+        html = FIXTURE_PATH.read_bytes().replace(
+            b'<meta http-equiv="Content-Type" content="text/html; charset=utf-8" />',
+            b"",
+        )
+        self.assert_same_articles(html)
+
+    def test_declared_encoding(self) -> None:
+        html = FIXTURE_PATH.read_text(encoding="utf-8")
+        html = html.replace("charset=utf-8", "charset=windows-1250")
+        self.assert_same_articles(html.encode("cp1250", errors="replace"))
+
+    def test_nested_paragraphs(self) -> None:
+        self.assert_same_articles(
+            b'<html><body><p class="clan"><a name="a"></a>A<div>'
+            b'<p class="normal">in</p></div>tail</p><p>x<table><tr><td>'
+            b'<p class="clan">B</p><p>y</p></td></tr></table>z</p>'
+            b'<p class="normal">w</p></body></html>'
+        )
+
+    def test_unclosed_paragraphs(self) -> None:
+        self.assert_same_articles(
+            b'<p class="clan">A<p>b<p class="clan"><a name=n>C</a><p>d'
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
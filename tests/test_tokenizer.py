@@ -0,0 +1,79 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from database.tokenizer import (
+    add_token_counts,
+    get_encoding_by_name,
+    num_tokens_consumed_from_request,
+    num_tokens_from_strings,
+)
+
+
+def encoding_available() -> bool:
+    try:
+        get_encoding_by_name("cl100k_base")
+    except Exception:
+        return False
+    return True
+
+
+class AddTokenCountsTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.requests_filepath = Path(self.temp_dir.name) / "requests.jsonl"
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def write_requests(self, requests) -> None:
+        with open(self.requests_filepath, "w", encoding="utf-8") as file:
+            for request in requests:
+                file.write(json.dumps(request) + "\n")
+
+    def read_requests(self):
+        with open(self.requests_filepath, "r", encoding="utf-8") as file:
+            return [json.loads(line) for line in file]
+
+    def test_counted_requests_are_kept_in_order(self) -> None:
+        requests = [
+            {"model": "m", "input": [f"text {i}"], "token_consumption": i}
+            for i in range(7)
+        ]
+        self.write_requests(requests)
+
+        for processes in [1, 2]:
+            add_token_counts(self.requests_filepath, processes=processes, chunk_size=2)
+            self.assertEqual(self.read_requests(), requests)
+
+    @unittest.skipUnless(encoding_available(), "The cl100k_base encoding is needed.")
+    def test_counts_match_the_processor(self) -> None:
+        requests = [
+            {"model": "m", "input": ["Član 1: tekst", "Član 2: drugi tekst"]},
+            {"model": "m", "input": "jedan tekst", "metadata": {"id": 3}},
+        ]
+        self.write_requests(requests)
+
+        add_token_counts(self.requests_filepath, processes=2, chunk_size=1)
+
+        for request, counted in zip(requests, self.read_requests()):
+            self.assertEqual(
+                counted.pop("token_consumption"),
+                num_tokens_consumed_from_request(request, "embeddings", "cl100k_base"),
+            )
+            self.assertEqual(counted, request)
+
+    @unittest.skipUnless(encoding_available(), "The cl100k_base encoding is needed.")
+    def test_batch_counts_match_single_counts(self) -> None:
+        encoding = get_encoding_by_name("cl100k_base")
+        texts = ["Član 1: tekst", "", "Zakon o radu " * 50]
+        self.assertEqual(
+            num_tokens_from_strings(texts, encoding),
+            [len(encoding.encode(text)) for text in texts],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import argparse
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Dict, List
+from unittest.mock import patch
+
+from qdrant_client.http.models import PointStruct
+
+from database.backends import NumpyBackend
+from database.vector_database import index_incrementally, main, upsert_in_batches
+
+
+class RecordingBackend(NumpyBackend):
+    """Records the first point id of every upserted batch and fails on `fail_ids`."""
+
+    def __init__(self, path: Path) -> None:
+        super().__init__(path=path)
+        self.fail_ids = set()
+        self.upserted: List[int] = []
+
+    def upsert(self, collection: str, points: List[PointStruct]) -> None:
+        if self.fail_ids & {point.id for point in points}:
+            raise ConnectionError("Upsert failed.")
+        self.upserted.append(points[0].id)
+        super().upsert(collection=collection, points=points)
+
+
+def count_words(strings: List[str], encoding) -> List[int]:
+    """Stands in for the tokenizer, whose encodings are downloaded on first use."""
+    return [len(string.split()) for string in strings]
+
+
+def embed_requests(request_files: Dict[Path, Path]) -> None:
+    """Stands in for the request processor, article `Član i` is embedded as axis i."""
+    for requests_path, results_path in request_files.items():
+        with open(requests_path, "r", encoding="utf-8") as requests_file, open(
+            results_path, "w", encoding="utf-8"
+        ) as results_file:
+            for line in requests_file:
+                request = json.loads(line)
+                data = []
+                for index, article in enumerate(request["metadata"]["articles"]):
+                    embedding = [0.0] * 4
+                    embedding[int(article["title"].split()[-1])] = 1.0
+                    data.append({"index": index, "embedding": embedding})
+                results_file.write(
+                    json.dumps([request, {"data": data}, request["metadata"]]) + "\n"
+                )
+
+
+# The retries of a failed batch would otherwise back off for several seconds
+@patch("backoff._sync.time.sleep", lambda seconds: None)
+class UpsertCheckpointTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.backend = RecordingBackend(path=Path(self.temp_dir.name) / "index")
+        self.checkpoint_path = Path(self.temp_dir.name) / "checkpoints" / "zakon.json"
+        self.points = [
+            PointStruct(id=i, vector=[1.0, float(i)], payload={"text": f"Član {i}"})
+            for i in range(10)
+        ]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def upsert(self, source: str = "v1", batch_size: int = 3) -> int:
+        batches = [
+            self.points[start : start + batch_size]
+            for start in range(0, len(self.points), batch_size)
+        ]
+        return upsert_in_batches(
+            backend=self.backend,
+            collection="zakon",
+            batches=batches,
+            checkpoint_path=self.checkpoint_path,
+            source=source,
+            batch_size=batch_size,
+        )
+
+    def fail_second_batch(self) -> None:
+        self.backend.fail_ids = {3}
+        with self.assertRaises(RuntimeError):
+            self.upsert()
+        self.backend.fail_ids = set()
+        self.backend.upserted = []
+
+    def test_failed_batch_is_left_out_of_the_checkpoint(self) -> None:
+        self.fail_second_batch()
+
+        with open(self.checkpoint_path, "r", encoding="utf-8") as file:
+            checkpoint = json.load(file)
+        self.assertEqual(sorted(checkpoint["done"]), [0, 2, 3])
+        self.assertEqual(self.backend.count("zakon"), 7)
+
+    def test_rerun_upserts_only_the_missing_batches(self) -> None:
+        self.fail_second_batch()
+
+        self.assertEqual(self.upsert(), 10)
+
+        self.assertEqual(self.backend.upserted, [3])
+        self.assertFalse(self.checkpoint_path.exists())
+
+    def test_changed_source_recreates_the_collection(self) -> None:
+        self.fail_second_batch()
+        self.points = self.points[:8]
+
+        self.assertEqual(self.upsert(source="v2"), 8)
+
+        self.assertEqual(sorted(self.backend.upserted), [0, 3, 6])
+
+    def test_changed_batch_size_recreates_the_collection(self) -> None:
+        self.fail_second_batch()
+
+        self.assertEqual(self.upsert(batch_size=4), 10)
+
+        self.assertEqual(sorted(self.backend.upserted), [0, 4, 8])
+
+    def test_completed_upsert_starts_over(self) -> None:
+        self.upsert()
+        self.backend.upserted = []
+
+        self.assertEqual(self.upsert(), 10)
+
+        self.assertEqual(sorted(self.backend.upserted), [0, 3, 6, 9])
+
+
+@patch("database.utils.get_encoding", lambda model: None)
+@patch("database.utils.num_tokens_from_strings", count_words)
+@patch("database.vector_database.run_api_request_processor", embed_requests)
+class IndexIncrementallyTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.dir = Path(self.temp_dir.name)
+        (self.dir / "to_process").mkdir()
+        self.scraped_path = self.dir / "zakon.json"
+        self.articles = [
+            {"title": f"Član {i}", "link": f"zakon#clan_{i}", "texts": [f"tekst {i}"]}
+            for i in range(4)
+        ]
+        # The app reads the index while the indexer writes it in another process
+        self.app_backend = NumpyBackend(path=self.dir / "index")
+        self.indexer_backend = NumpyBackend(path=self.dir / "index")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def index(self) -> Dict[str, int]:
+        with open(self.scraped_path, "w", encoding="utf-8") as file:
+            json.dump(self.articles, file)
+        return index_incrementally(
+            backend=self.indexer_backend,
+            scraped_path=self.scraped_path,
+            manifest_path=self.dir / "manifests" / "zakon.json",
+            to_process_dir=self.dir / "to_process",
+            checkpoint_dir=self.dir / "checkpoints",
+            model="text-embedding-3-small",
+        )
+
+    def search(self, axis: int):
+        query_vector = [0.0] * 4
+        query_vector[axis] = 1.0
+        return self.app_backend.search("zakon", query_vector=query_vector, limit=1)
+
+    def test_app_sees_the_incremental_update_of_the_live_collection(self) -> None:
+        self.index()
+        self.assertEqual(self.app_backend.count("zakon"), 4)
+        self.assertEqual(self.search(2)[0].payload["text"], "Član 2: tekst 2")
+
+        self.articles[2]["texts"] = ["izmenjen tekst"]
+        del self.articles[3]
+        stats = self.index()
+
+        self.assertEqual((stats["changed"], stats["removed"]), (1, 1))
+        self.assertEqual(self.app_backend.count("zakon"), 3)
+        self.assertEqual(self.search(2)[0].payload["text"], "Član 2: izmenjen tekst")
+        self.assertEqual(self.search(1)[0].payload["text"], "Član 1: tekst 1")
+
+    def test_incremental_run_after_a_rollback_rebuilds(self) -> None:
+        self.index()
+        # A full build removes the manifest, so the changed law is rebuilt as well
+        (self.dir / "manifests" / "zakon.json").unlink()
+        self.articles[2]["texts"] = ["izmenjen tekst"]
+        self.index()
+
+        main(
+            argparse.Namespace(
+                backend="numpy",
+                index_dir=self.dir / "index",
+                rollback=["zakon"],
+                manifest_dir=self.dir / "manifests",
+                response_cache_path=self.dir / "response_cache.sqlite",
+            )
+        )
+        self.assertEqual(self.search(2)[0].payload["text"], "Član 2: tekst 2")
+
+        stats = self.index()
+
+        self.assertEqual(stats["changed"], 4)
+        self.assertEqual(self.search(2)[0].payload["text"], "Član 2: izmenjen tekst")
+
+
+if __name__ == "__main__":
+    unittest.main()
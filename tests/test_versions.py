@@ -0,0 +1,75 @@
+import tempfile
+import unittest
+
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import PointStruct
+
+from database.backends import NumpyBackend, QdrantBackend
+from database.versions import build_target, list_versions, publish_version, rollback
+
+
+class VersionsTests(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.alias = "zakon_o_radu"
+        self.backends = [
+            NumpyBackend(path=self.temp_dir.name),
+            QdrantBackend(client=QdrantClient(":memory:"), local=True),
+        ]
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def build(self, backend, num_points: int) -> str:
+        collection = build_target(backend, self.alias)
+        backend.create_collection(name=collection, vector_size=2)
+        backend.upsert(
+            collection=collection,
+            points=[
+                PointStruct(id=i, vector=[1.0, float(i)], payload={})
+                for i in range(num_points)
+            ],
+        )
+        return collection
+
+    def test_publish_switches_alias_and_keeps_previous_version(self) -> None:
+        for backend in self.backends:
+            for num_points in [1, 2, 3]:
+                collection = self.build(backend, num_points)
+                publish_version(backend, self.alias, collection, num_points)
+                self.assertEqual(backend.count(self.alias), num_points)
+            self.assertEqual(
+                list_versions(backend, self.alias),
+                [(2, "zakon_o_radu_v2"), (3, "zakon_o_radu_v3")],
+            )
+
+    def test_incomplete_version_is_not_published(self) -> None:
+        for backend in self.backends:
+            publish_version(backend, self.alias, self.build(backend, 2), 2)
+            collection = self.build(backend, 1)
+            with self.assertRaises(RuntimeError):
+                publish_version(backend, self.alias, collection, 2)
+            self.assertEqual(backend.get_alias(self.alias), "zakon_o_radu_v1")
+            # The unpublished version is reused by the next build
+            self.assertEqual(build_target(backend, self.alias), collection)
+
+    def test_rollback(self) -> None:
+        for backend in self.backends:
+            publish_version(backend, self.alias, self.build(backend, 2), 2)
+            publish_version(backend, self.alias, self.build(backend, 3), 3)
+            self.assertEqual(rollback(backend, self.alias), "zakon_o_radu_v1")
+            self.assertEqual(backend.count(self.alias), 2)
+            with self.assertRaises(ValueError):
+                rollback(backend, self.alias)
+
+    def test_unversioned_collection_is_replaced(self) -> None:
+        for backend in self.backends:
+            backend.create_collection(name=self.alias, vector_size=2)
+            publish_version(backend, self.alias, self.build(backend, 2), 2)
+            self.assertEqual(backend.list_collections(), ["zakon_o_radu_v1"])
+            self.assertEqual(backend.count(self.alias), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
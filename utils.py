@@ -1,6 +1,9 @@
+import contextvars
 import json
 import os
-from typing import Dict, Generator, List
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generator, List, Literal, Optional, Tuple
 
 import streamlit as st
 import yaml
@@ -11,9 +14,21 @@ from openai.types.chat import ChatCompletion
 from pydantic import BaseModel
 from qdrant_client import QdrantClient
 
-from database.utils import embed_text, get_context, search
-from llm.prompts import DEFAULT_CONTEXT
-from llm.utils import formate_messages_chat
+from database.backends import NumpyBackend, QdrantBackend, RetrievalBackend
+from database.embedding_cache import EmbeddingCache
+from database.tokenizer import num_tokens_from_string
+from database.utils import embed_text, get_context, mmr_rerank
+from llm.prompts import (
+    CONTEXT_PROMPT,
+    CONVERSATION_PROMPT,
+    DEFAULT_CONTEXT,
+    QUERY_PROMPT,
+    SYSTEM_PROMPT,
+)
+from llm.history import ConversationHistory
+from llm.response_cache import ResponseCache, prompt_version_hash, replay_answer
+from llm.utils import formate_messages_chat, formate_messages_summary
+from router.centroid_router import CentroidRouter
 from router.query_router import formate_messages_router
 from router.router_prompt import DEFAULT_ROUTER_RESPONSE
 
@@ -41,20 +56,43 @@ AUTHORS = """
 """
 
 
+class LocalRouterConfig(BaseModel):
+    enabled: bool = False
+    path: str = "./router/centroids.npz"
+    min_similarity: float = 0.3
+    margin: float = 0.03
+    min_confidence: float = 0.02
+
+
 class RouterConfig(BaseModel):
     model: str
     temperature: float
+    local: LocalRouterConfig = LocalRouterConfig()
+
+
+class HistoryConfig(BaseModel):
+    max_tokens: int = 2_000
+    summary_model: str = "gpt-3.5-turbo"
+    summary_temperature: float = 0
 
 
 class ChatConfig(BaseModel):
     model: str
     temperature: float
     max_conversation: int
+    history: HistoryConfig = HistoryConfig()
+
+
+class EmbeddingCacheConfig(BaseModel):
+    max_size: int = 1024
+    path: Optional[str] = None
+    max_disk_size: int = 100_000
 
 
 class EmbeddingsConfig(BaseModel):
     model: str
     dimensions: int
+    cache: EmbeddingCacheConfig = EmbeddingCacheConfig()
 
 
 class OpenAIConfig(BaseModel):
@@ -63,8 +101,43 @@ class OpenAIConfig(BaseModel):
     router: RouterConfig
 
 
+class ResponseCacheConfig(BaseModel):
+    enabled: bool = True
+    path: str = "./database/cache/responses.sqlite"
+    similarity_threshold: float = 0.95
+    ttl_seconds: float = 7 * 24 * 3600
+    max_size: int = 10_000
+    replay_chunk_size: int = 8
+
+
+class MMRConfig(BaseModel):
+    enabled: bool = True
+    lambda_mult: float = 0.7
+    # Articles MMR selects, `context.max_articles` if not set. The token budget and
+    # score gap cut the selection in MMR order, so near-duplicates are cut first.
+    top_k: Optional[int] = None
+
+
+class ContextConfig(BaseModel):
+    max_prompt_tokens: int = 12_000
+    min_context_tokens: int = 1_000
+    search_limit: int = 10
+    max_articles: int = 15
+    score_gap: Optional[float] = 0.1
+    min_articles: int = 2
+    mmr: MMRConfig = MMRConfig()
+
+
+class RetrievalConfig(BaseModel):
+    backend: Literal["qdrant", "numpy"] = "qdrant"
+    path: str = "./database/index"
+
+
 class Config(BaseModel):
     openai: OpenAIConfig
+    retrieval: RetrievalConfig = RetrievalConfig()
+    context: ContextConfig = ContextConfig()
+    response_cache: ResponseCacheConfig = ResponseCacheConfig()
 
 
 def load_config(yaml_file_path: str = "./config.yaml") -> Config:
@@ -97,6 +170,89 @@ def initialize_clients() -> QdrantClient:
         raise EnvironmentError(error_msg)
 
 
+@st.cache_resource
+def initialize_backend(backend: str, path: str) -> RetrievalBackend:
+    """
+    Initializes the retrieval backend selected in the configuration.
+
+    Args:
+    - backend (str): "qdrant" for the Qdrant cluster or "numpy" for the in-process index.
+    - path (str): Directory of the in-process index, used only by the "numpy" backend.
+
+    Returns:
+    - RetrievalBackend: The initialized backend.
+    """
+    if backend == "numpy":
+        logger.info(f'Using the in-process retrieval index at "{path}".')
+        return NumpyBackend(path=path)
+    return QdrantBackend(client=initialize_clients())
+
+
+@st.cache_resource
+def initialize_embedding_cache(
+    max_size: int, path: Optional[str], max_disk_size: int
+) -> EmbeddingCache:
+    """
+    Initializes the query embedding cache once per server process.
+
+    Streamlit keeps cached resources outside of `st.session_state`, so every session
+    shares the same cache and its hit/miss counters.
+    """
+    return EmbeddingCache(max_size=max_size, path=path, max_disk_size=max_disk_size)
+
+
+@st.cache_resource
+def initialize_response_cache(
+    path: str, similarity_threshold: float, ttl_seconds: float, max_size: int
+) -> ResponseCache:
+    """Initializes the semantic response cache once per server process."""
+    return ResponseCache(
+        path=path,
+        similarity_threshold=similarity_threshold,
+        ttl_seconds=ttl_seconds,
+        max_size=max_size,
+    )
+
+
+@st.cache_resource
+def initialize_local_router(
+    path: str, min_similarity: float, margin: float, min_confidence: float
+) -> Optional[CentroidRouter]:
+    """Loads the centroid router, or returns None if the centroids were not built."""
+    if not os.path.exists(path):
+        logger.warning(f'Local router centroids not found at "{path}".')
+        return None
+    return CentroidRouter.load(
+        path=path,
+        min_similarity=min_similarity,
+        margin=margin,
+        min_confidence=min_confidence,
+    )
+
+
+def get_prompt_version(config: Config) -> str:
+    """
+    Version of everything besides the query that shapes an answer.
+
+    The context settings are included, as they decide which articles an answer is
+    built from.
+    """
+    return prompt_version_hash(
+        SYSTEM_PROMPT,
+        CONVERSATION_PROMPT,
+        CONTEXT_PROMPT,
+        QUERY_PROMPT,
+        config.openai.chat.model,
+        str(config.openai.chat.temperature),
+        config.context.model_dump_json(),
+    )
+
+
+def is_first_question(messages: List[Dict]) -> bool:
+    """Check that the latest user message is the first one in the conversation."""
+    return not any(message["role"] == "user" for message in messages[:-1])
+
+
 @observe(as_type="generation")
 def call_llm(
     model: str,
@@ -128,50 +284,90 @@ def call_llm(
 
 @observe()
 def generate_response(
-    query: str, qdrant_client: QdrantClient, config: Config
+    query: str, retrieval_backend: RetrievalBackend, config: Config
 ) -> Generator[str, None, None]:
     """
     Generates a response for a given user query using a combination of semantic search and a chat model.
 
     Args:
     - query (str): The user's query string.
-    - qdrant_client (QdrantClient): Client to interact with Qdrant's API.
+    - retrieval_backend (RetrievalBackend): Backend used to search the law articles.
     - config (Config): Configuration settings for API interaction and response handling.
 
     Yields:
     - str: Parts of the generated response from the chat model.
     """
+    start_time = time.perf_counter()
     try:
         # Limit the stored messages to the maximum conversation length defined in the configuration
+        history = get_conversation_history()
+        history.forget(
+            len(st.session_state.messages) - config.openai.chat.max_conversation
+        )
         st.session_state.messages = st.session_state.messages[
             -config.openai.chat.max_conversation :
         ]
 
-        # Determine the relevant collections to route the query to
-        messages = formate_messages_router(query)
-        response = call_llm(
-            model=config.openai.router.model,
-            temperature=config.openai.router.temperature,
-            messages=messages,
-            json_response=True,
-        )
-        collections = json.loads(response.choices[0].message.content)["response"]
-        logger.info(f"Query routed to collections: {collections}")
+        # Route and embed the query concurrently
+        collections, embedding, timings = route_and_embed(query=query, config=config)
         langfuse_context.update_current_trace(tags=collections)
 
-        # Embed the user query using the specified model in the configuration
-        embedding_response = embed_text(
-            text=query,
-            model=config.openai.embeddings.model,
+        # Answers depend on the conversation, so only opening questions are cached
+        response_cache = None
+        cache_config = config.response_cache
+        if cache_config.enabled and is_first_question(st.session_state.messages):
+            response_cache = initialize_response_cache(
+                path=cache_config.path,
+                similarity_threshold=cache_config.similarity_threshold,
+                ttl_seconds=cache_config.ttl_seconds,
+                max_size=cache_config.max_size,
+            )
+            prompt_version = get_prompt_version(config)
+            answer = response_cache.get(
+                embedding=embedding,
+                collections=collections,
+                prompt_version=prompt_version,
+            )
+            if answer is not None:
+                langfuse_context.update_current_trace(
+                    tags=collections + ["response_cache_hit"]
+                )
+                _report_timings(timings, start_time)
+                yield from replay_answer(
+                    answer, chunk_size=cache_config.replay_chunk_size
+                )
+                langfuse_context.flush()
+                return
+
+        # Keep recent turns verbatim and fold older ones into the summary
+        conversation, timings["history"] = _timed(
+            history.render,
+            messages=st.session_state.messages[:-1],
+            token_budget=config.openai.chat.history.max_tokens,
+            count_tokens=lambda text: num_tokens_from_string(
+                text, model=config.openai.chat.model
+            ),
+            summarize=lambda summary, turns: summarize_conversation(
+                summary=summary, conversation=turns, config=config
+            ),
         )
-        embedding = embedding_response.data[0].embedding
 
         # Determine the context for the chat model based on the routed collections
-        context = determine_context(collections, embedding, qdrant_client)
+        token_budget = get_context_budget(
+            query=query, conversation=conversation, config=config
+        )
+        context, timings["search"] = _timed(
+            determine_context,
+            collections,
+            embedding,
+            retrieval_backend,
+            config,
+            token_budget,
+        )
 
         # Generate the response stream from the chat model
         messages = formate_messages_chat(
-            context=context, query=query, conversation=st.session_state.messages
+            context=context, query=query, conversation=conversation
         )
         stream = call_llm(
             model=config.openai.chat.model,
@@ -181,11 +377,26 @@ def generate_response(
         )
 
         # Yield each part of the response as it becomes available
+        parts = []
         for chunk in stream:
             part = chunk.choices[0].delta.content
             if part is not None:
+                if not parts:
+                    _report_timings(timings, start_time)
+                parts.append(part)
                 yield part
 
+        # Do not cache answers generated without context because of a search error
+        if response_cache is not None and (
+            context != DEFAULT_CONTEXT or collections[0] == DEFAULT_ROUTER_RESPONSE
+        ):
+            response_cache.put(
+                embedding=embedding,
+                collections=collections,
+                prompt_version=prompt_version,
+                answer="".join(parts),
+            )
+
         langfuse_context.flush()
 
     except Exception as e:
@@ -193,28 +404,204 @@ def generate_response(
         yield "Sorry, an error occurred while processing your request."
 
 
+def get_conversation_history() -> ConversationHistory:
+    """Returns the conversation history of the current session."""
+    if "history" not in st.session_state:
+        st.session_state.history = ConversationHistory()
+    return st.session_state.history
+
+
+def summarize_conversation(summary: str, conversation: str, config: Config) -> str:
+    """Fold older conversation turns into the running summary."""
+    response = call_llm(
+        model=config.openai.chat.history.summary_model,
+        temperature=config.openai.chat.history.summary_temperature,
+        messages=formate_messages_summary(summary=summary, conversation=conversation),
+    )
+    return response.choices[0].message.content
+
+
+def route_query(query: str, config: Config) -> List[str]:
+    """Ask the router model which collections are relevant for the query."""
+    messages = formate_messages_router(query)
+    response = call_llm(
+        model=config.openai.router.model,
+        temperature=config.openai.router.temperature,
+        messages=messages,
+        json_response=True,
+    )
+    return json.loads(response.choices[0].message.content)["response"]
+
+
+def embed_query(query: str, config: Config) -> List[float]:
+    """Embed the user query using the model specified in the configuration."""
+    embeddings_config = config.openai.embeddings
+    cache = initialize_embedding_cache(
+        max_size=embeddings_config.cache.max_size,
+        path=embeddings_config.cache.path,
+        max_disk_size=embeddings_config.cache.max_disk_size,
+    )
+    embedding = cache.get(
+        text=query,
+        model=embeddings_config.model,
+        dimensions=embeddings_config.dimensions,
+    )
+    if embedding is not None:
+        logger.debug(f"Embedding cache hit: {cache.stats()}")
+        return embedding
+
+    embedding_response = embed_text(
+        text=query,
+        model=embeddings_config.model,
+        dimensions=embeddings_config.dimensions,
+    )
+    embedding = embedding_response.data[0].embedding
+    cache.put(
+        text=query,
+        model=embeddings_config.model,
+        dimensions=embeddings_config.dimensions,
+        embedding=embedding,
+    )
+    return embedding
+
+
+def _elapsed_ms(start_time: float) -> float:
+    return round((time.perf_counter() - start_time) * 1000, 1)
+
+
+def _timed(func: Callable, *args, **kwargs) -> Tuple[Any, float]:
+    """Run a function and return its result together with the elapsed time in ms."""
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, _elapsed_ms(start_time)
+
+
+def _report_timings(timings: Dict[str, float], start_time: float) -> None:
+    """Log the stage timings once the first part of the answer is ready."""
+    timings["time_to_first_token"] = _elapsed_ms(start_time)
+    logger.info(f"Response stage timings (ms): {timings}")
+    langfuse_context.update_current_observation(metadata={"timings_ms": timings})
+
+
+def route_and_embed(
+    query: str, config: Config
+) -> Tuple[List[str], List[float], Dict[str, float]]:
+    """
+    Routes and embeds a user query.
+
+    Without the local router, the router call and the query embedding do not depend on
+    each other, so they run concurrently in a small thread pool. With the local router,
+    the query is routed from its embedding and the LLM router is only called when the
+    local decision is not confident.
+
+    Args:
+    - query (str): The user's query string.
+    - config (Config): Configuration settings for API interaction and response handling.
+
+    Returns:
+    - Tuple[List[str], List[float], Dict[str, float]]: The routed collections, the query
+      embedding and the per-stage timings in milliseconds.
+    """
+    timings = {}
+    local_config = config.openai.router.local
+    local_router = (
+        initialize_local_router(
+            path=local_config.path,
+            min_similarity=local_config.min_similarity,
+            margin=local_config.margin,
+            min_confidence=local_config.min_confidence,
+        )
+        if local_config.enabled
+        else None
+    )
+
+    # Each task runs in a copy of the current context so Langfuse nests its observations
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        embedding_future = executor.submit(
+            contextvars.copy_context().run, _timed, embed_query, query, config
+        )
+        if local_router is None:
+            router_future = executor.submit(
+                contextvars.copy_context().run, _timed, route_query, query, config
+            )
+            collections, timings["router"] = router_future.result()
+        embedding, timings["embedding"] = embedding_future.result()
+
+    if local_router is not None:
+        decision, timings["local_router"] = _timed(local_router.route, embedding)
+        if decision.confident:
+            collections = decision.collections
+            logger.info(f"Local router confidence: {decision.confidence:.4f}")
+        else:
+            logger.info(
+                f"Local router not confident ({decision.confidence:.4f}), "
+                "falling back to the LLM router."
+            )
+            collections, timings["router"] = _timed(route_query, query, config)
+
+    logger.info(f"Query routed to collections: {collections}")
+    return collections, embedding, timings
+
+
+def get_context_budget(query: str, conversation: str, config: Config) -> int:
+    """
+    Computes how many tokens are left for the context in the chat model prompt.
+
+    The system prompt, the conversation and the query are counted against
+    `context.max_prompt_tokens`, but the context always gets at least
+    `context.min_context_tokens`.
+    """
+    messages = formate_messages_chat(context="", query=query, conversation=conversation)
+    # Every message carries a few tokens of formatting on top of its content
+    prompt_tokens = sum(
+        num_tokens_from_string(message["content"], model=config.openai.chat.model) + 4
+        for message in messages
+    )
+    token_budget = max(
+        config.context.max_prompt_tokens - prompt_tokens,
+        config.context.min_context_tokens,
+    )
+    logger.info(f"Prompt uses {prompt_tokens} tokens, context budget: {token_budget}")
+    return token_budget
+
+
 def determine_context(
-    collections: List[str], embedding: List[float], qdrant_client: QdrantClient
+    collections: List[str],
+    embedding: List[float],
+    retrieval_backend: RetrievalBackend,
+    config: Config,
+    token_budget: int = None,
 ) -> str:
     """Determines the context for generating responses based on search results from collections."""
     try:
         if collections[0] == DEFAULT_ROUTER_RESPONSE:
             return DEFAULT_CONTEXT
         else:
-            search_results = []
-            for collection_name in collections:
-                search_results.extend(
-                    search(
-                        client=qdrant_client,
-                        collection=collection_name,
-                        query_vector=embedding,
-                        limit=10,
-                        with_vectors=True,
-                    )
+            # Vectors are only needed for MMR, so skip transferring them otherwise
+            mmr_config = config.context.mmr
+            search_results = retrieval_backend.search_collections(
+                collections=collections,
+                query_vector=embedding,
+                limit=config.context.search_limit,
+                with_vectors=mmr_config.enabled,
+            )
+            if mmr_config.enabled:
+                search_results = mmr_rerank(
+                    search_results=search_results,
+                    query_vector=embedding,
+                    top_k=mmr_config.top_k or config.context.max_articles,
+                    lambda_mult=mmr_config.lambda_mult,
                 )
-            # Upgrade this with tokes length checking
-            top_k = 15 if len(collections) > 1 else 10
-            return get_context(search_results=search_results, top_k=top_k)
+            # Pack in MMR selection order, so near-duplicates are not packed first
+            return get_context(
+                search_results=search_results,
+                top_k=config.context.max_articles,
+                token_budget=token_budget,
+                model=config.openai.chat.model,
+                score_gap=config.context.score_gap,
+                min_results=config.context.min_articles,
+                keep_order=mmr_config.enabled,
+            )
     except Exception as e:
         logger.error(f"Error determining context: {str(e)}")
         return DEFAULT_CONTEXT  # Fallback to default context